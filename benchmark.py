@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""
+Benchmark Tool
+Đo hiệu năng các bước của pipeline System K
+"""
+import sys
+import time
+import argparse
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+# Add src to path
+src_path = Path(__file__).parent / 'src'
+sys.path.insert(0, str(src_path))
+
+
+def load_sample_frames(video_path=None, num_frames=64, width=1280, height=720):
+    """
+    Đọc frames mẫu từ video (hoặc tạo frames ngẫu nhiên nếu không có video)
+    
+    Returns:
+        list: Danh sách frames (numpy arrays)
+    """
+    if video_path is None:
+        rng = np.random.default_rng(0)
+        return [rng.integers(0, 255, (height, width, 3), dtype=np.uint8) for _ in range(num_frames)]
+    
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise ValueError(f"Không thể mở video: {video_path}")
+    
+    frames = []
+    try:
+        while len(frames) < num_frames:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            frames.append(frame)
+    finally:
+        cap.release()
+    
+    if not frames:
+        raise ValueError(f"Video không có frame nào: {video_path}")
+    return frames
+
+
+def benchmark_detection_batch(args):
+    """So sánh throughput của detect_vehicles_batch với các batch size khác nhau"""
+    from vehicle_detection import VehicleDetector
+    
+    frames = load_sample_frames(args.video, args.num_frames)
+    detector = VehicleDetector(model_path=args.model, conf_threshold=args.conf)
+    
+    # Warm-up để không tính thời gian khởi tạo model
+    detector.detect_vehicles_batch(frames[:1], batch_size=1)
+    
+    print(f"Frames: {len(frames)}, model: {args.model}")
+    print(f"{'batch':>6} {'time (s)':>10} {'FPS':>8} {'speedup':>8}")
+    
+    baseline_fps = None
+    for batch_size in args.batch_sizes:
+        start = time.perf_counter()
+        detector.detect_vehicles_batch(frames, batch_size=batch_size)
+        elapsed = time.perf_counter() - start
+        
+        fps = len(frames) / elapsed
+        if baseline_fps is None:
+            baseline_fps = fps
+        print(f"{batch_size:>6} {elapsed:>10.3f} {fps:>8.1f} {fps / baseline_fps:>7.2f}x")
+
+
+def benchmark_counting_stride(args):
+    """So sánh kết quả đếm xe khi detect mỗi N frames (tracker dự đoán các frame giữa)"""
+    from utils import load_config
+    from roi_processing import apply_roi_mask
+    from vehicle_detection import VehicleDetector
+    from vehicle_tracking import VehicleTracker
+    from counting import VehicleCounter
+    
+    config = load_config(args.config)
+    if 'counting_line' not in config:
+        raise ValueError(f"Config không có counting_line: {args.config}")
+    
+    frames = load_sample_frames(args.video, args.num_frames)
+    if 'roi' in config:
+        frames = [apply_roi_mask(frame, config['roi']) for frame in frames]
+    
+    # Detect tất cả frames một lần, các stride dùng lại detections của frame được chọn
+    detector = VehicleDetector(model_path=args.model, conf_threshold=args.conf)
+    detector.detect_vehicles_batch(frames[:1], batch_size=1)
+    start = time.perf_counter()
+    detections = detector.detect_vehicles_batch(frames, config.get('vehicle_classes'), batch_size=args.batch_size)
+    detect_ms = (time.perf_counter() - start) * 1000.0 / len(frames)
+    
+    modes = [False, True] if args.optical_flow else [False]
+    print(f"Frames: {len(frames)}, model: {args.model}, detection: {detect_ms:.1f} ms/frame")
+    print(f"{'stride':>6} {'flow':>5} {'detects':>8} {'up':>5} {'down':>5} {'total':>6} {'error':>6} "
+          f"{'track ms/f':>10} {'est. ms/f':>10}")
+    
+    reference_total = args.ground_truth
+    for stride in args.strides:
+        for use_flow in modes:
+            tracker = VehicleTracker(use_optical_flow=use_flow)
+            counter = VehicleCounter(config['counting_line'])
+            
+            start = time.perf_counter()
+            for idx, frame in enumerate(frames):
+                if idx % stride == 0:
+                    tracked_objects = tracker.update(detections[idx], frame)
+                else:
+                    tracked_objects = tracker.predict(frame)
+                counter.count_vehicles(tracked_objects)
+            track_ms = (time.perf_counter() - start) * 1000.0 / len(frames)
+            
+            total = counter.count_up + counter.count_down
+            if reference_total is None:
+                reference_total = total  # Stride đầu tiên (thường là 1) làm chuẩn
+            num_detects = (len(frames) + stride - 1) // stride
+            estimated_ms = track_ms + detect_ms * num_detects / len(frames)
+            print(f"{stride:>6} {'yes' if use_flow else 'no':>5} {num_detects:>8} {counter.count_up:>5} "
+                  f"{counter.count_down:>5} {total:>6} {total - reference_total:>+6} "
+                  f"{track_ms:>10.2f} {estimated_ms:>10.1f}")
+
+
+def simulate_traffic(num_objects, num_frames, width=1920, height=1080, noise=1.5, seed=0):
+    """
+    Sinh detections giả lập: num_objects xe chuyển động thẳng đều, có nhiễu vị trí
+    
+    Returns:
+        tuple: (detections mỗi frame (thứ tự bị xáo trộn), vị trí thật (frames, objects, 2))
+    """
+    rng = np.random.default_rng(seed)
+    start = rng.uniform([100, 100], [width - 100, height - 100], size=(num_objects, 2))
+    velocity = rng.uniform(-12, 12, size=(num_objects, 2))
+    sizes = rng.uniform(20, 60, size=(num_objects, 2))
+    
+    positions = start[None] + velocity[None] * np.arange(num_frames)[:, None, None]
+    all_detections = []
+    for frame_idx in range(num_frames):
+        centers = positions[frame_idx] + rng.normal(0, noise, size=(num_objects, 2))
+        order = rng.permutation(num_objects)
+        all_detections.append([
+            {
+                'bbox': [float(centers[i, 0] - sizes[i, 0] / 2), float(centers[i, 1] - sizes[i, 1] / 2),
+                         float(centers[i, 0] + sizes[i, 0] / 2), float(centers[i, 1] + sizes[i, 1] / 2)],
+                'class': 'car',
+                'confidence': 0.9
+            }
+            for i in order
+        ])
+    return all_detections, positions
+
+
+def benchmark_tracker_association(args):
+    """Thời gian update và số lần đổi ID của tracker theo số xe mỗi frame"""
+    from vehicle_tracking import VehicleTracker, ByteTracker
+    
+    print(f"Frames: {args.num_frames}, max_distance: {args.max_distance}")
+    print(f"{'objects':>8} {'matching':>10} {'ms/frame':>10} {'id switches':>12}")
+    
+    for num_objects in args.objects:
+        all_detections, positions = simulate_traffic(num_objects, args.num_frames)
+        for matching in args.matching:
+            if matching == 'bytetrack':
+                tracker = ByteTracker()
+            else:
+                tracker = VehicleTracker(max_distance=args.max_distance, matching=matching)
+            previous_ids = np.full(num_objects, -1)
+            id_switches = 0
+            elapsed = 0.0
+            
+            for frame_idx, detections in enumerate(all_detections):
+                start = time.perf_counter()
+                tracked_objects = tracker.update(detections)
+                elapsed += time.perf_counter() - start
+                if not tracked_objects:
+                    continue
+                
+                # Gán mỗi track cho xe thật gần nhất để đếm số lần một xe đổi track ID
+                centroids = np.array([obj['centroid'] for obj in tracked_objects])
+                distances = np.linalg.norm(centroids[:, None, :] - positions[frame_idx][None], axis=2)
+                nearest = distances.argmin(axis=1)
+                for obj, gt_idx in zip(tracked_objects, nearest):
+                    if previous_ids[gt_idx] not in (-1, obj['track_id']):
+                        id_switches += 1
+                    previous_ids[gt_idx] = obj['track_id']
+            
+            print(f"{num_objects:>8} {matching:>10} {elapsed * 1000.0 / args.num_frames:>10.2f} {id_switches:>12}")
+
+
+def benchmark_tracker_grid(args):
+    """Thời gian update của VehicleTracker với/không spatial grid khi số xe tăng, mật độ xe không đổi"""
+    from vehicle_tracking import VehicleTracker
+    
+    print(f"Frames: {args.num_frames}, density: {args.density} xe/megapixel, max_distance: {args.max_distance}")
+    print(f"{'objects':>8} {'gating':>8} {'ms/frame':>10} {'us/object':>10} {'same ids':>9}")
+    
+    for num_objects in args.objects:
+        # Vùng ảnh tăng theo số xe (ví dụ sliced inference trên camera độ phân giải cao)
+        scale = np.sqrt(num_objects / (args.density * 1920 * 1080 / 1e6))
+        all_detections, _ = simulate_traffic(
+            num_objects, args.num_frames, width=int(1920 * scale), height=int(1080 * scale)
+        )
+        reference_ids = None
+        for spatial_grid in (False, True):
+            if not spatial_grid and num_objects > args.max_dense:
+                continue
+            tracker = VehicleTracker(max_distance=args.max_distance, spatial_grid=spatial_grid)
+            track_ids = []
+            start = time.perf_counter()
+            for detections in all_detections:
+                track_ids.append(tracker.update(detections).track_ids.tolist())
+            ms_per_frame = (time.perf_counter() - start) * 1000.0 / args.num_frames
+            
+            same = '-' if reference_ids is None else ('yes' if track_ids == reference_ids else 'no')
+            reference_ids = reference_ids or track_ids
+            print(f"{num_objects:>8} {'grid' if spatial_grid else 'dense':>8} {ms_per_frame:>10.2f} "
+                  f"{ms_per_frame * 1000.0 / num_objects:>10.1f} {same:>9}")
+
+
+def benchmark_counting_crossings(args):
+    """Thời gian count_vehicles theo số tracks mỗi frame, so số xe đếm được với giao điểm tính giải tích"""
+    from counting import VehicleCounter
+    
+    width, height = 1920, 1080
+    line_y = height / 2.0
+    print(f"Frames: {args.num_frames}, max speed: {args.max_speed} px/frame, line: y = {line_y:.0f}")
+    print(f"{'tracks':>8} {'ms/frame':>10} {'us/track':>9} {'counted':>8} {'expected':>9}")
+    
+    for num_tracks in args.tracks:
+        rng = np.random.default_rng(0)
+        start = rng.uniform([0, 0], [width, height], size=(num_tracks, 2))
+        velocity = rng.uniform(-args.max_speed, args.max_speed, size=(num_tracks, 2))
+        
+        # Xe chuyển động thẳng đều: cắt line nếu thời điểm chạm y = line_y nằm trong đoạn frames
+        # và x tại thời điểm đó nằm trong line
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t_cross = (line_y - start[:, 1]) / velocity[:, 1]
+        x_cross = start[:, 0] + velocity[:, 0] * t_cross
+        expected = int(np.sum((t_cross > 0) & (t_cross <= args.num_frames - 1) & (x_cross >= 0) & (x_cross <= width)))
+        
+        counter = VehicleCounter({'start': [0, line_y], 'end': [width, line_y], 'direction': 'horizontal'})
+        tracked = [{'track_id': i, 'centroid': (0.0, 0.0), 'class': 'car'} for i in range(num_tracks)]
+        elapsed = 0.0
+        for frame_idx in range(args.num_frames):
+            positions = (start + velocity * frame_idx).tolist()
+            for obj, position in zip(tracked, positions):
+                obj['centroid'] = tuple(position)
+            begin = time.perf_counter()
+            counter.count_vehicles(tracked)
+            elapsed += time.perf_counter() - begin
+        
+        ms_per_frame = elapsed * 1000.0 / args.num_frames
+        print(f"{num_tracks:>8} {ms_per_frame:>10.2f} {ms_per_frame * 1000.0 / num_tracks:>9.2f} "
+              f"{counter.count_up + counter.count_down:>8} {expected:>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark Tool - Đo hiệu năng pipeline')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    
+    batch_parser = subparsers.add_parser('detection-batch', help='Throughput YOLO theo batch size')
+    batch_parser.add_argument('--video', type=str, default=None, help='Video mẫu (default: frames ngẫu nhiên)')
+    batch_parser.add_argument('--num-frames', type=int, default=64, help='Số frames dùng để đo (default: 64)')
+    batch_parser.add_argument('--model', type=str, default='yolov8n.pt', help='YOLO model (default: yolov8n.pt)')
+    batch_parser.add_argument('--conf', type=float, default=0.25, help='Confidence threshold (default: 0.25)')
+    batch_parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 4, 8, 16],
+                              help='Các batch size cần so sánh (default: 1 4 8 16)')
+    batch_parser.set_defaults(func=benchmark_detection_batch)
+    
+    stride_parser = subparsers.add_parser('counting-stride', help='Độ chính xác đếm xe theo detection stride')
+    stride_parser.add_argument('--video', type=str, required=True, help='Clip tham chiếu')
+    stride_parser.add_argument('--config', type=str, default='config/roi_config.json',
+                               help='Config có roi và counting_line (default: config/roi_config.json)')
+    stride_parser.add_argument('--num-frames', type=int, default=300, help='Số frames dùng để đo (default: 300)')
+    stride_parser.add_argument('--model', type=str, default='yolov8n.pt', help='YOLO model (default: yolov8n.pt)')
+    stride_parser.add_argument('--conf', type=float, default=0.25, help='Confidence threshold (default: 0.25)')
+    stride_parser.add_argument('--batch-size', type=int, default=8, help='Batch size khi detect (default: 8)')
+    stride_parser.add_argument('--strides', type=int, nargs='+', default=[1, 2, 3, 5, 10],
+                               help='Các detection stride cần so sánh (default: 1 2 3 5 10)')
+    stride_parser.add_argument('--optical-flow', action='store_true', help='Đo thêm chế độ có optical flow')
+    stride_parser.add_argument('--ground-truth', type=int, default=None,
+                               help='Số xe thực tế qua line (default: dùng kết quả stride đầu tiên làm chuẩn)')
+    stride_parser.set_defaults(func=benchmark_counting_stride)
+    
+    assoc_parser = subparsers.add_parser('tracker-association', help='Thời gian/độ chính xác association của tracker')
+    assoc_parser.add_argument('--objects', type=int, nargs='+', default=[50, 200, 1000],
+                              help='Số xe mỗi frame (default: 50 200 1000)')
+    assoc_parser.add_argument('--num-frames', type=int, default=50, help='Số frames giả lập (default: 50)')
+    assoc_parser.add_argument('--max-distance', type=float, default=50.0, help='Gating distance (default: 50)')
+    assoc_parser.add_argument('--matching', type=str, nargs='+', default=['hungarian', 'greedy'],
+                              choices=['hungarian', 'greedy', 'bytetrack'],
+                              help='Các thuật toán matching cần so sánh (bytetrack: ByteTracker, ghép theo IoU)')
+    assoc_parser.set_defaults(func=benchmark_tracker_association)
+    
+    grid_parser = subparsers.add_parser('tracker-grid', help='Khả năng mở rộng của tracker khi bật spatial grid')
+    grid_parser.add_argument('--objects', type=int, nargs='+', default=[250, 500, 1000, 2000, 4000],
+                             help='Số xe mỗi frame (default: 250 500 1000 2000 4000)')
+    grid_parser.add_argument('--num-frames', type=int, default=20, help='Số frames giả lập (default: 20)')
+    grid_parser.add_argument('--density', type=float, default=100.0,
+                             help='Số xe trên mỗi megapixel, giữ cố định khi tăng số xe (default: 100)')
+    grid_parser.add_argument('--max-distance', type=float, default=50.0, help='Gating distance (default: 50)')
+    grid_parser.add_argument('--max-dense', type=int, default=2000,
+                             help='Không chạy bản dense khi số xe lớn hơn giá trị này (default: 2000)')
+    grid_parser.set_defaults(func=benchmark_tracker_grid)
+    
+    crossing_parser = subparsers.add_parser('counting-crossings', help='Thời gian đếm xe theo số tracks mỗi frame')
+    crossing_parser.add_argument('--tracks', type=int, nargs='+', default=[100, 1000, 5000, 20000],
+                                 help='Số tracks mỗi frame (default: 100 1000 5000 20000)')
+    crossing_parser.add_argument('--num-frames', type=int, default=50, help='Số frames giả lập (default: 50)')
+    crossing_parser.add_argument('--max-speed', type=float, default=40.0,
+                                 help='Vận tốc tối đa mỗi trục, px/frame (default: 40)')
+    crossing_parser.set_defaults(func=benchmark_counting_crossings)
+    
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Ground-plane Calibration Tool
+Tool để chọn 4 điểm trên mặt đường (hình chữ nhật có kích thước đã biết) trên video frame
+Sau đó lưu calibration vào config để pipeline ước lượng tốc độ xe
+"""
+import cv2
+import os
+import sys
+import json
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent / 'src'))
+
+from speed_estimation import ground_homography, transform_points
+
+
+class GroundCalibrator:
+    """Tool để chọn 4 điểm mặt đường bằng cách click trên frame"""
+    
+    def __init__(self, video_path, width_m, length_m, window_width=1280, window_height=720):
+        """
+        Khởi tạo calibrator
+        
+        Args:
+            video_path: Đường dẫn đến video
+            width_m: Khoảng cách điểm 1 → điểm 2 (= điểm 4 → điểm 3) trên mặt đường (mét, ví dụ bề rộng lane)
+            length_m: Khoảng cách điểm 2 → điểm 3 (= điểm 1 → điểm 4) trên mặt đường (mét, ví dụ dọc theo vạch kẻ)
+            window_width: Chiều rộng cửa sổ hiển thị
+            window_height: Chiều cao cửa sổ hiển thị
+        """
+        self.video_path = video_path
+        self.width_m = width_m
+        self.length_m = length_m
+        self.window_width = window_width
+        self.window_height = window_height
+        
+        # Điểm đã chọn (lưu theo tọa độ gốc)
+        self.image_points = []
+        self.frame_display = None
+        self.scale_x = 1.0
+        self.scale_y = 1.0
+    
+    @property
+    def world_points(self):
+        """Tọa độ mặt đường (mét) của 4 điểm: 1 → 2 theo chiều rộng, 2 → 3 theo chiều dài"""
+        return [[0.0, 0.0], [self.width_m, 0.0], [self.width_m, self.length_m], [0.0, self.length_m]]
+    
+    def _draw_points(self):
+        """Vẽ các điểm đã chọn và đa giác nối chúng lên frame hiển thị"""
+        display = [(int(x * self.scale_x), int(y * self.scale_y)) for x, y in self.image_points]
+        for idx, point in enumerate(display):
+            cv2.circle(self.frame_display, point, 5, (0, 0, 255), -1)
+            cv2.putText(self.frame_display, str(idx + 1), (point[0] + 8, point[1] - 8),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
+        if len(display) > 1:
+            cv2.polylines(self.frame_display, [np.array(display, dtype=np.int32)], len(display) == 4, (0, 255, 0), 2)
+    
+    def add_point(self, event, x, y, flags, param):
+        """Callback function cho mouse events"""
+        if event == cv2.EVENT_LBUTTONDOWN and len(self.image_points) < 4:
+            # Chuyển từ tọa độ hiển thị về tọa độ gốc
+            point = [round(x / self.scale_x, 1), round(y / self.scale_y, 1)]
+            self.image_points.append(point)
+            self._draw_points()
+            print(f"Point {len(self.image_points)}: ({point[0]}, {point[1]})")
+    
+    def select_points(self):
+        """Hiển thị frame đầu tiên và cho phép người dùng click 4 điểm"""
+        cap = cv2.VideoCapture(self.video_path)
+        if not cap.isOpened():
+            raise ValueError(f"Không thể mở video: {self.video_path}")
+        
+        ret, first_frame = cap.read()
+        cap.release()
+        
+        if first_frame is None:
+            raise ValueError("Không thể đọc frame đầu tiên từ video")
+        
+        orig_height, orig_width = first_frame.shape[:2]
+        self.scale_x = self.window_width / orig_width
+        self.scale_y = self.window_height / orig_height
+        self.frame_display = cv2.resize(first_frame.copy(), (self.window_width, self.window_height))
+        
+        cv2.namedWindow('Ground Calibration', cv2.WINDOW_NORMAL)
+        cv2.resizeWindow('Ground Calibration', self.window_width, self.window_height)
+        cv2.setMouseCallback('Ground Calibration', self.add_point)
+        
+        print("=" * 60)
+        print("HƯỚNG DẪN:")
+        print("- Click 4 góc của một hình chữ nhật trên mặt đường, theo thứ tự:")
+        print(f"  1 → 2: chiều rộng ({self.width_m} m), 2 → 3: chiều dài ({self.length_m} m), 3 → 4, 4 → 1")
+        print("- Nhấn phím bất kỳ để hoàn tất (sau khi đủ 4 điểm)")
+        print("- Nhấn 'r' để reset (xóa các điểm đã chọn)")
+        print("- Nhấn 'q' hoặc ESC để thoát")
+        print("=" * 60)
+        
+        while True:
+            cv2.imshow('Ground Calibration', self.frame_display)
+            key = cv2.waitKey(1) & 0xFF
+            
+            if key == ord('q') or key == 27:  # ESC
+                print("Đã hủy")
+                cv2.destroyAllWindows()
+                return False
+            elif key == ord('r'):
+                self.image_points = []
+                self.frame_display = cv2.resize(first_frame.copy(), (self.window_width, self.window_height))
+                print("Đã reset các điểm")
+            elif key != 255 and key != -1:  # Bất kỳ phím nào khác
+                if len(self.image_points) == 4:
+                    break
+                print(f"Cần 4 điểm, mới chọn {len(self.image_points)}")
+        
+        cv2.destroyAllWindows()
+        return True
+    
+    def report(self):
+        """In homography và kiểm tra: độ dài các cạnh sau khi chiếu về mặt đường"""
+        homography = ground_homography(self.image_points, self.world_points)
+        ground = transform_points(np.array(self.image_points, dtype=np.float64), homography)
+        print("\nHomography (ảnh → mặt đường, mét):")
+        print(np.array2string(homography, precision=6, suppress_small=True))
+        for idx in range(4):
+            length = np.linalg.norm(ground[(idx + 1) % 4] - ground[idx])
+            print(f"  Cạnh {idx + 1} → {(idx + 1) % 4 + 1}: {length:.2f} m")
+        return homography
+    
+    def save_config(self, config_path):
+        """Ghi phần 'calibration' vào config JSON (giữ lanes và các tùy chọn đã có)"""
+        config = {}
+        if os.path.exists(config_path):
+            with open(config_path, 'r', encoding='utf-8') as f:
+                config = json.load(f)
+        
+        calibration = dict(config.get('calibration', {}))
+        calibration['image_points'] = self.image_points
+        calibration['world_points'] = self.world_points
+        config['calibration'] = calibration
+        
+        with open(config_path, 'w', encoding='utf-8') as f:
+            json.dump(config, f, indent=2, ensure_ascii=False)
+        
+        print(f"\n✓ Đã lưu calibration vào: {config_path}")
+        return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Ground-plane Calibration Tool - Chọn 4 điểm mặt đường để đo tốc độ')
+    parser.add_argument('--video', type=str, required=True, help='Đường dẫn đến video file')
+    parser.add_argument('--config', type=str, default='config/roi_config.json',
+                        help='Config JSON để ghi calibration (default: config/roi_config.json)')
+    parser.add_argument('--width-m', type=float, required=True, help='Khoảng cách điểm 1 → 2 (mét)')
+    parser.add_argument('--length-m', type=float, required=True, help='Khoảng cách điểm 2 → 3 (mét)')
+    parser.add_argument('--points', type=float, nargs=8, default=None,
+                        help='4 điểm x1 y1 ... x4 y4 (pixels), bỏ qua bước click (ví dụ trên server không có màn hình)')
+    parser.add_argument('--width', type=int, default=1280, help='Chiều rộng cửa sổ hiển thị (default: 1280)')
+    parser.add_argument('--height', type=int, default=720, help='Chiều cao cửa sổ hiển thị (default: 720)')
+    
+    args = parser.parse_args()
+    
+    if args.points is None and not os.path.exists(args.video):
+        print(f"Lỗi: Video không tồn tại: {args.video}")
+        return 1
+    
+    try:
+        calibrator = GroundCalibrator(
+            video_path=args.video,
+            width_m=args.width_m,
+            length_m=args.length_m,
+            window_width=args.width,
+            window_height=args.height
+        )
+        
+        if args.points is not None:
+            calibrator.image_points = [[args.points[i], args.points[i + 1]] for i in range(0, 8, 2)]
+        elif not calibrator.select_points():
+            print("Đã hủy bỏ")
+            return 0
+        
+        calibrator.report()
+        calibrator.save_config(args.config)
+        return 0
+    
+    except Exception as e:
+        print(f"Lỗi: {e}")
+        import traceback
+        traceback.print_exc()
+        return 1
+
+
+if __name__ == '__main__':
+    exit(main())
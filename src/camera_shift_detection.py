@@ -3,15 +3,319 @@ Module 5: Camera Shift Detection
 Kiểm tra camera có bị lệch không
 """
 import cv2
+import hashlib
 import numpy as np
 import logging
 import os
+import re
+import threading
+from datetime import datetime
 from pathlib import Path
 from typing import Optional, Tuple, Dict
 
 logger = logging.getLogger(__name__)
 
 
+def _empty_result(match_count: int = 0) -> Dict:
+    """Kết quả mặc định khi không xác định được shift"""
+    return {
+        'shift_x': 0.0,
+        'shift_y': 0.0,
+        'rotation': 0.0,
+        'is_shifted': False,
+        'match_count': match_count,
+        'method': 'none'
+    }
+
+
+def _to_gray(frame: np.ndarray) -> np.ndarray:
+    """Convert sang grayscale nếu cần"""
+    if len(frame.shape) == 3:
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    return frame
+
+
+class ShiftDetector:
+    """
+    Camera shift detector với reference features được cache
+    
+    Keypoints/descriptors của reference frame chỉ tính một lần, ORB và matcher
+    được dùng lại, mỗi lần detect chỉ xử lý frame hiện tại.
+    
+    Detector chạy theo 2 tầng: phase correlation trên ảnh thu nhỏ (< 1ms) cho
+    mọi frame, chỉ khi translation ước lượng lớn hoặc response thấp mới chạy
+    ORB + homography đầy đủ.
+    """
+    
+    def __init__(
+        self,
+        reference_frame: Optional[np.ndarray] = None,
+        threshold: float = 0.1,
+        mask: Optional[np.ndarray] = None,
+        nfeatures: int = 1000,
+        use_fast_path: bool = True,
+        phase_width: int = 160,
+        phase_shift_threshold: float = 0.01,
+        min_phase_response: float = 0.2
+    ):
+        """
+        Khởi tạo shift detector
+        
+        Args:
+            reference_frame: Frame tham chiếu (có thể set sau bằng set_reference)
+            threshold: Ngưỡng để coi là lệch (0.0 - 1.0)
+            mask: Mask uint8 (255 = vùng lấy features), None = toàn bộ frame
+            nfeatures: Số features tối đa của ORB
+            use_fast_path: Bật tầng phase correlation
+            phase_width: Chiều rộng ảnh thu nhỏ cho phase correlation (pixels)
+            phase_shift_threshold: Translation (tỉ lệ theo kích thước frame) vượt
+                ngưỡng này thì chuyển sang ORB
+            min_phase_response: Response của phase correlation thấp hơn ngưỡng
+                này (ảnh thay đổi nhiều, không tin được) thì chuyển sang ORB
+        """
+        self.threshold = threshold
+        self.orb = cv2.ORB_create(nfeatures=nfeatures)
+        self.matcher = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=False)
+        
+        self.use_fast_path = use_fast_path
+        self.phase_width = phase_width
+        self.phase_shift_threshold = phase_shift_threshold
+        self.min_phase_response = min_phase_response
+        
+        self._reference = None
+        self._mask = None
+        self._ref_keypoints = None
+        self._ref_descriptors = None
+        self._ref_small = None
+        self._small_mask = None
+        self._hanning = None
+        self._ref_shape = None
+        
+        if reference_frame is not None:
+            self.set_reference(reference_frame, mask)
+        else:
+            self._mask = mask
+    
+    @property
+    def reference_frame(self) -> Optional[np.ndarray]:
+        """Reference frame đang được cache"""
+        return self._reference
+    
+    def set_reference(self, reference_frame: Optional[np.ndarray], mask: Optional[np.ndarray] = None):
+        """
+        Đổi reference frame và tính lại features (invalidate cache)
+        
+        Args:
+            reference_frame: Frame tham chiếu mới
+            mask: Mask mới (None = giữ mask hiện tại)
+        """
+        if mask is not None:
+            self._mask = mask
+        
+        self._reference = reference_frame
+        self._ref_keypoints = None
+        self._ref_descriptors = None
+        self._ref_small = None
+        self._small_mask = None
+        self._hanning = None
+        self._ref_shape = None
+        
+        if reference_frame is None:
+            return
+        
+        ref_gray = _to_gray(reference_frame)
+        self._ref_shape = ref_gray.shape[:2]
+        self._ref_keypoints, self._ref_descriptors = self.orb.detectAndCompute(
+            ref_gray, self._mask_for(ref_gray)
+        )
+        
+        if self.use_fast_path:
+            mask = self._mask_for(ref_gray)
+            small_size = self._small_size(ref_gray)
+            if mask is not None:
+                self._small_mask = cv2.resize(mask, small_size, interpolation=cv2.INTER_AREA).astype(np.float32) / 255.0
+            self._hanning = cv2.createHanningWindow(small_size, cv2.CV_32F)
+            self._ref_small = self._prepare_phase(ref_gray)
+        logger.debug(
+            f"Cached reference features: {len(self._ref_keypoints) if self._ref_keypoints else 0} keypoints"
+        )
+    
+    def _mask_for(self, gray: np.ndarray) -> Optional[np.ndarray]:
+        """Trả về mask nếu cùng kích thước với frame"""
+        if self._mask is not None and self._mask.shape[:2] == gray.shape[:2]:
+            return self._mask
+        return None
+    
+    def _small_size(self, gray: np.ndarray) -> Tuple[int, int]:
+        """Kích thước (width, height) ảnh thu nhỏ, giữ tỉ lệ"""
+        h, w = gray.shape[:2]
+        width = min(self.phase_width, w)
+        height = max(1, int(round(h * width / w)))
+        return width, height
+    
+    def _prepare_phase(self, gray: np.ndarray) -> np.ndarray:
+        """Thu nhỏ + float32 (+ mask) cho phase correlation"""
+        small = cv2.resize(gray, self._small_size(gray), interpolation=cv2.INTER_AREA).astype(np.float32)
+        if self._small_mask is not None:
+            small *= self._small_mask
+        return small
+    
+    def _phase_check(self, current_gray: np.ndarray) -> Optional[Dict]:
+        """
+        Tầng nhanh: phase correlation trên ảnh thu nhỏ
+        
+        Returns:
+            Dict kết quả nếu chắc chắn không lệch, None nếu cần chạy ORB
+        """
+        if self._ref_small is None or current_gray.shape[:2] != self._ref_shape:
+            return None
+        
+        current_small = self._prepare_phase(current_gray)
+        (dx, dy), response = cv2.phaseCorrelate(current_small, self._ref_small, self._hanning)
+        
+        small_h, small_w = current_small.shape[:2]
+        normalized_shift_x = abs(dx) / small_w
+        normalized_shift_y = abs(dy) / small_h
+        
+        # Không bao giờ để tầng nhanh che một shift vượt threshold
+        shift_threshold = min(self.phase_shift_threshold, self.threshold)
+        if (max(normalized_shift_x, normalized_shift_y) > shift_threshold
+                or response < self.min_phase_response):
+            logger.debug(
+                f"Phase correlation escalates to ORB: dx={dx:.2f}, dy={dy:.2f}, response={response:.3f}"
+            )
+            return None
+        
+        # Scale translation về kích thước frame gốc
+        h, w = current_gray.shape[:2]
+        return {
+            'shift_x': float(dx * w / small_w),
+            'shift_y': float(dy * h / small_h),
+            'rotation': 0.0,
+            'is_shifted': False,
+            'match_count': 0,
+            'normalized_shift_x': normalized_shift_x,
+            'normalized_shift_y': normalized_shift_y,
+            'method': 'phase'
+        }
+    
+    def detect(self, current_frame: np.ndarray, reference_frame: Optional[np.ndarray] = None) -> Dict:
+        """
+        Phát hiện camera bị lệch so với reference frame đã cache
+        
+        Args:
+            current_frame: Frame hiện tại
+            reference_frame: Reference frame (None = dùng frame đã cache). Nếu khác
+                object đang cache thì features được tính lại
+        
+        Returns:
+            Dict: Cùng format với detect_camera_shift, thêm 'method':
+                'phase' (tầng nhanh), 'orb' (homography) hoặc 'none' (không xác định được).
+                Kết quả 'orb' có thêm 'homography' (3x3, frame hiện tại → reference)
+        """
+        if reference_frame is not None and reference_frame is not self._reference:
+            self.set_reference(reference_frame)
+        
+        if current_frame is None or self._reference is None:
+            return _empty_result()
+        
+        current_gray = _to_gray(current_frame)
+        
+        # Tầng 1: phase correlation, đa số frame dừng ở đây
+        if self.use_fast_path:
+            fast_result = self._phase_check(current_gray)
+            if fast_result is not None:
+                return fast_result
+        
+        # Tầng 2: chỉ detect features cho frame hiện tại
+        kp1, des1 = self.orb.detectAndCompute(current_gray, self._mask_for(current_gray))
+        kp2, des2 = self._ref_keypoints, self._ref_descriptors
+        
+        if des1 is None or des2 is None or len(des1) < 4 or len(des2) < 4:
+            logger.warning("Not enough features detected")
+            return _empty_result()
+        
+        # Match features
+        matches = self.matcher.knnMatch(des1, des2, k=2)
+        
+        # Apply ratio test
+        good_matches = []
+        for match_pair in matches:
+            if len(match_pair) == 2:
+                m, n = match_pair
+                if m.distance < 0.75 * n.distance:
+                    good_matches.append(m)
+        
+        if len(good_matches) < 4:
+            logger.warning("Not enough good matches")
+            return _empty_result(len(good_matches))
+        
+        # Lấy điểm tương ứng
+        src_pts = np.float32([kp1[m.queryIdx].pt for m in good_matches]).reshape(-1, 1, 2)
+        dst_pts = np.float32([kp2[m.trainIdx].pt for m in good_matches]).reshape(-1, 1, 2)
+        
+        # Tính homography matrix
+        homography, mask = cv2.findHomography(src_pts, dst_pts, cv2.RANSAC, 5.0)
+        
+        if homography is None:
+            logger.warning("Could not compute homography")
+            return _empty_result(len(good_matches))
+        
+        # Tính shift và rotation từ homography
+        # Homography matrix: [[a, b, tx], [c, d, ty], [e, f, 1]]
+        shift_x = homography[0, 2]
+        shift_y = homography[1, 2]
+        
+        # Tính rotation từ scale và rotation components
+        a, b = homography[0, 0], homography[0, 1]
+        rotation = np.arctan2(b, a) * 180 / np.pi
+        
+        # Normalize shift theo kích thước frame
+        h, w = current_gray.shape[:2]
+        normalized_shift_x = abs(shift_x) / w
+        normalized_shift_y = abs(shift_y) / h
+        
+        # Kiểm tra có lệch không
+        max_shift = max(normalized_shift_x, normalized_shift_y)
+        is_shifted = max_shift > self.threshold or abs(rotation) > 5.0  # 5 độ
+        
+        result = {
+            'shift_x': shift_x,
+            'shift_y': shift_y,
+            'rotation': rotation,
+            'is_shifted': is_shifted,
+            'match_count': len(good_matches),
+            'normalized_shift_x': normalized_shift_x,
+            'normalized_shift_y': normalized_shift_y,
+            'method': 'orb',
+            'homography': homography  # Map tọa độ frame hiện tại → reference frame
+        }
+        
+        if is_shifted:
+            logger.warning(
+                f"Camera shift detected: shift_x={shift_x:.2f}, shift_y={shift_y:.2f}, "
+                f"rotation={rotation:.2f}°"
+            )
+        
+        return result
+
+
+# Detectors cho detect_camera_shift: mỗi thread một bộ, mỗi threshold một detector
+# (ShiftDetector giữ cache reference và matcher nên không chia sẻ giữa các thread)
+_default_detectors = threading.local()
+
+
+def _get_default_detector(threshold: float) -> ShiftDetector:
+    """Lấy ShiftDetector của thread hiện tại cho threshold (tạo nếu chưa có)"""
+    detectors = getattr(_default_detectors, 'by_threshold', None)
+    if detectors is None:
+        detectors = _default_detectors.by_threshold = {}
+    detector = detectors.get(threshold)
+    if detector is None:
+        detector = detectors[threshold] = ShiftDetector(threshold=threshold)
+    return detector
+
+
 def detect_camera_shift(
     current_frame: np.ndarray,
     reference_frame: np.ndarray,
@@ -20,6 +324,10 @@ def detect_camera_shift(
     """
     Phát hiện camera bị lệch bằng feature matching
     
+    Features của reference frame được cache giữa các lần gọi với cùng
+    reference frame (xem ShiftDetector). Cache riêng cho từng thread và từng
+    threshold nên an toàn khi gọi từ nhiều thread.
+    
     Args:
         current_frame: Frame hiện tại
         reference_frame: Frame tham chiếu
@@ -35,116 +343,367 @@ def detect_camera_shift(
         }
     """
     if current_frame is None or reference_frame is None:
-        return {
-            'shift_x': 0.0,
-            'shift_y': 0.0,
-            'rotation': 0.0,
-            'is_shifted': False,
-            'match_count': 0
-        }
+        return _empty_result()
     
-    # Convert to grayscale nếu cần
-    if len(current_frame.shape) == 3:
-        current_gray = cv2.cvtColor(current_frame, cv2.COLOR_BGR2GRAY)
-    else:
-        current_gray = current_frame
+    return _get_default_detector(threshold).detect(current_frame, reference_frame)
+
+
+class ReferenceBank:
+    """
+    Bank nhiều reference frame (ngày/đêm/thời tiết), mỗi frame có features cache
     
-    if len(reference_frame.shape) == 3:
-        ref_gray = cv2.cvtColor(reference_frame, cv2.COLOR_BGR2GRAY)
-    else:
-        ref_gray = reference_frame
+    Trước khi matching, chọn reference gần nhất bằng luminance histogram (rẻ).
+    Khi ShiftMonitor xác nhận view ổn định, frame vẫn khớp reference (phase
+    correlation hoặc đủ ORB matches, translation nhỏ) nhưng histogram trôi xa
+    khỏi mọi reference trong refresh_checks lần check liên tiếp, frame hiện tại
+    được thêm vào bank. Frame không căn chỉnh được (method 'none') không bao giờ
+    được thêm. Có cùng interface detect() với ShiftDetector nên dùng được trực
+    tiếp với ShiftMonitor.
     
-    # Sử dụng ORB detector (nhanh hơn SIFT)
-    orb = cv2.ORB_create(nfeatures=1000)
+    Reference do người dùng cung cấp (reference_frame của detect) luôn có trong
+    bank và không bị loại. Khi loại reference, chỉ xóa file do bank tự ghi.
+    """
     
-    # Detect keypoints và descriptors
-    kp1, des1 = orb.detectAndCompute(current_gray, None)
-    kp2, des2 = orb.detectAndCompute(ref_gray, None)
+    # Tên file do add_reference ghi (chỉ những file này được xóa khi loại reference)
+    FILE_PATTERN = re.compile(r'^reference_\d{8}_\d{6}_\d{6}\.jpg$')
     
-    if des1 is None or des2 is None or len(des1) < 4 or len(des2) < 4:
-        logger.warning("Not enough features detected")
-        return {
-            'shift_x': 0.0,
-            'shift_y': 0.0,
-            'rotation': 0.0,
-            'is_shifted': False,
-            'match_count': 0
-        }
+    def __init__(
+        self,
+        bank_dir: Optional[str] = 'data/reference_frames',
+        threshold: float = 0.1,
+        max_references: int = 8,
+        drift_threshold: float = 0.25,
+        refresh_checks: int = 3,
+        histogram_bins: int = 32,
+        min_matches: int = 20,
+        **detector_kwargs
+    ):
+        """
+        Khởi tạo reference bank
+        
+        Args:
+            bank_dir: Thư mục lưu reference frames (None = chỉ giữ trong memory)
+            threshold: Ngưỡng để coi là lệch (0.0 - 1.0), truyền cho ShiftDetector
+            max_references: Số reference tối đa, reference ít dùng nhất bị loại
+            drift_threshold: Bhattacharyya distance (0.0 - 1.0) tới reference gần
+                nhất vượt ngưỡng này thì coi là view đã trôi
+            refresh_checks: Số lần check ổn định + trôi liên tiếp trước khi thêm reference
+            histogram_bins: Số bins của luminance histogram
+            min_matches: Số ORB matches tối thiểu để coi frame khớp reference
+                khi tính drift (kết quả phase luôn đủ response)
+            **detector_kwargs: Tham số khác cho ShiftDetector (mask, nfeatures, ...)
+        """
+        self.bank_dir = bank_dir
+        self.threshold = threshold
+        self.max_references = max_references
+        self.drift_threshold = drift_threshold
+        self.refresh_checks = refresh_checks
+        self.histogram_bins = histogram_bins
+        self.min_matches = min_matches
+        self.detector_kwargs = detector_kwargs
+        
+        self.entries = []  # [{'path', 'owned', 'pinned', 'histogram', 'detector', 'last_used'}]
+        self._tick = 0
+        self._drift_count = 0
+        self._seed_frame: Optional[np.ndarray] = None
+        
+        if bank_dir is not None and os.path.isdir(bank_dir):
+            for path in sorted(Path(bank_dir).glob('*.jpg')):
+                frame = cv2.imread(str(path))
+                if frame is not None:
+                    self._add_entry(frame, str(path), owned=bool(self.FILE_PATTERN.match(path.name)))
+            logger.info(f"Loaded {len(self.entries)} reference frames from {bank_dir}")
     
-    # Match features
-    bf = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=False)
-    matches = bf.knnMatch(des1, des2, k=2)
+    def __len__(self) -> int:
+        return len(self.entries)
     
-    # Apply ratio test
-    good_matches = []
-    for match_pair in matches:
-        if len(match_pair) == 2:
-            m, n = match_pair
-            if m.distance < 0.75 * n.distance:
-                good_matches.append(m)
+    def _histogram(self, frame: np.ndarray) -> np.ndarray:
+        """Luminance histogram (normalized) trên ảnh thu nhỏ"""
+        small = cv2.resize(_to_gray(frame), (64, 36), interpolation=cv2.INTER_AREA)
+        hist = cv2.calcHist([small], [0], None, [self.histogram_bins], [0, 256])
+        return cv2.normalize(hist, hist, alpha=1.0, norm_type=cv2.NORM_L1)
     
-    if len(good_matches) < 4:
-        logger.warning("Not enough good matches")
-        return {
-            'shift_x': 0.0,
-            'shift_y': 0.0,
-            'rotation': 0.0,
-            'is_shifted': False,
-            'match_count': len(good_matches)
-        }
+    def _add_entry(self, frame: np.ndarray, path: Optional[str], owned: bool = False, pinned: bool = False) -> int:
+        """Thêm entry vào bank (không lưu file)"""
+        self._tick += 1
+        self.entries.append({
+            'path': path,
+            'owned': owned,
+            'pinned': pinned,
+            'histogram': self._histogram(frame),
+            'detector': ShiftDetector(frame, threshold=self.threshold, **self.detector_kwargs),
+            'last_used': self._tick
+        })
+        return len(self.entries) - 1
     
-    # Lấy điểm tương ứng
-    src_pts = np.float32([kp1[m.queryIdx].pt for m in good_matches]).reshape(-1, 1, 2)
-    dst_pts = np.float32([kp2[m.trainIdx].pt for m in good_matches]).reshape(-1, 1, 2)
+    def add_reference(self, frame: np.ndarray) -> int:
+        """
+        Thêm reference frame vào bank (lưu file nếu có bank_dir)
+        
+        Args:
+            frame: Frame để làm reference
+        
+        Returns:
+            int: Index của reference mới
+        """
+        evictable = [i for i, entry in enumerate(self.entries) if not entry['pinned']]
+        if len(self.entries) >= self.max_references and evictable:
+            # Loại reference ít được chọn gần đây nhất (không loại reference của người dùng)
+            evict_idx = min(evictable, key=lambda i: self.entries[i]['last_used'])
+            evicted = self.entries.pop(evict_idx)
+            if evicted['owned'] and os.path.exists(evicted['path']):
+                os.remove(evicted['path'])
+            logger.info(f"Evicted reference frame: {evicted['path']}")
+        
+        path = None
+        if self.bank_dir is not None:
+            path = os.path.join(self.bank_dir, f"reference_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.jpg")
+            save_reference_frame(frame, path)
+        
+        self._drift_count = 0
+        return self._add_entry(frame, path, owned=path is not None)
     
-    # Tính homography matrix
-    homography, mask = cv2.findHomography(src_pts, dst_pts, cv2.RANSAC, 5.0)
+    def seed(self, frame: np.ndarray) -> int:
+        """
+        Đặt reference frame của người dùng (chỉ giữ trong memory, không bị loại)
+        
+        Gọi lại với frame khác sẽ thay reference cũ của người dùng.
+        
+        Args:
+            frame: Reference frame của người dùng
+        
+        Returns:
+            int: Index của reference trong bank
+        """
+        for idx, entry in enumerate(self.entries):
+            if entry['pinned']:
+                if frame is self._seed_frame or (
+                    frame.shape == self._seed_frame.shape and np.array_equal(frame, self._seed_frame)
+                ):
+                    return idx
+                self.entries.pop(idx)
+                break
+        
+        self._seed_frame = frame
+        return self._add_entry(frame, None, pinned=True)
     
-    if homography is None:
-        logger.warning("Could not compute homography")
-        return {
-            'shift_x': 0.0,
-            'shift_y': 0.0,
-            'rotation': 0.0,
-            'is_shifted': False,
-            'match_count': len(good_matches)
-        }
+    def select(self, frame: np.ndarray) -> Tuple[int, float]:
+        """
+        Chọn reference gần nhất theo luminance histogram
+        
+        Args:
+            frame: Frame hiện tại
+        
+        Returns:
+            Tuple[int, float]: (index, Bhattacharyya distance), (-1, 1.0) nếu bank rỗng
+        """
+        if not self.entries:
+            return -1, 1.0
+        
+        hist = self._histogram(frame)
+        distances = [
+            cv2.compareHist(hist, entry['histogram'], cv2.HISTCMP_BHATTACHARYYA)
+            for entry in self.entries
+        ]
+        best_idx = int(np.argmin(distances))
+        return best_idx, float(distances[best_idx])
     
-    # Tính shift và rotation từ homography
-    # Homography matrix: [[a, b, tx], [c, d, ty], [e, f, 1]]
-    shift_x = homography[0, 2]
-    shift_y = homography[1, 2]
-    
-    # Tính rotation từ scale và rotation components
-    a, b = homography[0, 0], homography[0, 1]
-    rotation = np.arctan2(b, a) * 180 / np.pi
-    
-    # Normalize shift theo kích thước frame
-    h, w = current_gray.shape[:2]
-    normalized_shift_x = abs(shift_x) / w
-    normalized_shift_y = abs(shift_y) / h
-    
-    # Kiểm tra có lệch không
-    max_shift = max(normalized_shift_x, normalized_shift_y)
-    is_shifted = max_shift > threshold or abs(rotation) > 5.0  # 5 độ
-    
-    result = {
-        'shift_x': shift_x,
-        'shift_y': shift_y,
-        'rotation': rotation,
-        'is_shifted': is_shifted,
-        'match_count': len(good_matches),
-        'normalized_shift_x': normalized_shift_x,
-        'normalized_shift_y': normalized_shift_y
-    }
+    def detect(self, current_frame: np.ndarray, reference_frame: Optional[np.ndarray] = None) -> Dict:
+        """
+        Phát hiện camera bị lệch so với reference gần nhất trong bank
+        
+        Args:
+            current_frame: Frame hiện tại
+            reference_frame: Reference của người dùng, luôn được giữ trong bank (xem seed)
+        
+        Returns:
+            Dict: Cùng format với ShiftDetector.detect, thêm 'reference_index' và
+                'reference_distance' (histogram distance tới reference đã chọn)
+        """
+        if current_frame is None:
+            return _empty_result()
+        
+        if reference_frame is not None:
+            self.seed(reference_frame)
+        if not self.entries:
+            return _empty_result()
+        
+        idx, distance = self.select(current_frame)
+        entry = self.entries[idx]
+        self._tick += 1
+        entry['last_used'] = self._tick
+        
+        result = entry['detector'].detect(current_frame)
+        result['reference_index'] = idx
+        result['reference_distance'] = distance
+        return result
     
-    if is_shifted:
-        logger.warning(
-            f"Camera shift detected: shift_x={shift_x:.2f}, shift_y={shift_y:.2f}, "
-            f"rotation={rotation:.2f}°"
-        )
+    def _is_aligned(self, result: Dict) -> bool:
+        """Kết quả detect có bằng chứng frame khớp reference (translation nhỏ, đủ matches)"""
+        if result['method'] == 'none' or result['is_shifted']:
+            return False
+        if result['method'] == 'orb' and result['match_count'] < self.min_matches:
+            return False
+        detector = self.entries[result['reference_index']]['detector']
+        return max(result['normalized_shift_x'], result['normalized_shift_y']) <= detector.phase_shift_threshold
     
-    return result
+    def observe(self, frame: np.ndarray, result: Dict, stable: bool):
+        """
+        Cập nhật drift sau mỗi lần check (ShiftMonitor gọi)
+        
+        Thêm reference mới khi view ổn định, frame khớp reference nhưng histogram
+        đã trôi. Frame không căn chỉnh được (method 'none', ví dụ ban đêm hoặc
+        view đã lệch) reset drift thay vì được coi là ổn định.
+        
+        Args:
+            frame: Frame vừa check
+            result: Kết quả detect() của frame
+            stable: ShiftMonitor xác nhận camera không lệch
+        """
+        distance = result.get('reference_distance', 0.0)
+        if stable and self._is_aligned(result) and distance > self.drift_threshold:
+            self._drift_count += 1
+            if self._drift_count >= self.refresh_checks:
+                new_idx = self.add_reference(frame)
+                logger.info(
+                    f"View drifted (histogram distance={distance:.3f}), "
+                    f"added reference frame #{new_idx}"
+                )
+        else:
+            self._drift_count = 0
+
+
+class ShiftMonitor:
+    """
+    Giám sát camera shift theo thời gian video với subsampling và hysteresis
+    
+    Ở trạng thái ổn định chỉ check mỗi check_interval giây video. Khi nghi ngờ
+    có thay đổi (kết quả khác trạng thái hiện tại), chuyển sang check dày đặc
+    cho đến khi xác nhận đủ confirm_checks / clear_checks lần liên tiếp. Mỗi
+    lần camera bị lệch chỉ sinh 2 event: 'start' và 'end'.
+    
+    Nếu detector có observe(frame, result, stable) (ReferenceBank), monitor gọi
+    sau mỗi lần check với stable = đã xác nhận camera không lệch.
+    """
+    
+    def __init__(
+        self,
+        detector,
+        check_interval: float = 5.0,
+        dense_interval: float = 0.0,
+        confirm_checks: int = 3,
+        clear_checks: int = 3
+    ):
+        """
+        Khởi tạo shift monitor
+        
+        Args:
+            detector: ShiftDetector hoặc ReferenceBank dùng để check
+            check_interval: Khoảng thời gian giữa 2 lần check khi ổn định (giây video)
+            dense_interval: Khoảng thời gian giữa 2 lần check khi nghi ngờ (0 = mọi frame)
+            confirm_checks: Số lần check lệch liên tiếp để xác nhận shift bắt đầu
+            clear_checks: Số lần check không lệch liên tiếp để xác nhận shift kết thúc
+        """
+        self.detector = detector
+        self.check_interval = check_interval
+        self.dense_interval = dense_interval
+        self.confirm_checks = confirm_checks
+        self.clear_checks = clear_checks
+        self.reset()
+    
+    def reset(self):
+        """Reset trạng thái (ví dụ: khi bắt đầu video mới)"""
+        self.is_shifted = False
+        self.current_result: Optional[Dict] = None  # Kết quả của shift episode hiện tại
+        self.episode_start: Optional[float] = None
+        self._pending = 0
+        self._pending_time: Optional[float] = None
+        self._last_check_time: Optional[float] = None
+    
+    @property
+    def is_dense(self) -> bool:
+        """Đang check dày đặc (có thay đổi chưa được xác nhận)"""
+        return self._pending > 0
+    
+    def _is_due(self, frame_time: float) -> bool:
+        """Kiểm tra đã đến lúc check chưa"""
+        if self._last_check_time is None or frame_time < self._last_check_time:
+            return True
+        interval = self.dense_interval if self.is_dense else self.check_interval
+        return frame_time - self._last_check_time >= interval
+    
+    def update(
+        self,
+        frame: np.ndarray,
+        frame_time: float,
+        reference_frame: Optional[np.ndarray] = None
+    ) -> Optional[Dict]:
+        """
+        Cập nhật monitor với frame mới
+        
+        Args:
+            frame: Frame hiện tại
+            frame_time: Thời gian của frame trong video (giây)
+            reference_frame: Reference frame (None = dùng reference của detector)
+        
+        Returns:
+            Dict event nếu trạng thái thay đổi, None nếu không:
+                {
+                    'event': 'start' hoặc 'end',
+                    'time': float,  # Thời gian bắt đầu thay đổi (giây)
+                    'result': Dict  # Kết quả detect_camera_shift
+                }
+        """
+        if not self._is_due(frame_time):
+            return None
+        
+        self._last_check_time = frame_time
+        result = self.detector.detect(frame, reference_frame)
+        event = self._update_state(result, frame_time)
+        
+        observe = getattr(self.detector, 'observe', None)
+        if observe is not None:
+            observe(frame, result, stable=not self.is_shifted and not self.is_dense)
+        
+        return event
+    
+    def _update_state(self, result: Dict, frame_time: float) -> Optional[Dict]:
+        """Cập nhật trạng thái (hysteresis) theo kết quả check, trả về event nếu có"""
+        if result['is_shifted'] == self.is_shifted:
+            # Khớp trạng thái hiện tại, bỏ nghi ngờ
+            self._pending = 0
+            self._pending_time = None
+            if self.is_shifted:
+                self.current_result = result
+            return None
+        
+        if self._pending == 0:
+            self._pending_time = frame_time
+        self._pending += 1
+        
+        required = self.clear_checks if self.is_shifted else self.confirm_checks
+        if self._pending < required:
+            return None
+        
+        # Xác nhận thay đổi trạng thái
+        event_time = self._pending_time
+        self._pending = 0
+        self._pending_time = None
+        
+        if self.is_shifted:
+            self.is_shifted = False
+            event = {'event': 'end', 'time': event_time, 'result': self.current_result or result}
+            self.current_result = None
+            self.episode_start = None
+            logger.info(f"Camera shift ended at {event_time:.2f}s")
+        else:
+            self.is_shifted = True
+            self.current_result = result
+            self.episode_start = event_time
+            event = {'event': 'start', 'time': event_time, 'result': result}
+            logger.warning(f"Camera shift started at {event_time:.2f}s")
+        
+        return event
 
 
 def save_reference_frame(frame: np.ndarray, output_path: str):
@@ -180,3 +739,19 @@ def load_reference_frame(reference_path: str) -> Optional[np.ndarray]:
     
     return frame
 
+
+def reference_bank_dir(base_dir: Optional[str], source: str) -> Optional[str]:
+    """
+    Thư mục bank reference riêng của một camera (bank của các camera không bị trộn)
+    
+    Args:
+        base_dir: Thư mục chứa bank của các camera (None = bank chỉ giữ trong memory)
+        source: Đường dẫn định danh camera (reference của người dùng hoặc video nguồn)
+    
+    Returns:
+        Optional[str]: base_dir/<tên file>_<hash đường dẫn>, None nếu base_dir là None
+    """
+    if base_dir is None:
+        return None
+    digest = hashlib.sha1(os.path.abspath(source).encode('utf-8')).hexdigest()[:8]
+    return os.path.join(base_dir, f"{Path(source).stem}_{digest}")
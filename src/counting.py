@@ -9,6 +9,108 @@ from typing import List, Dict, Tuple, Optional
 logger = logging.getLogger(__name__)
 
 
+def segment_crossings(
+    prev: np.ndarray,
+    curr: np.ndarray,
+    start: np.ndarray,
+    end: np.ndarray
+) -> np.ndarray:
+    """
+    Kiểm tra đoạn chuyển động prev → curr của N tracks có cắt đoạn start → end không (vectorized)
+    
+    Dùng orientation test (dấu cross product): prev và curr phải ở hai phía của line, và start, end
+    phải ở hai phía (hoặc nằm trên) đường chuyển động. Điểm nằm đúng trên line được tính là phía âm,
+    nên xe dừng trên line rồi đi tiếp chỉ được tính một lần. Phía của một điểm luôn tính cùng một
+    công thức nên hai frame liên tiếp không bao giờ mâu thuẫn nhau do làm tròn.
+    
+    Args:
+        prev: (N, 2) centroids frame trước
+        curr: (N, 2) centroids frame hiện tại
+        start: Điểm đầu line [x, y], hoặc (L, 2) cho L lines
+        end: Điểm cuối line [x, y], hoặc (L, 2)
+    
+    Returns:
+        np.ndarray: (N,) hoặc (N, L) int8, dấu cross product (end - start) × (curr - prev) nếu cắt, 0 nếu không
+    """
+    prev = np.asarray(prev, dtype=np.float64).reshape(-1, 2)
+    curr = np.asarray(curr, dtype=np.float64).reshape(-1, 2)
+    start = np.asarray(start, dtype=np.float64)
+    end = np.asarray(end, dtype=np.float64)
+    if start.ndim == 2:
+        # (N, 1, 2) broadcast với (L,) → (N, L)
+        prev, curr = prev[:, None], curr[:, None]
+    x1, y1 = start[..., 0], start[..., 1]
+    x2, y2 = end[..., 0], end[..., 1]
+    dx, dy = x2 - x1, y2 - y1
+    
+    # Phía của prev / curr so với line
+    side_prev = dx * (prev[..., 1] - y1) - dy * (prev[..., 0] - x1)
+    side_curr = dx * (curr[..., 1] - y1) - dy * (curr[..., 0] - x1)
+    changed = (side_prev > 0) != (side_curr > 0)
+    
+    # Phía của start / end so với đường chuyển động: giao điểm nằm trong đoạn start → end
+    mx = curr[..., 0] - prev[..., 0]
+    my = curr[..., 1] - prev[..., 1]
+    side_start = mx * (y1 - prev[..., 1]) - my * (x1 - prev[..., 0])
+    side_end = mx * (y2 - prev[..., 1]) - my * (x2 - prev[..., 0])
+    within = np.sign(side_start) * np.sign(side_end) <= 0
+    
+    return np.where(changed & within, np.sign(side_curr - side_prev), 0).astype(np.int8)
+
+
+def _up_sign(start: Tuple[float, float], end: Tuple[float, float], direction: str) -> int:
+    """
+    Dấu cross product (line × chuyển động) ứng với chiều 'up' của một line
+    
+    Up = từ dưới lên (y giảm) với line horizontal, từ phải sang trái (x giảm) với line vertical,
+    không phụ thuộc thứ tự start/end của line.
+    """
+    dx = end[0] - start[0]
+    dy = end[1] - start[1]
+    up_x, up_y = (0.0, -1.0) if direction == 'horizontal' else (-1.0, 0.0)
+    sign = np.sign(dx * up_y - dy * up_x)
+    return int(sign) if sign != 0 else 1
+
+
+def _track_arrays(tracked_objects) -> Tuple[np.ndarray, np.ndarray]:
+    """Track IDs (N,) và centroids (N, 2) từ TrackedObjects view hoặc list dicts"""
+    if hasattr(tracked_objects, 'track_ids'):
+        return tracked_objects.track_ids, tracked_objects.centroids
+    track_ids = np.array([obj['track_id'] for obj in tracked_objects], dtype=np.int64)
+    centroids = np.array([obj['centroid'] for obj in tracked_objects], dtype=np.float64).reshape(-1, 2)
+    return track_ids, centroids
+
+
+def points_in_polygons(points: np.ndarray, polygons: List[np.ndarray]) -> np.ndarray:
+    """
+    Kiểm tra N điểm nằm trong Z polygons (ray casting, tất cả cạnh của tất cả polygons trong một lần)
+    
+    Args:
+        points: (N, 2)
+        polygons: List Z polygons, mỗi polygon (K, 2) với K >= 3
+    
+    Returns:
+        np.ndarray: (N, Z) bool
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    if not polygons:
+        return np.zeros((len(points), 0), dtype=bool)
+    
+    edge_start = np.concatenate(polygons)
+    edge_end = np.concatenate([np.roll(polygon, -1, axis=0) for polygon in polygons])
+    first_edge = np.cumsum([0] + [len(polygon) for polygon in polygons[:-1]])
+    
+    # Số cạnh mà tia ngang từ điểm sang phải cắt qua, lẻ = nằm trong
+    px, py = points[:, 0:1], points[:, 1:2]
+    straddle = (edge_start[:, 1] > py) != (edge_end[:, 1] > py)  # (N, E)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x_cross = edge_start[:, 0] + (py - edge_start[:, 1]) * (
+            (edge_end[:, 0] - edge_start[:, 0]) / (edge_end[:, 1] - edge_start[:, 1])
+        )
+    hits = (straddle & (px < x_cross)).astype(np.int32)
+    return np.add.reduceat(hits, first_edge, axis=1) % 2 == 1
+
+
 class VehicleCounter:
     """Vehicle counter với counting line"""
     
@@ -22,10 +124,12 @@ class VehicleCounter:
                     'type': 'line',
                     'start': [x1, y1],
                     'end': [x2, y2],
-                    'direction': 'horizontal' or 'vertical'
+                    'direction': 'horizontal' or 'vertical',
+                    'name': 'main'  # (tùy chọn)
                 }
         """
         self.counting_line = counting_line
+        self.name = counting_line.get('name', 'main')  # Tên line trong count bins
         self.start_point = tuple(counting_line['start'])
         self.end_point = tuple(counting_line['end'])
         self.direction = counting_line.get('direction', 'horizontal')
@@ -36,110 +140,29 @@ class VehicleCounter:
         # Counters
         self.count_up = 0  # Chiều lên (hoặc trái/phải tùy direction)
         self.count_down = 0  # Chiều xuống (hoặc phải/trái tùy direction)
+        self._up_sign = _up_sign(self.start_point, self.end_point, self.direction)
         
-        logger.info(f"Vehicle counter initialized with line: {self.start_point} -> {self.end_point}")
-    
-    def _point_to_line_distance(self, point: Tuple[float, float], line_start: Tuple[float, float], line_end: Tuple[float, float]) -> float:
-        """Tính khoảng cách từ điểm đến đường thẳng"""
-        x0, y0 = point
-        x1, y1 = line_start
-        x2, y2 = line_end
-        
-        # Vector từ line_start đến line_end
-        dx = x2 - x1
-        dy = y2 - y1
-        
-        # Vector từ line_start đến point
-        dx0 = x0 - x1
-        dy0 = y0 - y1
-        
-        # Tính distance
-        if dx == 0 and dy == 0:
-            # Line là một điểm
-            return np.sqrt((x0 - x1)**2 + (y0 - y1)**2)
+        # Centroids của lần gọi count_vehicles trước, sắp xếp theo track ID
+        self._previous_ids = np.zeros(0, dtype=np.int64)
+        self._previous_centroids = np.zeros((0, 2))
         
-        # Projection
-        t = (dx0 * dx + dy0 * dy) / (dx * dx + dy * dy)
-        t = max(0, min(1, t))  # Clamp to [0, 1]
-        
-        # Closest point on line
-        proj_x = x1 + t * dx
-        proj_y = y1 + t * dy
-        
-        # Distance
-        distance = np.sqrt((x0 - proj_x)**2 + (y0 - proj_y)**2)
-        return distance
-    
-    def _is_crossing_line(self, prev_centroid: Tuple[float, float], curr_centroid: Tuple[float, float]) -> Optional[str]:
-        """
-        Kiểm tra xe có vượt qua counting line không
-        
-        Args:
-            prev_centroid: Centroid ở frame trước
-            curr_centroid: Centroid ở frame hiện tại
-        
-        Returns:
-            'up' hoặc 'down' nếu vượt qua, None nếu không
-        """
-        # Kiểm tra cả 2 điểm có ở 2 phía của line không
-        prev_dist = self._point_to_line_distance(prev_centroid, self.start_point, self.end_point)
-        curr_dist = self._point_to_line_distance(curr_centroid, self.start_point, self.end_point)
-        
-        # Nếu một điểm gần line (trong threshold) và điểm kia xa hơn, có thể đã vượt qua
-        threshold = 10.0  # pixels
-        
-        if prev_dist < threshold and curr_dist < threshold:
-            # Cả 2 đều gần line, kiểm tra xem có vượt qua không
-            # Tính side của mỗi điểm so với line
-            prev_side = self._get_side_of_line(prev_centroid)
-            curr_side = self._get_side_of_line(curr_centroid)
-            
-            if prev_side != curr_side:
-                # Đã vượt qua line
-                if self.direction == 'horizontal':
-                    # Up = từ dưới lên (y giảm), Down = từ trên xuống (y tăng)
-                    if prev_centroid[1] > curr_centroid[1]:
-                        return 'up'
-                    else:
-                        return 'down'
-                else:  # vertical
-                    # Up = từ phải sang trái (x giảm), Down = từ trái sang phải (x tăng)
-                    if prev_centroid[0] > curr_centroid[0]:
-                        return 'up'
-                    else:
-                        return 'down'
-        
-        return None
-    
-    def _get_side_of_line(self, point: Tuple[float, float]) -> int:
-        """Xác định điểm ở phía nào của line (1 hoặc -1)"""
-        x, y = point
-        x1, y1 = self.start_point
-        x2, y2 = self.end_point
-        
-        # Vector từ start đến end
-        dx = x2 - x1
-        dy = y2 - y1
-        
-        # Vector từ start đến point
-        dx0 = x - x1
-        dy0 = y - y1
-        
-        # Cross product để xác định side
-        cross = dx * dy0 - dy * dx0
-        return 1 if cross > 0 else -1
+        logger.info(f"Vehicle counter initialized with line: {self.start_point} -> {self.end_point}")
     
     def count_vehicles(
         self,
         tracked_objects: List[Dict],
-        previous_centroids: Dict[int, Tuple[float, float]]
+        previous_centroids: Optional[Dict[int, Tuple[float, float]]] = None
     ) -> Dict:
         """
         Đếm xe từ tracked objects
         
+        Đoạn chuyển động prev → curr của tất cả tracks được kiểm tra với counting line trong một lần
+        (segment_crossings), nên xe chạy nhanh nhảy qua line giữa hai frame vẫn được đếm.
+        
         Args:
-            tracked_objects: List tracked objects với track_id và centroid
-            previous_centroids: Dict {track_id: centroid} từ frame trước
+            tracked_objects: List tracked objects với track_id và centroid (hoặc TrackedObjects)
+            previous_centroids: Dict {track_id: centroid} từ frame trước,
+                None = dùng centroids của lần gọi trước
         
         Returns:
             Dict: {
@@ -149,37 +172,52 @@ class VehicleCounter:
                 'new_counts': List[Dict]  # List vehicles mới đếm được
             }
         """
-        new_counts = []
+        track_ids, centroids = _track_arrays(tracked_objects)
         
-        for obj in tracked_objects:
-            track_id = obj['track_id']
-            curr_centroid = obj['centroid']
-            
-            # Nếu đã đếm rồi thì skip
-            if track_id in self.counted_vehicles:
-                continue
+        if previous_centroids is None:
+            previous_ids, previous_points = self._previous_ids, self._previous_centroids
+        else:
+            previous_ids = np.fromiter(previous_centroids.keys(), dtype=np.int64, count=len(previous_centroids))
+            previous_points = np.array(list(previous_centroids.values()), dtype=np.float64).reshape(-1, 2)
+            order = np.argsort(previous_ids, kind='stable')
+            previous_ids, previous_points = previous_ids[order], previous_points[order]
+        
+        # Ghép track với centroid frame trước theo track ID (previous_ids đã sắp xếp)
+        new_counts = []
+        if len(track_ids) and len(previous_ids):
+            position = np.minimum(np.searchsorted(previous_ids, track_ids), len(previous_ids) - 1)
+            matched = np.flatnonzero(previous_ids[position] == track_ids)
+            signs = segment_crossings(
+                previous_points[position[matched]], centroids[matched], self.start_point, self.end_point
+            )
             
-            # Kiểm tra có centroid ở frame trước không
-            if track_id in previous_centroids:
-                prev_centroid = previous_centroids[track_id]
-                direction = self._is_crossing_line(prev_centroid, curr_centroid)
+            for index, sign in zip(matched[signs != 0].tolist(), signs[signs != 0].tolist()):
+                track_id = int(track_ids[index])
                 
-                if direction:
-                    # Đã vượt qua line
-                    self.counted_vehicles.add(track_id)
-                    
-                    if direction == 'up':
-                        self.count_up += 1
-                    else:
-                        self.count_down += 1
-                    
-                    new_counts.append({
-                        'track_id': track_id,
-                        'direction': direction,
-                        'class': obj.get('class', 'unknown')
-                    })
-                    
-                    logger.info(f"Vehicle {track_id} ({obj.get('class', 'unknown')}) crossed line: {direction}")
+                # Nếu đã đếm rồi thì skip
+                if track_id in self.counted_vehicles:
+                    continue
+                self.counted_vehicles.add(track_id)
+                
+                obj = tracked_objects[index]
+                direction = 'up' if sign == self._up_sign else 'down'
+                if direction == 'up':
+                    self.count_up += 1
+                else:
+                    self.count_down += 1
+                
+                new_counts.append({
+                    'track_id': track_id,
+                    'direction': direction,
+                    'class': obj.get('class', 'unknown')
+                })
+                
+                logger.info(f"Vehicle {track_id} ({obj.get('class', 'unknown')}) crossed line: {direction}")
+        
+        # Centroids frame này làm previous cho lần gọi sau
+        order = np.argsort(track_ids, kind='stable')
+        self._previous_ids = np.asarray(track_ids, dtype=np.int64)[order]
+        self._previous_centroids = np.asarray(centroids, dtype=np.float64).reshape(-1, 2)[order]
         
         return {
             'count_up': self.count_up,
@@ -188,14 +226,397 @@ class VehicleCounter:
             'new_counts': new_counts
         }
     
+    def set_line(self, start: Tuple[float, float], end: Tuple[float, float]):
+        """
+        Đổi vị trí counting line (ví dụ: bù camera shift), giữ nguyên counters
+        
+        Args:
+            start: Điểm đầu [x, y]
+            end: Điểm cuối [x, y]
+        """
+        self.start_point = tuple(start)
+        self.end_point = tuple(end)
+        self._up_sign = _up_sign(self.start_point, self.end_point, self.direction)
+        logger.debug(f"Counting line moved to: {self.start_point} -> {self.end_point}")
+    
     def reset(self):
         """Reset counters"""
         self.count_up = 0
         self.count_down = 0
         self.counted_vehicles.clear()
+        self._previous_ids = np.zeros(0, dtype=np.int64)
+        self._previous_centroids = np.zeros((0, 2))
         logger.info("Vehicle counter reset")
 
 
+class CountingEngine:
+    """
+    Đếm xe theo nhiều counting lines và zones cùng lúc, tách theo class và chiều
+    
+    Mỗi frame, đoạn chuyển động của tất cả tracks được kiểm tra với tất cả lines (segment_crossings
+    (N, L)) và centroids với tất cả zones (points_in_polygons (N, Z)) trong một lần. Counters:
+        line_counts: (L, C, 2) số xe theo (line, class, chiều), chiều 0 = up, 1 = down
+        zone_counts: (Z, C, 2) số xe theo (zone, class, 0 = vào / 1 = ra)
+        od_counts: (Z, Z, C) số xe đi từ zone origin (zone đầu tiên xe có mặt) đến zone destination
+    Mỗi track chỉ được đếm một lần cho mỗi line, mỗi lần vào/ra zone và một chuyến OD.
+    Class chưa có trong classes được thêm khi gặp (các counters mở rộng theo trục class).
+    """
+    
+    DIRECTIONS = ('up', 'down')
+    
+    def __init__(
+        self,
+        lines: Optional[List[Dict]] = None,
+        zones: Optional[List[Dict]] = None,
+        classes: Optional[List[str]] = None,
+        max_age: int = 30
+    ):
+        """
+        Args:
+            lines: List counting lines {'name', 'start': [x, y], 'end': [x, y], 'direction'}
+            zones: List zones {'name', 'points': [[x, y], ...]} (polygon, >= 3 điểm)
+            classes: Các class biết trước (thứ tự trục class của counters)
+            max_age: Số frames giữ trạng thái của track không xuất hiện (xe bị che / frame không detect)
+        """
+        self.lines = [dict(line) for line in (lines or [])]
+        self.zones = [dict(zone) for zone in (zones or [])]
+        for zone in self.zones:
+            if len(zone.get('points', [])) < 3:
+                raise ValueError(f"Zone {zone.get('name')} cần ít nhất 3 điểm")
+        self.line_names = [line.get('name', f"line_{idx}") for idx, line in enumerate(self.lines)]
+        self.zone_names = [zone.get('name', f"zone_{idx}") for idx, zone in enumerate(self.zones)]
+        self.classes: List[str] = []
+        self._class_index: Dict[str, int] = {}
+        self.max_age = max_age
+        
+        num_lines, num_zones = len(self.lines), len(self.zones)
+        self.line_counts = np.zeros((num_lines, 0, 2), dtype=np.int64)
+        self.zone_counts = np.zeros((num_zones, 0, 2), dtype=np.int64)
+        self.od_counts = np.zeros((num_zones, num_zones, 0), dtype=np.int64)
+        for name in classes or []:
+            self._class_id(name)
+        
+        self.set_geometry(
+            [(line['start'], line['end']) for line in self.lines],
+            [zone['points'] for zone in self.zones]
+        )
+        self._reset_state()
+        
+        logger.info(f"Counting engine initialized with {num_lines} lines, {num_zones} zones")
+    
+    def _reset_state(self):
+        """Trạng thái theo track, các arrays sắp xếp theo track ID"""
+        num_lines, num_zones = len(self.lines), len(self.zones)
+        self.frame_index = 0
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._centroids = np.zeros((0, 2))
+        self._last_seen = np.zeros(0, dtype=np.int64)
+        self._line_done = np.zeros((0, num_lines), dtype=bool)
+        self._inside = np.zeros((0, num_zones), dtype=bool)
+        self._entered = np.zeros((0, num_zones), dtype=bool)
+        self._exited = np.zeros((0, num_zones), dtype=bool)
+        self._origin = np.zeros(0, dtype=np.int32)
+        self._trip_done = np.zeros(0, dtype=bool)
+    
+    def set_geometry(self, line_points: List[Tuple], zone_points: List[List]):
+        """
+        Đổi vị trí lines/zones (ví dụ: bù camera shift), giữ nguyên counters và trạng thái tracks
+        
+        Args:
+            line_points: List (start, end) theo thứ tự lines
+            zone_points: List polygon points theo thứ tự zones
+        """
+        self._starts = np.array([start for start, _ in line_points], dtype=np.float64).reshape(-1, 2)
+        self._ends = np.array([end for _, end in line_points], dtype=np.float64).reshape(-1, 2)
+        self._up_signs = np.array([
+            _up_sign(start, end, line.get('direction', 'horizontal'))
+            for start, end, line in zip(self._starts, self._ends, self.lines)
+        ], dtype=np.int8)
+        self._polygons = [np.asarray(points, dtype=np.float64).reshape(-1, 2) for points in zone_points]
+    
+    def _class_id(self, name: str) -> int:
+        """Class id của tên class, mở rộng counters nếu là class mới"""
+        index = self._class_index.get(name)
+        if index is None:
+            index = self._class_index[name] = len(self.classes)
+            self.classes.append(name)
+            num_lines, num_zones = len(self.lines), len(self.zones)
+            self.line_counts = np.concatenate([self.line_counts, np.zeros((num_lines, 1, 2), dtype=np.int64)], axis=1)
+            self.zone_counts = np.concatenate([self.zone_counts, np.zeros((num_zones, 1, 2), dtype=np.int64)], axis=1)
+            self.od_counts = np.concatenate([self.od_counts, np.zeros((num_zones, num_zones, 1), dtype=np.int64)], axis=2)
+        return index
+    
+    def _class_ids(self, tracked_objects, rows: np.ndarray) -> np.ndarray:
+        """Class ids của các tracks có event (chỉ đọc class của vài tracks, không phải tất cả)"""
+        return np.array(
+            [self._class_id(tracked_objects[row].get('class', 'unknown')) for row in rows.tolist()],
+            dtype=np.int64
+        )
+    
+    def update(self, tracked_objects) -> Dict:
+        """
+        Cập nhật counters với tracked objects của một frame
+        
+        Args:
+            tracked_objects: List tracked objects với track_id, centroid, class (hoặc TrackedObjects)
+        
+        Returns:
+            Dict: {
+                'new_counts': List[Dict]  # {'track_id', 'line', 'direction', 'class'}
+                'new_trips': List[Dict]   # {'track_id', 'origin', 'destination', 'class'}
+            }
+        """
+        self.frame_index += 1
+        track_ids, centroids = _track_arrays(tracked_objects)
+        track_ids = np.asarray(track_ids, dtype=np.int64)
+        count = len(track_ids)
+        num_zones = len(self.zones)
+        
+        # Trạng thái của các tracks đã thấy trước đó (ghép theo track ID)
+        matched = np.zeros(count, dtype=bool)
+        previous = np.zeros(count, dtype=np.int64)
+        if count and len(self._ids):
+            previous = np.minimum(np.searchsorted(self._ids, track_ids), len(self._ids) - 1)
+            matched = self._ids[previous] == track_ids
+        matched_rows = np.flatnonzero(matched)
+        previous = previous[matched_rows]
+        
+        def carry(state, fill):
+            values = np.full((count,) + state.shape[1:], fill, dtype=state.dtype)
+            values[matched_rows] = state[previous]
+            return values
+        
+        line_done = carry(self._line_done, False)
+        was_inside = carry(self._inside, False)
+        entered = carry(self._entered, False)
+        exited = carry(self._exited, False)
+        origin = carry(self._origin, -1)
+        trip_done = carry(self._trip_done, False)
+        
+        # Lines: (M, L) với M tracks có vị trí trước đó
+        new_counts = []
+        if len(self.lines) and len(matched_rows):
+            signs = segment_crossings(self._centroids[previous], centroids[matched_rows], self._starts, self._ends)
+            rows, line_idx = np.nonzero((signs != 0) & ~line_done[matched_rows])
+            if len(rows):
+                directions = np.where(signs[rows, line_idx] == self._up_signs[line_idx], 0, 1)
+                rows = matched_rows[rows]
+                line_done[rows, line_idx] = True
+                class_ids = self._class_ids(tracked_objects, rows)
+                np.add.at(self.line_counts, (line_idx, class_ids, directions), 1)
+                for row, line, direction, class_id in zip(rows.tolist(), line_idx.tolist(), directions.tolist(), class_ids.tolist()):
+                    new_counts.append({
+                        'track_id': int(track_ids[row]),
+                        'line': self.line_names[line],
+                        'direction': self.DIRECTIONS[direction],
+                        'class': self.classes[class_id]
+                    })
+        
+        # Zones: (N, Z)
+        new_trips = []
+        inside = np.zeros((count, num_zones), dtype=bool)
+        if num_zones and count:
+            inside = points_in_polygons(centroids, self._polygons)
+            for column, events, done in ((0, inside & ~was_inside & matched[:, None], entered),
+                                         (1, ~inside & was_inside, exited)):
+                rows, zone_idx = np.nonzero(events & ~done)
+                if len(rows):
+                    done[rows, zone_idx] = True
+                    class_ids = self._class_ids(tracked_objects, rows)
+                    np.add.at(self.zone_counts, (zone_idx, class_ids, column), 1)
+            
+            # Destination = zone khác origin (origin đã có từ frame trước)
+            candidates = inside & (np.arange(num_zones) != origin[:, None]) & ((origin >= 0) & ~trip_done)[:, None]
+            rows = np.flatnonzero(candidates.any(axis=1))
+            if len(rows):
+                destinations = candidates[rows].argmax(axis=1)
+                trip_done[rows] = True
+                class_ids = self._class_ids(tracked_objects, rows)
+                np.add.at(self.od_counts, (origin[rows], destinations, class_ids), 1)
+                for row, destination, class_id in zip(rows.tolist(), destinations.tolist(), class_ids.tolist()):
+                    new_trips.append({
+                        'track_id': int(track_ids[row]),
+                        'origin': self.zone_names[origin[row]],
+                        'destination': self.zone_names[destination],
+                        'class': self.classes[class_id]
+                    })
+            
+            no_origin = (origin < 0) & inside.any(axis=1)
+            origin[no_origin] = inside[no_origin].argmax(axis=1)
+        
+        # Giữ trạng thái của tracks không có trong frame này thêm max_age frames
+        keep = self._last_seen >= self.frame_index - self.max_age
+        keep[previous] = False
+        ids = np.concatenate([track_ids, self._ids[keep]])
+        order = np.argsort(ids, kind='stable')
+        
+        def merge(current, state):
+            return np.concatenate([current, state[keep]])[order]
+        
+        self._ids = ids[order]
+        self._centroids = merge(np.asarray(centroids, dtype=np.float64).reshape(-1, 2), self._centroids)
+        self._last_seen = merge(np.full(count, self.frame_index, dtype=np.int64), self._last_seen)
+        self._line_done = merge(line_done, self._line_done)
+        self._inside = merge(inside, self._inside)
+        self._entered = merge(entered, self._entered)
+        self._exited = merge(exited, self._exited)
+        self._origin = merge(origin, self._origin)
+        self._trip_done = merge(trip_done, self._trip_done)
+        
+        for event in new_counts:
+            logger.info(f"Vehicle {event['track_id']} ({event['class']}) crossed {event['line']}: {event['direction']}")
+        
+        return {'new_counts': new_counts, 'new_trips': new_trips}
+    
+    def summary(self) -> Dict:
+        """
+        Counters dạng dict (để export JSON)
+        
+        Returns:
+            Dict: {
+                'classes': List[str],
+                'lines': {line: {class: {'up': int, 'down': int}}},
+                'zones': {zone: {class: {'entries': int, 'exits': int}}},
+                'od_matrix': {'zones': List[str], 'counts': (Z, Z) tổng mọi class, 'by_class': {class: (Z, Z)}}
+            }
+        """
+        return {
+            'classes': list(self.classes),
+            'lines': {
+                name: {
+                    cls: {'up': int(self.line_counts[line, idx, 0]), 'down': int(self.line_counts[line, idx, 1])}
+                    for idx, cls in enumerate(self.classes)
+                }
+                for line, name in enumerate(self.line_names)
+            },
+            'zones': {
+                name: {
+                    cls: {'entries': int(self.zone_counts[zone, idx, 0]), 'exits': int(self.zone_counts[zone, idx, 1])}
+                    for idx, cls in enumerate(self.classes)
+                }
+                for zone, name in enumerate(self.zone_names)
+            },
+            'od_matrix': {
+                'zones': list(self.zone_names),
+                'counts': self.od_counts.sum(axis=2).tolist(),
+                'by_class': {cls: self.od_counts[:, :, idx].tolist() for idx, cls in enumerate(self.classes)}
+            }
+        }
+    
+    def reset(self):
+        """Reset counters và trạng thái tracks"""
+        self.line_counts[:] = 0
+        self.zone_counts[:] = 0
+        self.od_counts[:] = 0
+        self._reset_state()
+        logger.info("Counting engine reset")
+
+
+class CountBins:
+    """
+    Gom các lần xe vượt line vào các bin thời gian cố định (theo thời gian video), trong bộ nhớ
+    
+    counts: (L, C, 2) số xe của bin hiện tại theo (line, class, chiều), chiều 0 = up, 1 = down.
+    Khi thời gian vượt qua cuối bin, bin được đóng thành các rows (mỗi line × class một row, kể cả
+    count = 0 để report có đủ các khoảng thời gian) để caller ghi vào database một lần.
+    """
+    
+    def __init__(self, bin_seconds: float = 300.0, lines: Optional[List[str]] = None, classes: Optional[List[str]] = None):
+        """
+        Args:
+            bin_seconds: Độ dài mỗi bin (giây video, ví dụ 60, 300, 900)
+            lines: Tên các lines biết trước
+            classes: Các class biết trước
+        """
+        if bin_seconds <= 0:
+            raise ValueError(f"bin_seconds phải > 0: {bin_seconds}")
+        self.bin_seconds = float(bin_seconds)
+        self.lines: List[str] = []
+        self.classes: List[str] = []
+        self._line_index: Dict[str, int] = {}
+        self._class_index: Dict[str, int] = {}
+        self.counts = np.zeros((0, 0, 2), dtype=np.int64)
+        self.current_bin: Optional[int] = None  # Index của bin đang mở (None = chưa có frame nào)
+        for name in lines or []:
+            self._line_id(name)
+        for name in classes or []:
+            self._class_id(name)
+    
+    def _line_id(self, name: str) -> int:
+        index = self._line_index.get(name)
+        if index is None:
+            index = self._line_index[name] = len(self.lines)
+            self.lines.append(name)
+            self.counts = np.concatenate([self.counts, np.zeros((1, len(self.classes), 2), dtype=self.counts.dtype)], axis=0)
+        return index
+    
+    def _class_id(self, name: str) -> int:
+        index = self._class_index.get(name)
+        if index is None:
+            index = self._class_index[name] = len(self.classes)
+            self.classes.append(name)
+            self.counts = np.concatenate([self.counts, np.zeros((len(self.lines), 1, 2), dtype=self.counts.dtype)], axis=1)
+        return index
+    
+    def add(self, events: List[Dict], line: Optional[str] = None):
+        """
+        Cộng các lần vượt line vào bin hiện tại
+        
+        Args:
+            events: new_counts của VehicleCounter / CountingEngine ({'direction', 'class', 'line'?})
+            line: Tên line cho các events không có 'line' (VehicleCounter)
+        """
+        for event in events:
+            line_id = self._line_id(event.get('line', line))
+            class_id = self._class_id(event.get('class', 'unknown'))
+            self.counts[line_id, class_id, 0 if event['direction'] == 'up' else 1] += 1
+    
+    def _close(self) -> List[Dict]:
+        """Rows của bin hiện tại, sau đó reset counts"""
+        bin_start = self.current_bin * self.bin_seconds
+        rows = [
+            {
+                'bin_start': bin_start,
+                'bin_end': bin_start + self.bin_seconds,
+                'line': line,
+                'class': cls,
+                'count_up': int(self.counts[line_id, class_id, 0]),
+                'count_down': int(self.counts[line_id, class_id, 1])
+            }
+            for line_id, line in enumerate(self.lines)
+            for class_id, cls in enumerate(self.classes)
+        ]
+        self.counts[:] = 0
+        return rows
+    
+    def advance(self, time: float) -> List[Dict]:
+        """
+        Chuyển đến thời điểm time (giây video), đóng các bins đã kết thúc
+        
+        Gọi trước add() cho mỗi frame. Các bins không có frame nào ở giữa (ví dụ frames trùng bị bỏ qua)
+        cũng được đóng với count = 0.
+        
+        Returns:
+            List[Dict]: Rows của các bins vừa đóng {'bin_start', 'bin_end', 'line', 'class', 'count_up', 'count_down'}
+        """
+        index = int(np.floor(time / self.bin_seconds))
+        if self.current_bin is None:
+            self.current_bin = index
+        rows = []
+        while self.current_bin < index:
+            rows.extend(self._close())
+            self.current_bin += 1
+        return rows
+    
+    def flush(self) -> List[Dict]:
+        """Đóng bin đang mở (cuối video), bin tiếp theo bắt đầu lại từ frame kế tiếp"""
+        if self.current_bin is None:
+            return []
+        rows = self._close()
+        self.current_bin = None
+        return rows
+
+
 def count_vehicles(
     tracked_objects: List[Dict],
     counting_line: Dict,
@@ -208,7 +629,7 @@ def count_vehicles(
     Args:
         tracked_objects: List tracked objects
         counting_line: Counting line config
-        previous_centroids: Centroids từ frame trước
+        previous_centroids: Centroids từ frame trước (None = centroids counter đã thấy ở lần gọi trước)
         counter: VehicleCounter instance (nếu None sẽ tạo mới)
     
     Returns:
@@ -217,9 +638,6 @@ def count_vehicles(
     if counter is None:
         counter = VehicleCounter(counting_line)
     
-    if previous_centroids is None:
-        previous_centroids = {}
-    
     result = counter.count_vehicles(tracked_objects, previous_centroids)
     return result, counter
 
@@ -0,0 +1,153 @@
+"""
+Database Connection Manager
+Quản lý kết nối SQLite dùng chung: mỗi (thread, database file) giữ một
+connection persistent với WAL mode và các PRAGMA đã tune
+"""
+import os
+import sqlite3
+import threading
+import logging
+from pathlib import Path
+from typing import Dict, Tuple
+
+logger = logging.getLogger(__name__)
+
+# PRAGMA áp dụng cho mỗi connection mới
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',        # Reader không block writer, commit không rewrite journal
+    'synchronous': 'NORMAL',      # An toàn với WAL, bỏ fsync ở mỗi commit
+    'mmap_size': 268435456,       # 256MB memory-mapped I/O
+    'cache_size': -65536,         # 64MB page cache (số âm = KiB)
+    'temp_store': 'MEMORY',
+    'busy_timeout': 5000          # ms, chờ lock thay vì lỗi "database is locked"
+}
+
+_local = threading.local()
+_registry_lock = threading.Lock()
+_registry: Dict[Tuple[int, str], sqlite3.Connection] = {}
+_generation = 0  # Tăng mỗi khi close_all_connections để các thread tự đóng connection cũ của mình
+
+
+def _normalize_path(db_path: str) -> str:
+    """Chuẩn hóa đường dẫn để cùng một file luôn dùng chung key"""
+    return os.path.abspath(db_path)
+
+
+def _apply_pragmas(conn: sqlite3.Connection):
+    """Áp dụng DEFAULT_PRAGMAS cho connection"""
+    cursor = conn.cursor()
+    for name, value in DEFAULT_PRAGMAS.items():
+        cursor.execute(f'PRAGMA {name}={value}')
+    cursor.close()
+
+
+def _prune_dead_threads():
+    """Đóng các connection của thread đã kết thúc (ví dụ: job thread của web app)"""
+    alive = {thread.ident for thread in threading.enumerate()}
+    with _registry_lock:
+        dead_keys = [key for key in _registry if key[0] not in alive]
+        for key in dead_keys:
+            try:
+                _registry.pop(key).close()
+            except sqlite3.Error as e:
+                logger.debug(f"Error closing stale connection {key[1]}: {e}")
+
+
+def _close_local_connections():
+    """Đóng tất cả connections của thread hiện tại"""
+    connections = getattr(_local, 'connections', None) or {}
+    ident = threading.get_ident()
+    with _registry_lock:
+        for key in connections:
+            _registry.pop((ident, key), None)
+    for key, conn in connections.items():
+        try:
+            conn.close()
+        except sqlite3.Error as e:
+            logger.debug(f"Error closing connection {key}: {e}")
+    connections.clear()
+
+
+def get_connection(db_path: str) -> sqlite3.Connection:
+    """
+    Lấy connection persistent cho database file trong thread hiện tại
+    
+    Connection được tạo một lần cho mỗi (thread, db_path) và dùng lại cho các
+    lần gọi sau. Caller KHÔNG được close connection, chỉ cần commit.
+    Connection đã cache được trả về ngay (không stat file); trước khi xóa DB file
+    hãy gọi close_connection() / close_all_connections().
+    
+    Args:
+        db_path: Đường dẫn đến database
+    
+    Returns:
+        sqlite3.Connection: Connection đã cấu hình WAL và PRAGMA
+    """
+    key = _normalize_path(db_path)
+    connections = getattr(_local, 'connections', None)
+    if connections is None or getattr(_local, 'generation', None) != _generation:
+        # close_all_connections() ở thread khác: thread này tự đóng connections cũ của mình
+        _close_local_connections()
+        connections = _local.connections = {}
+        _local.generation = _generation
+    
+    conn = connections.get(key)
+    if conn is not None:
+        return conn
+    
+    _prune_dead_threads()
+    
+    if not os.path.exists(key):
+        Path(key).parent.mkdir(parents=True, exist_ok=True)
+        logger.debug(f"Creating database file: {key}")
+    conn = sqlite3.connect(key, check_same_thread=False)
+    _apply_pragmas(conn)
+    
+    connections[key] = conn
+    with _registry_lock:
+        _registry[(threading.get_ident(), key)] = conn
+    
+    logger.debug(f"Opened persistent connection: {key}")
+    return conn
+
+
+def close_connection(db_path: str):
+    """
+    Đóng connection của thread hiện tại cho database file
+    
+    Args:
+        db_path: Đường dẫn đến database
+    """
+    key = _normalize_path(db_path)
+    connections = getattr(_local, 'connections', None)
+    if connections is not None:
+        connections.pop(key, None)
+    
+    with _registry_lock:
+        conn = _registry.pop((threading.get_ident(), key), None)
+    
+    if conn is not None:
+        try:
+            conn.close()
+        except sqlite3.Error as e:
+            logger.debug(f"Error closing connection {key}: {e}")
+
+
+def close_all_connections():
+    """
+    Đóng connections của thread hiện tại (và của các thread đã kết thúc), dùng khi shutdown
+    hoặc trước khi xóa DB file
+    
+    Connections của các thread khác đang chạy không bị đóng từ đây (thread đó có thể đang dùng):
+    chúng được đánh dấu cũ và chính thread sở hữu sẽ đóng ở lần gọi get_connection() tiếp theo.
+    """
+    global _generation
+    with _registry_lock:
+        _generation += 1
+    
+    count = len(getattr(_local, 'connections', None) or {})
+    _close_local_connections()
+    _local.generation = _generation
+    _prune_dead_threads()
+    
+    logger.debug(f"Closed {count} database connections, marked connections of other threads stale")
@@ -0,0 +1,490 @@
+"""
+Detection Backends
+Các inference backend cho VehicleDetector: PyTorch (Ultralytics), ONNX Runtime, OpenVINO
+"""
+import os
+import logging
+from abc import ABC, abstractmethod
+import cv2
+import numpy as np
+from pathlib import Path
+from typing import List, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Tên backend hỗ trợ (dùng trong config 'detector.backend')
+AVAILABLE_BACKENDS = ('torch', 'onnx', 'openvino')
+
+
+def empty_detection_arrays() -> Dict[str, np.ndarray]:
+    """Detection arrays rỗng"""
+    return {
+        'boxes': np.zeros((0, 4), dtype=np.float32),
+        'scores': np.zeros(0, dtype=np.float32),
+        'class_ids': np.zeros(0, dtype=np.int32)
+    }
+
+
+def box_iou(boxes_a: np.ndarray, boxes_b: np.ndarray) -> np.ndarray:
+    """
+    IoU giữa 2 tập boxes [x1, y1, x2, y2]
+    
+    Returns:
+        np.ndarray: Ma trận IoU (len(boxes_a), len(boxes_b))
+    """
+    boxes_a = np.asarray(boxes_a, dtype=np.float32).reshape(-1, 4)
+    boxes_b = np.asarray(boxes_b, dtype=np.float32).reshape(-1, 4)
+    
+    top_left = np.maximum(boxes_a[:, None, :2], boxes_b[None, :, :2])
+    bottom_right = np.minimum(boxes_a[:, None, 2:], boxes_b[None, :, 2:])
+    intersection = np.clip(bottom_right - top_left, 0, None).prod(axis=2)
+    
+    area_a = (boxes_a[:, 2] - boxes_a[:, 0]) * (boxes_a[:, 3] - boxes_a[:, 1])
+    area_b = (boxes_b[:, 2] - boxes_b[:, 0]) * (boxes_b[:, 3] - boxes_b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - intersection
+    return intersection / np.maximum(union, 1e-9)
+
+
+def box_ios(boxes_a: np.ndarray, boxes_b: np.ndarray) -> np.ndarray:
+    """
+    Intersection over smaller area giữa 2 tập boxes [x1, y1, x2, y2]
+    
+    Khác IoU, box bị cắt ở mép tile (nằm gọn trong box đầy đủ) vẫn cho giá trị gần 1.
+    
+    Returns:
+        np.ndarray: Ma trận IoS (len(boxes_a), len(boxes_b))
+    """
+    boxes_a = np.asarray(boxes_a, dtype=np.float32).reshape(-1, 4)
+    boxes_b = np.asarray(boxes_b, dtype=np.float32).reshape(-1, 4)
+    
+    top_left = np.maximum(boxes_a[:, None, :2], boxes_b[None, :, :2])
+    bottom_right = np.minimum(boxes_a[:, None, 2:], boxes_b[None, :, 2:])
+    intersection = np.clip(bottom_right - top_left, 0, None).prod(axis=2)
+    
+    area_a = (boxes_a[:, 2] - boxes_a[:, 0]) * (boxes_a[:, 3] - boxes_a[:, 1])
+    area_b = (boxes_b[:, 2] - boxes_b[:, 0]) * (boxes_b[:, 3] - boxes_b[:, 1])
+    smaller = np.minimum(area_a[:, None], area_b[None, :])
+    return intersection / np.maximum(smaller, 1e-9)
+
+
+def merge_detection_arrays(arrays_list: List[Dict[str, np.ndarray]], ios_threshold: float = 0.5) -> Dict[str, np.ndarray]:
+    """
+    Gộp detections từ nhiều nguồn (full frame + các tile) bằng NMS theo class
+    
+    Dùng IoS thay vì IoU để loại các mảnh xe bị cắt ở mép tile.
+    
+    Args:
+        arrays_list: List detection arrays (cùng hệ tọa độ ảnh gốc)
+        ios_threshold: IoS tối thiểu để coi 2 boxes là cùng một xe
+    
+    Returns:
+        Dict[str, np.ndarray]: Detection arrays đã gộp, sort theo score giảm dần
+    """
+    arrays_list = [arrays for arrays in arrays_list if len(arrays['boxes']) > 0]
+    if not arrays_list:
+        return empty_detection_arrays()
+    
+    boxes = np.concatenate([arrays['boxes'] for arrays in arrays_list]).astype(np.float32)
+    scores = np.concatenate([arrays['scores'] for arrays in arrays_list]).astype(np.float32)
+    class_ids = np.concatenate([arrays['class_ids'] for arrays in arrays_list]).astype(np.int32)
+    
+    order = np.argsort(-scores, kind='stable')
+    boxes, scores, class_ids = boxes[order], scores[order], class_ids[order]
+    
+    overlap = box_ios(boxes, boxes)
+    overlap[class_ids[:, None] != class_ids[None, :]] = 0.0
+    
+    # Greedy: box score cao giữ lại, suppress các box cùng class chồng lên nó
+    keep = np.ones(len(boxes), dtype=bool)
+    for i in range(len(boxes)):
+        if keep[i]:
+            suppressed = overlap[i] >= ios_threshold
+            suppressed[:i + 1] = False
+            keep &= ~suppressed
+    
+    return {'boxes': boxes[keep], 'scores': scores[keep], 'class_ids': class_ids[keep]}
+
+
+def detection_recall(
+    reference: Dict[str, np.ndarray],
+    candidate: Dict[str, np.ndarray],
+    iou_threshold: float = 0.5
+) -> Tuple[int, int]:
+    """
+    Đếm số detections của reference được candidate tìm lại (IoU-matched, cùng class)
+    
+    Args:
+        reference: Detection arrays chuẩn (ví dụ: model FP32 / backend torch)
+        candidate: Detection arrays cần so sánh
+        iou_threshold: IoU tối thiểu để coi là match
+    
+    Returns:
+        Tuple[int, int]: (matched, total reference detections)
+    """
+    total = len(reference['boxes'])
+    if total == 0 or len(candidate['boxes']) == 0:
+        return 0, total
+    
+    iou = box_iou(reference['boxes'], candidate['boxes'])
+    iou[reference['class_ids'][:, None] != candidate['class_ids'][None, :]] = 0.0
+    
+    # Greedy match theo IoU giảm dần, mỗi candidate chỉ match một lần
+    matched = 0
+    used = np.zeros(iou.shape[1], dtype=bool)
+    for ref_idx in np.argsort(-iou.max(axis=1)):
+        candidates = np.where(~used & (iou[ref_idx] >= iou_threshold))[0]
+        if len(candidates) > 0:
+            best = candidates[np.argmax(iou[ref_idx, candidates])]
+            used[best] = True
+            matched += 1
+    return matched, total
+
+
+def letterbox(image: np.ndarray, imgsz: int = 640) -> Tuple[np.ndarray, float, Tuple[int, int]]:
+    """
+    Resize giữ tỉ lệ và pad về imgsz x imgsz (giống Ultralytics, màu pad 114)
+    
+    Returns:
+        Tuple: (ảnh đã letterbox, ratio, (pad_x, pad_y))
+    """
+    h, w = image.shape[:2]
+    ratio = min(imgsz / h, imgsz / w)
+    new_w, new_h = int(round(w * ratio)), int(round(h * ratio))
+    pad_x = (imgsz - new_w) / 2
+    pad_y = (imgsz - new_h) / 2
+    
+    if (w, h) != (new_w, new_h):
+        image = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    
+    top, bottom = int(round(pad_y - 0.1)), int(round(pad_y + 0.1))
+    left, right = int(round(pad_x - 0.1)), int(round(pad_x + 0.1))
+    image = cv2.copyMakeBorder(image, top, bottom, left, right, cv2.BORDER_CONSTANT, value=(114, 114, 114))
+    return image, ratio, (left, top)
+
+
+def preprocess_batch(images: List[np.ndarray], imgsz: int = 640) -> Tuple[np.ndarray, List]:
+    """
+    Letterbox + BGR→RGB + HWC→CHW + normalize [0, 1] cho cả batch
+    
+    Returns:
+        Tuple: (batch (B, 3, imgsz, imgsz) float32, meta [(ratio, pad, (h, w))] cho mỗi ảnh)
+    """
+    batch = np.empty((len(images), 3, imgsz, imgsz), dtype=np.float32)
+    meta = []
+    for i, image in enumerate(images):
+        boxed, ratio, pad = letterbox(image, imgsz)
+        batch[i] = boxed[:, :, ::-1].transpose(2, 0, 1)
+        meta.append((ratio, pad, image.shape[:2]))
+    batch *= 1.0 / 255.0
+    return batch, meta
+
+
+class DetectionBackend(ABC):
+    """Interface chung của các inference backend"""
+    
+    name = None
+    
+    @abstractmethod
+    def predict(self, images: List[np.ndarray], class_ids: List[int]) -> List[Dict[str, np.ndarray]]:
+        """
+        Chạy inference cho list ảnh BGR
+        
+        Args:
+            images: List các image arrays
+            class_ids: COCO class IDs cần giữ lại
+        
+        Returns:
+            List[Dict[str, np.ndarray]]: Detection arrays cho mỗi ảnh
+        """
+
+
+class TorchBackend(DetectionBackend):
+    """Backend PyTorch eager qua Ultralytics YOLO"""
+    
+    name = 'torch'
+    
+    def __init__(
+        self,
+        model_path: str = 'yolov8n.pt',
+        conf_threshold: float = 0.25,
+        iou_threshold: Optional[float] = None,
+        imgsz: Optional[int] = None,
+        max_detections: Optional[int] = None,
+        device: Optional[str] = None
+    ):
+        """
+        Args:
+            model_path: Đường dẫn đến YOLO model (.pt hoặc tên model từ ultralytics)
+            conf_threshold: Confidence threshold
+            iou_threshold: IoU threshold cho NMS (None = mặc định của Ultralytics)
+            imgsz: Kích thước input của model (None = mặc định của Ultralytics)
+            max_detections: Số detections tối đa mỗi ảnh (None = mặc định của Ultralytics)
+            device: Torch device ('cpu', '0', ...), None = tự chọn
+        """
+        # Import lazy: chỉ backend torch mới cần torch/ultralytics
+        from ultralytics import YOLO
+        
+        self.model = YOLO(model_path)
+        self.conf_threshold = conf_threshold
+        
+        # Tham số truyền thẳng cho model.predict (bỏ các giá trị None)
+        options = {'iou': iou_threshold, 'imgsz': imgsz, 'max_det': max_detections, 'device': device}
+        self.predict_kwargs = {name: value for name, value in options.items() if value is not None}
+    
+    def predict(self, images: List[np.ndarray], class_ids: List[int]) -> List[Dict[str, np.ndarray]]:
+        """
+        Chạy inference cho list ảnh BGR
+        
+        Args:
+            images: List các image arrays
+            class_ids: COCO class IDs cần giữ lại (lọc trong NMS)
+        
+        Returns:
+            List[Dict[str, np.ndarray]]: Detection arrays cho mỗi ảnh
+        """
+        results = self.model.predict(
+            images, conf=self.conf_threshold, classes=class_ids, verbose=False, **self.predict_kwargs
+        )
+        return [self._result_to_arrays(result, class_ids) for result in results]
+    
+    def _result_to_arrays(self, result, class_ids: List[int]) -> Dict[str, np.ndarray]:
+        """Chuyển một YOLO result thành detection arrays (một lần copy cho mỗi field)"""
+        boxes = result.boxes
+        if boxes is None or len(boxes) == 0:
+            return empty_detection_arrays()
+        
+        xyxy = boxes.xyxy.cpu().numpy().astype(np.float32, copy=False)
+        scores = boxes.conf.cpu().numpy().astype(np.float32, copy=False)
+        labels = boxes.cls.cpu().numpy().astype(np.int32)
+        
+        # Model đã lọc theo classes, giữ lại check cho chắc chắn
+        keep = np.isin(labels, class_ids)
+        return {
+            'boxes': xyxy[keep],
+            'scores': scores[keep],
+            'class_ids': labels[keep]
+        }
+
+
+class _ExportedModelBackend(DetectionBackend):
+    """
+    Base class cho backend chạy model YOLOv8 đã export (ONNX, OpenVINO)
+    
+    Tự làm letterbox preprocessing và NMS, output giống TorchBackend.
+    """
+    
+    name = 'exported'
+    export_format = None
+    
+    def __init__(
+        self,
+        model_path: str = 'yolov8n.pt',
+        conf_threshold: float = 0.25,
+        iou_threshold: float = 0.45,
+        imgsz: int = 640,
+        max_detections: int = 300
+    ):
+        """
+        Args:
+            model_path: Model .pt (sẽ export và cache bên cạnh) hoặc model đã export
+            conf_threshold: Confidence threshold
+            iou_threshold: IoU threshold cho NMS
+            imgsz: Kích thước input của model (vuông)
+            max_detections: Số detections tối đa mỗi ảnh
+        """
+        self.conf_threshold = conf_threshold
+        self.iou_threshold = iou_threshold
+        self.imgsz = imgsz
+        self.max_detections = max_detections
+        self.exported_path = self._ensure_exported(model_path)
+        self._load(self.exported_path)
+        logger.info(f"{self.name} backend loaded: {self.exported_path}")
+    
+    @abstractmethod
+    def _exported_path_for(self, model_path: str) -> str:
+        """Đường dẫn cache của model export (bên cạnh file .pt)"""
+    
+    @abstractmethod
+    def _load(self, exported_path: str):
+        """Load model đã export"""
+    
+    @abstractmethod
+    def _run(self, batch: np.ndarray) -> np.ndarray:
+        """Chạy model với input (B, 3, imgsz, imgsz), trả về raw output (B, 4 + nc, N)"""
+    
+    def _ensure_exported(self, model_path: str) -> str:
+        """Export model .pt sang format của backend nếu chưa có trong cache"""
+        if not model_path.endswith('.pt'):
+            return model_path
+        
+        exported_path = self._exported_path_for(model_path)
+        if os.path.exists(exported_path):
+            return exported_path
+        
+        logger.info(f"Exporting {model_path} to {self.export_format} (one-time)...")
+        from ultralytics import YOLO
+        
+        output_path = YOLO(model_path).export(
+            format=self.export_format, imgsz=self.imgsz, dynamic=True
+        )
+        return str(output_path)
+    
+    def _preprocess(self, images: List[np.ndarray]) -> Tuple[np.ndarray, List]:
+        """Letterbox + normalize cho cả batch"""
+        return preprocess_batch(images, self.imgsz)
+    
+    def _postprocess(self, output: np.ndarray, meta, class_ids: List[int]) -> Dict[str, np.ndarray]:
+        """Decode output một ảnh (4 + nc, N) → filter conf → NMS theo class → tọa độ gốc"""
+        ratio, (pad_x, pad_y), (h, w) = meta
+        preds = output.T  # (N, 4 + nc)
+        
+        class_scores = preds[:, 4:][:, class_ids]
+        best = class_scores.argmax(axis=1)
+        scores = class_scores[np.arange(len(best)), best]
+        
+        keep = scores >= self.conf_threshold
+        if not np.any(keep):
+            return empty_detection_arrays()
+        
+        cxcywh = preds[keep, :4]
+        scores = scores[keep].astype(np.float32)
+        labels = np.asarray(class_ids, dtype=np.int32)[best[keep]]
+        
+        # cx, cy, w, h → x, y, w, h (cho NMS) và x1, y1, x2, y2
+        xywh = cxcywh.copy()
+        xywh[:, 0] -= xywh[:, 2] / 2
+        xywh[:, 1] -= xywh[:, 3] / 2
+        
+        indices = cv2.dnn.NMSBoxesBatched(
+            xywh.tolist(), scores.tolist(), labels.tolist(), self.conf_threshold, self.iou_threshold
+        )
+        indices = np.asarray(indices, dtype=np.int64).reshape(-1)[:self.max_detections]
+        
+        boxes = xywh[indices]
+        boxes[:, 2] += boxes[:, 0]
+        boxes[:, 3] += boxes[:, 1]
+        
+        # Bỏ letterbox, về tọa độ ảnh gốc
+        boxes[:, [0, 2]] = (boxes[:, [0, 2]] - pad_x) / ratio
+        boxes[:, [1, 3]] = (boxes[:, [1, 3]] - pad_y) / ratio
+        boxes[:, [0, 2]] = np.clip(boxes[:, [0, 2]], 0, w)
+        boxes[:, [1, 3]] = np.clip(boxes[:, [1, 3]], 0, h)
+        
+        return {
+            'boxes': boxes.astype(np.float32),
+            'scores': scores[indices],
+            'class_ids': labels[indices]
+        }
+    
+    def predict(self, images: List[np.ndarray], class_ids: List[int]) -> List[Dict[str, np.ndarray]]:
+        """
+        Chạy inference cho list ảnh BGR
+        
+        Args:
+            images: List các image arrays
+            class_ids: COCO class IDs cần giữ lại
+        
+        Returns:
+            List[Dict[str, np.ndarray]]: Detection arrays cho mỗi ảnh
+        """
+        if not images:
+            return []
+        batch, meta = self._preprocess(images)
+        outputs = self._run(batch)
+        return [self._postprocess(outputs[i], meta[i], class_ids) for i in range(len(images))]
+
+
+class OnnxBackend(_ExportedModelBackend):
+    """Backend ONNX Runtime (CPU)"""
+    
+    name = 'onnx'
+    export_format = 'onnx'
+    
+    def __init__(self, *args, providers: Optional[List[str]] = None, num_threads: int = 0, **kwargs):
+        """
+        Args:
+            providers: ONNX Runtime execution providers (None = CPUExecutionProvider)
+            num_threads: Số threads intra-op (0 = mặc định của ONNX Runtime)
+        """
+        self.providers = providers or ['CPUExecutionProvider']
+        self.num_threads = num_threads
+        super().__init__(*args, **kwargs)
+    
+    def _exported_path_for(self, model_path: str) -> str:
+        return str(Path(model_path).with_suffix('.onnx'))
+    
+    def _load(self, exported_path: str):
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            raise ImportError("onnxruntime is required for the 'onnx' backend: pip install onnxruntime")
+        
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if self.num_threads > 0:
+            options.intra_op_num_threads = self.num_threads
+        
+        self.session = ort.InferenceSession(exported_path, sess_options=options, providers=self.providers)
+        self.input_name = self.session.get_inputs()[0].name
+    
+    def _run(self, batch: np.ndarray) -> np.ndarray:
+        return self.session.run(None, {self.input_name: batch})[0]
+
+
+class OpenVinoBackend(_ExportedModelBackend):
+    """Backend OpenVINO (CPU)"""
+    
+    name = 'openvino'
+    export_format = 'openvino'
+    
+    def __init__(self, *args, device: str = 'CPU', **kwargs):
+        """
+        Args:
+            device: OpenVINO device (default: CPU)
+        """
+        self.device = device
+        super().__init__(*args, **kwargs)
+    
+    def _exported_path_for(self, model_path: str) -> str:
+        return str(Path(model_path).with_suffix('')) + '_openvino_model'
+    
+    def _load(self, exported_path: str):
+        try:
+            import openvino as ov
+        except ImportError:
+            raise ImportError("openvino is required for the 'openvino' backend: pip install openvino")
+        
+        xml_path = exported_path
+        if os.path.isdir(exported_path):
+            xml_path = str(next(Path(exported_path).glob('*.xml')))
+        
+        core = ov.Core()
+        self.compiled_model = core.compile_model(core.read_model(xml_path), self.device)
+        self.output = self.compiled_model.output(0)
+    
+    def _run(self, batch: np.ndarray) -> np.ndarray:
+        return self.compiled_model(batch)[self.output]
+
+
+def create_backend(backend: str = 'torch', model_path: str = 'yolov8n.pt', conf_threshold: float = 0.25, **kwargs):
+    """
+    Tạo inference backend theo tên
+    
+    Args:
+        backend: 'torch', 'onnx' hoặc 'openvino'
+        model_path: Đường dẫn đến model
+        conf_threshold: Confidence threshold
+        **kwargs: Tham số riêng của backend (imgsz, iou_threshold, providers, ...),
+            tham số backend không hỗ trợ sẽ raise TypeError
+    
+    Returns:
+        DetectionBackend: Backend instance có method predict(images, class_ids)
+    """
+    backends = {
+        'torch': TorchBackend,
+        'onnx': OnnxBackend,
+        'openvino': OpenVinoBackend
+    }
+    if backend not in backends:
+        raise ValueError(f"Unknown detector backend: {backend} (available: {', '.join(AVAILABLE_BACKENDS)})")
+    return backends[backend](model_path=model_path, conf_threshold=conf_threshold, **kwargs)
@@ -0,0 +1,198 @@
+"""
+Detection Cache
+Cache detections trên đĩa theo (video fingerprint, segment, frame index, model, conf)
+để chạy lại pipeline với counting line / tracker khác không phải chạy lại YOLO
+"""
+import os
+import json
+import zlib
+import hashlib
+import logging
+import numpy as np
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from detection_backends import empty_detection_arrays
+
+logger = logging.getLogger(__name__)
+
+
+def video_fingerprint(video_path: str, block_size: int = 1 << 20) -> str:
+    """
+    Fingerprint nội dung video (kích thước + block đầu + block cuối)
+    
+    Không hash cả file để video vài GB vẫn tính tức thì; đổi tên/copy file vẫn giữ fingerprint.
+    
+    Args:
+        video_path: Đường dẫn video
+        block_size: Số bytes đọc ở đầu và cuối file
+    
+    Returns:
+        str: Fingerprint (hex, 16 ký tự)
+    """
+    size = os.path.getsize(video_path)
+    digest = hashlib.sha1(str(size).encode())
+    with open(video_path, 'rb') as f:
+        digest.update(f.read(block_size))
+        if size > block_size:
+            f.seek(max(block_size, size - block_size))
+            digest.update(f.read(block_size))
+    return digest.hexdigest()[:16]
+
+
+def model_key(model_path: str, conf_threshold: float, **settings) -> str:
+    """
+    Key định danh model + settings ảnh hưởng đến detections
+    
+    Thời gian sửa / kích thước file model được đưa vào key nên cập nhật weights sẽ invalidate cache.
+    
+    Args:
+        model_path: Đường dẫn model
+        conf_threshold: Confidence threshold
+        **settings: Các settings khác (backend, imgsz, slicing, ...)
+    
+    Returns:
+        str: Key (hex, 16 ký tự)
+    """
+    stat = None
+    if os.path.exists(model_path):
+        st = os.stat(model_path)
+        stat = [st.st_size, int(st.st_mtime)]
+    payload = json.dumps(
+        {'model': os.path.basename(model_path), 'stat': stat, 'conf': float(conf_threshold), **settings},
+        sort_keys=True, default=str
+    )
+    return hashlib.sha1(payload.encode()).hexdigest()[:16]
+
+
+def config_tag(*parts) -> int:
+    """
+    Tag 32-bit cho cấu hình ảnh hưởng tới input của detector (ROI, class filter, ...)
+    
+    Returns:
+        int: CRC32 của parts
+    """
+    return zlib.crc32(json.dumps(parts, sort_keys=True, default=str).encode()) & 0xFFFFFFFF
+
+
+class DetectionCache:
+    """
+    Cache detections theo segment, mỗi segment là một file .npz
+    
+    Layout file: frame_indices (M,), tags (M,), offsets (M + 1,) trỏ vào
+    boxes (K, 4), scores (K,), class_ids (K,) nối liền của tất cả frames.
+    """
+    
+    def __init__(self, cache_dir: str = 'data/detection_cache'):
+        """
+        Args:
+            cache_dir: Thư mục lưu cache
+        """
+        self.cache_dir = Path(cache_dir)
+        self._path = None
+        self._entries: Dict[int, Tuple[int, Dict[str, np.ndarray]]] = {}
+        self._dirty = False
+        self.hits = 0
+        self.misses = 0
+    
+    def open_segment(self, video_fingerprint: str, segment_key: str, model_key: str):
+        """
+        Mở cache của một segment (lưu segment đang mở trước đó nếu có thay đổi)
+        
+        Args:
+            video_fingerprint: Fingerprint video gốc
+            segment_key: Định danh segment trong video (ví dụ: '300s_0002')
+            model_key: Key của model (xem model_key())
+        """
+        self.close()
+        self._path = self.cache_dir / video_fingerprint / f"{segment_key}_{model_key}.npz"
+        self._entries = self._load(self._path)
+        self.hits = self.misses = 0
+        if self._entries:
+            logger.info(f"Loaded {len(self._entries)} cached detections from {self._path}")
+    
+    def lookup(self, frame_index: int, tag: int = 0) -> Optional[Dict[str, np.ndarray]]:
+        """
+        Tìm detections đã cache của frame
+        
+        Args:
+            frame_index: Index của frame trong segment
+            tag: Tag cấu hình input (xem config_tag()), khác tag = miss
+        
+        Returns:
+            Optional[Dict[str, np.ndarray]]: Detection arrays hoặc None nếu không có
+        """
+        entry = self._entries.get(int(frame_index))
+        if entry is None or entry[0] != tag:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry[1]
+    
+    def store(self, frame_index: int, arrays: Dict[str, np.ndarray], tag: int = 0):
+        """
+        Lưu detections của frame (ghi ra đĩa khi close / mở segment khác)
+        
+        Args:
+            frame_index: Index của frame trong segment
+            arrays: Detection arrays
+            tag: Tag cấu hình input
+        """
+        if self._path is None:
+            return
+        self._entries[int(frame_index)] = (tag, arrays)
+        self._dirty = True
+    
+    def close(self):
+        """Ghi segment đang mở ra đĩa nếu có thay đổi"""
+        if self._path is not None and self._dirty:
+            self._save(self._path, self._entries)
+            logger.debug(f"Saved {len(self._entries)} detections to {self._path} (hits: {self.hits}, misses: {self.misses})")
+        self._dirty = False
+    
+    @staticmethod
+    def _load(path: Path) -> Dict[int, Tuple[int, Dict[str, np.ndarray]]]:
+        """Đọc file .npz của segment"""
+        if not path.exists():
+            return {}
+        try:
+            with np.load(path) as data:
+                frame_indices = data['frame_indices']
+                tags = data['tags']
+                offsets = data['offsets']
+                boxes, scores, class_ids = data['boxes'], data['scores'], data['class_ids']
+        except (OSError, KeyError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable detection cache {path}: {e}")
+            return {}
+        
+        entries = {}
+        for i, frame_index in enumerate(frame_indices.tolist()):
+            start, end = offsets[i], offsets[i + 1]
+            entries[frame_index] = (int(tags[i]), {
+                'boxes': boxes[start:end],
+                'scores': scores[start:end],
+                'class_ids': class_ids[start:end]
+            })
+        return entries
+    
+    @staticmethod
+    def _save(path: Path, entries: Dict[int, Tuple[int, Dict[str, np.ndarray]]]):
+        """Ghi file .npz của segment (atomic: ghi file tạm rồi rename)"""
+        frame_indices = np.array(sorted(entries), dtype=np.int64)
+        items = [entries[i] for i in frame_indices.tolist()]
+        parts = [arrays for _, arrays in items] or [empty_detection_arrays()]
+        counts = np.array([len(arrays['boxes']) for _, arrays in items], dtype=np.int64)
+        
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix('.tmp')
+        with open(tmp_path, 'wb') as f:
+            np.savez_compressed(
+                f,
+                frame_indices=frame_indices,
+                tags=np.array([tag for tag, _ in items], dtype=np.uint32),
+                offsets=np.concatenate([[0], np.cumsum(counts)]).astype(np.int64),
+                boxes=np.concatenate([p['boxes'] for p in parts]).astype(np.float32).reshape(-1, 4),
+                scores=np.concatenate([p['scores'] for p in parts]).astype(np.float32),
+                class_ids=np.concatenate([p['class_ids'] for p in parts]).astype(np.int32)
+            )
+        os.replace(tmp_path, path)
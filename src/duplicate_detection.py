@@ -3,7 +3,6 @@ Module 4: Duplicate Detection
 Kiểm tra ảnh có trùng với hôm trước không
 """
 import os
-import sqlite3
 import imagehash
 import logging
 from PIL import Image
@@ -11,6 +10,8 @@ from datetime import datetime
 from pathlib import Path
 from typing import Optional, Tuple
 
+from db_connection import get_connection
+
 logger = logging.getLogger(__name__)
 
 
@@ -18,7 +19,7 @@ def initialize_database(db_path: str):
     """Khởi tạo database nếu chưa tồn tại"""
     Path(db_path).parent.mkdir(parents=True, exist_ok=True)
     
-    conn = sqlite3.connect(db_path)
+    conn = get_connection(db_path)
     cursor = conn.cursor()
     
     # Tạo table image_hashes
@@ -32,6 +33,11 @@ def initialize_database(db_path: str):
         )
     ''')
     
+    # Database cũ chưa có cột scope (phạm vi so sánh, ví dụ một lần chạy của pipeline)
+    cursor.execute('PRAGMA table_info(image_hashes)')
+    if 'scope' not in [row[1] for row in cursor.fetchall()]:
+        cursor.execute('ALTER TABLE image_hashes ADD COLUMN scope TEXT')
+    
     # Tạo index để tăng tốc query
     cursor.execute('''
         CREATE INDEX IF NOT EXISTS idx_hash ON image_hashes(hash)
@@ -41,8 +47,11 @@ def initialize_database(db_path: str):
         CREATE INDEX IF NOT EXISTS idx_date ON image_hashes(date)
     ''')
     
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_scope ON image_hashes(scope)
+    ''')
+    
     conn.commit()
-    conn.close()
     logger.info(f"Database initialized: {db_path}")
 
 
@@ -66,7 +75,12 @@ def calculate_image_hash(image_path: str) -> str:
         return ""
 
 
-def check_duplicate(image_path: str, db_path: str, threshold: int = 5) -> Tuple[bool, Optional[str]]:
+def check_duplicate(
+    image_path: str,
+    db_path: str,
+    threshold: int = 5,
+    scope: Optional[str] = None
+) -> Tuple[bool, Optional[str]]:
     """
     Kiểm tra ảnh có trùng với ảnh đã lưu không
     
@@ -74,6 +88,7 @@ def check_duplicate(image_path: str, db_path: str, threshold: int = 5) -> Tuple[
         image_path: Đường dẫn đến ảnh cần check
         db_path: Đường dẫn đến database
         threshold: Ngưỡng để coi là trùng (hamming distance)
+        scope: Chỉ so sánh với ảnh đã lưu cùng scope (None = so với tất cả ảnh)
     
     Returns:
         Tuple[bool, Optional[str]]: (is_duplicate, matched_hash)
@@ -91,12 +106,15 @@ def check_duplicate(image_path: str, db_path: str, threshold: int = 5) -> Tuple[
     if not current_hash:
         return False, None
     
-    conn = sqlite3.connect(db_path)
+    conn = get_connection(db_path)
     cursor = conn.cursor()
     
     try:
-        # Lấy tất cả hash từ database
-        cursor.execute('SELECT hash, path FROM image_hashes')
+        # Lấy tất cả hash từ database (hoặc chỉ của scope)
+        if scope is None:
+            cursor.execute('SELECT hash, path FROM image_hashes')
+        else:
+            cursor.execute('SELECT hash, path FROM image_hashes WHERE scope = ?', (scope,))
         rows = cursor.fetchall()
         
         # So sánh với các hash đã lưu
@@ -108,25 +126,23 @@ def check_duplicate(image_path: str, db_path: str, threshold: int = 5) -> Tuple[
             
             if hamming_distance <= threshold:
                 logger.info(f"Duplicate found: {image_path} matches {stored_path} (distance: {hamming_distance})")
-                conn.close()
                 return True, stored_hash_str
         
-        conn.close()
         return False, None
-        
+    
     except Exception as e:
         logger.error(f"Error checking duplicate: {e}")
-        conn.close()
         return False, None
 
 
-def save_image_hash(image_path: str, db_path: str):
+def save_image_hash(image_path: str, db_path: str, scope: Optional[str] = None):
     """
     Lưu hash của ảnh vào database
     
     Args:
         image_path: Đường dẫn đến ảnh
         db_path: Đường dẫn đến database
+        scope: Phạm vi so sánh của ảnh (xem check_duplicate)
     """
     if not os.path.exists(image_path):
         logger.warning(f"Image not found: {image_path}")
@@ -143,22 +159,44 @@ def save_image_hash(image_path: str, db_path: str):
     current_date = datetime.now().strftime("%Y-%m-%d")
     current_timestamp = datetime.now().isoformat()
     
-    conn = sqlite3.connect(db_path)
+    conn = get_connection(db_path)
     cursor = conn.cursor()
     
     try:
         cursor.execute('''
-            INSERT OR REPLACE INTO image_hashes (path, hash, date, timestamp)
-            VALUES (?, ?, ?, ?)
-        ''', (image_path, hash_value, current_date, current_timestamp))
+            INSERT OR REPLACE INTO image_hashes (path, hash, date, timestamp, scope)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (image_path, hash_value, current_date, current_timestamp, scope))
         
         conn.commit()
         logger.debug(f"Saved hash for {image_path}")
-        
+    
     except Exception as e:
+        conn.rollback()
         logger.error(f"Error saving hash: {e}")
-    finally:
-        conn.close()
+
+
+def clear_image_hashes(db_path: str, scope: str):
+    """
+    Xóa hash của các ảnh thuộc một scope
+    
+    Args:
+        db_path: Đường dẫn đến database
+        scope: Scope cần xóa
+    """
+    if not os.path.exists(db_path):
+        return
+    
+    conn = get_connection(db_path)
+    cursor = conn.cursor()
+    
+    try:
+        cursor.execute('DELETE FROM image_hashes WHERE scope = ?', (scope,))
+        conn.commit()
+        logger.debug(f"Cleared {cursor.rowcount} image hashes of scope {scope}")
+    except Exception as e:
+        conn.rollback()
+        logger.error(f"Error clearing hashes: {e}")
 
 
 def get_images_by_date(db_path: str, date: str) -> list:
@@ -175,7 +213,7 @@ def get_images_by_date(db_path: str, date: str) -> list:
     if not os.path.exists(db_path):
         return []
     
-    conn = sqlite3.connect(db_path)
+    conn = get_connection(db_path)
     cursor = conn.cursor()
     
     try:
@@ -185,6 +223,4 @@ def get_images_by_date(db_path: str, date: str) -> list:
     except Exception as e:
         logger.error(f"Error getting images by date: {e}")
         return []
-    finally:
-        conn.close()
 
@@ -0,0 +1,450 @@
+"""
+Inference Worker
+Chạy VehicleDetector trong process riêng (long-lived). Frames được chuyển qua ring buffer
+multiprocessing.shared_memory (không pickle ảnh), kết quả trả về qua Pipe.
+Worker crash (Bus error khi load torch, segfault...) chỉ làm chết worker, process chính
+tự khởi động lại worker và gửi lại các batch đang chờ.
+"""
+import os
+import time
+import queue
+import weakref
+import threading
+import logging
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from concurrent.futures import Future
+import numpy as np
+from typing import Callable, List, Dict, Optional, Tuple
+
+from detection_backends import empty_detection_arrays
+from detection_cache import model_key, config_tag
+from vehicle_detection import VEHICLE_CLASSES, normalize_slicing, arrays_to_detections
+
+logger = logging.getLogger(__name__)
+
+
+def _worker_main(conn, detector_kwargs: Dict, detector_factory: Optional[Callable] = None):
+    """
+    Vòng lặp của worker process: load detector, nhận batch (slot, shape) và trả về detection arrays
+    
+    Messages nhận: ('attach', shm_name, slot_bytes), ('detect', request_id, [(slot, shape)], vehicle_classes),
+        ('slice_region', roi), ('stop',)
+    Messages gửi: ('ready', pid), ('fatal', error), ('result', request_id, arrays), ('error', request_id, error)
+    """
+    shm, slot_bytes = None, 0
+    try:
+        try:
+            if detector_factory is None:
+                from vehicle_detection import VehicleDetector as detector_factory
+            detector = detector_factory(**detector_kwargs)
+        except Exception as e:
+            conn.send(('fatal', f"{type(e).__name__}: {e}"))
+            return
+        conn.send(('ready', os.getpid()))
+        
+        while True:
+            try:
+                message = conn.recv()
+            except EOFError:
+                break  # Process chính đã thoát
+            if message[0] == 'stop':
+                break
+            if message[0] == 'slice_region':
+                detector.set_slice_region(message[1])
+                continue
+            if message[0] == 'attach':
+                # Ring buffer mới (slot lớn hơn), buffer cũ đã được process chính unlink
+                if shm is not None:
+                    shm.close()
+                shm, slot_bytes = shared_memory.SharedMemory(name=message[1]), message[2]
+                continue
+            
+            _, request_id, frames_meta, vehicle_classes = message
+            images = [
+                np.ndarray(shape, dtype=np.uint8, buffer=shm.buf, offset=slot * slot_bytes)
+                for slot, shape in frames_meta
+            ]
+            try:
+                results = detector.detect_vehicles_batch(images, vehicle_classes, as_arrays=True)
+                conn.send(('result', request_id, results))
+            except Exception as e:
+                conn.send(('error', request_id, f"{type(e).__name__}: {e}"))
+            finally:
+                del images  # Bỏ view vào shm.buf trước khi close
+    finally:
+        if shm is not None:
+            shm.close()
+
+
+def _release_shm(shm):
+    """Close + unlink shared memory (bỏ qua nếu đã bị unlink)"""
+    if shm is None:
+        return
+    try:
+        shm.close()
+        shm.unlink()
+    except FileNotFoundError:
+        pass
+
+
+def _cleanup(process, shm):
+    """Dừng worker và giải phóng shared memory (gọi khi RemoteDetector bị hủy hoặc process thoát)"""
+    if process is not None and process.is_alive():
+        process.terminate()
+        process.join(timeout=5)
+    _release_shm(shm)
+
+
+class RemoteDetector:
+    """
+    VehicleDetector chạy trong worker process, cùng interface với VehicleDetector
+    (detect_vehicles_batch, submit_batch, set_slice_region, attach_cache, model_key)
+    """
+    
+    def __init__(
+        self,
+        model_path: str = 'yolov8n.pt',
+        conf_threshold: float = 0.25,
+        batch_size: int = 8,
+        backend: str = 'torch',
+        slicing: Optional[Dict] = None,
+        num_slots: Optional[int] = None,
+        slot_bytes: Optional[int] = None,
+        max_restarts: int = 3,
+        restart_reset_after: float = 600.0,
+        startup_timeout: float = 300.0,
+        detector_factory: Optional[Callable] = None,
+        **backend_kwargs
+    ):
+        """
+        Khởi động worker process và chờ model load xong
+        
+        Args:
+            model_path, conf_threshold, batch_size, backend, slicing, **backend_kwargs: Như VehicleDetector
+            num_slots: Số slot trong ring buffer (None = 2 * batch_size: một batch đang detect,
+                một batch đang được gửi)
+            slot_bytes: Kích thước (bytes) của một slot, None = theo frame lớn nhất đã gửi
+                (ring buffer được cấp phát ở batch đầu tiên và cấp phát lại khi gặp frame lớn hơn)
+            max_restarts: Số lần khởi động lại worker tối đa khi worker crash liên tiếp
+            restart_reset_after: Worker chạy ổn định lâu hơn khoảng này (giây) thì đếm lại số lần restart
+            startup_timeout: Thời gian chờ worker load model (giây)
+            detector_factory: Callable tạo detector trong worker (picklable), None = VehicleDetector
+        """
+        self.conf_threshold = conf_threshold
+        self.batch_size = max(1, batch_size)
+        self.slicing = normalize_slicing(slicing)
+        self.model_key = model_key(model_path, conf_threshold, backend=backend, slicing=self.slicing, **backend_kwargs)
+        self.cache = None
+        self.slot_bytes = 0
+        self.num_slots = num_slots or 2 * self.batch_size
+        self.max_restarts = max_restarts
+        self.restart_reset_after = restart_reset_after
+        self.startup_timeout = startup_timeout
+        self.restarts = 0
+        self._last_restart = None
+        
+        self._detector_kwargs = dict(
+            model_path=model_path, conf_threshold=conf_threshold, batch_size=batch_size,
+            backend=backend, slicing=slicing, **backend_kwargs
+        )
+        self._detector_factory = detector_factory
+        self._ctx = mp.get_context('spawn')  # Không fork: worker không kế thừa state (CUDA, threads) của process chính
+        self._shm = None  # Cấp phát theo kích thước frame (xem _ensure_slot_bytes)
+        self._free_slots = queue.Queue()
+        for slot in range(self.num_slots):
+            self._free_slots.put(slot)
+        
+        self._lock = threading.Lock()  # Bảo vệ _pending, _conn, _process, _shm, cache
+        self._slots_lock = threading.Lock()  # Lấy slots cho cả batch (hoặc toàn bộ ring buffer) một lần
+        self._pending: Dict[int, Dict] = {}
+        self._next_request_id = 0
+        self._slice_roi = None
+        self._closed = False
+        self._process = None
+        self._conn = None
+        
+        self._process, self._conn = self._start_worker()
+        self._finalizer = weakref.finalize(self, _cleanup, self._process, self._shm)
+        if slot_bytes is not None:
+            self._ensure_slot_bytes(slot_bytes)
+        self._reader = threading.Thread(target=self._reader_loop, name='inference-worker-reader', daemon=True)
+        self._reader.start()
+        logger.info(f"Inference worker started (pid {self._process.pid}, {self.num_slots} slots)")
+    
+    def _reset_finalizer(self):
+        """Cập nhật finalizer theo worker process và ring buffer hiện tại (gọi khi giữ _lock)"""
+        self._finalizer.detach()
+        self._finalizer = weakref.finalize(self, _cleanup, self._process, self._shm)
+    
+    def _ensure_slot_bytes(self, nbytes: int):
+        """
+        Đảm bảo mỗi slot chứa được frame nbytes bytes
+        
+        Lần đầu cấp phát ring buffer; khi gặp frame lớn hơn thì chờ các batch đang
+        detect trả hết slot rồi cấp phát lại và báo worker attach buffer mới.
+        """
+        if nbytes <= self.slot_bytes:
+            return
+        with self._slots_lock:
+            if nbytes <= self.slot_bytes:
+                return
+            for _ in range(self.num_slots):
+                self._free_slots.get()  # Chờ mọi slot rảnh (không còn batch dùng buffer cũ)
+            try:
+                shm = shared_memory.SharedMemory(create=True, size=self.num_slots * nbytes)
+                with self._lock:
+                    old_shm, self._shm, self.slot_bytes = self._shm, shm, nbytes
+                    self._reset_finalizer()
+                    try:
+                        self._conn.send(('attach', shm.name, nbytes))
+                    except (BrokenPipeError, OSError):
+                        pass  # Worker vừa crash: worker mới attach khi restart
+                _release_shm(old_shm)
+                logger.info(f"Inference ring buffer: {self.num_slots} slots x {nbytes} bytes")
+            finally:
+                for slot in range(self.num_slots):
+                    self._free_slots.put(slot)
+    
+    def _start_worker(self):
+        """
+        Khởi động worker process và chờ message 'ready' (không giữ _lock khi chờ)
+        
+        Returns:
+            Tuple: (process, connection)
+        """
+        parent_conn, child_conn = self._ctx.Pipe()
+        process = self._ctx.Process(
+            target=_worker_main,
+            args=(child_conn, self._detector_kwargs, self._detector_factory),
+            name='inference-worker',
+            daemon=True
+        )
+        process.start()
+        child_conn.close()
+        
+        deadline = time.monotonic() + self.startup_timeout
+        while not parent_conn.poll(0.5):
+            if not process.is_alive():
+                raise RuntimeError(f"Inference worker died while loading model (exit code {process.exitcode})")
+            if time.monotonic() > deadline:
+                process.terminate()
+                raise TimeoutError(f"Inference worker did not load model within {self.startup_timeout}s")
+        
+        try:
+            message = parent_conn.recv()
+        except EOFError:
+            process.join(timeout=5)
+            raise RuntimeError(f"Inference worker died while loading model (exit code {process.exitcode})")
+        if message[0] == 'fatal':
+            process.join(timeout=5)
+            raise RuntimeError(f"Inference worker could not create detector: {message[1]}")
+        return process, parent_conn
+    
+    def _restart_worker(self) -> bool:
+        """Khởi động lại worker sau crash và gửi lại các batch đang chờ; False nếu hết số lần thử"""
+        self._process.join(timeout=1)
+        exitcode = self._process.exitcode
+        now = time.monotonic()
+        if self._last_restart is not None and now - self._last_restart > self.restart_reset_after:
+            self.restarts = 0  # Worker đã chạy ổn định, chỉ giới hạn các crash liên tiếp
+        self._last_restart = now
+        
+        while self.restarts < self.max_restarts:
+            self.restarts += 1
+            logger.error(
+                f"Inference worker crashed (exit code {exitcode}), "
+                f"restarting ({self.restarts}/{self.max_restarts})..."
+            )
+            try:
+                # Chờ worker load model mà không giữ _lock: submit_batch vẫn đưa request vào _pending
+                process, conn = self._start_worker()
+                with self._lock:
+                    self._process, self._conn = process, conn
+                    self._reset_finalizer()
+                    if self._shm is not None:
+                        conn.send(('attach', self._shm.name, self.slot_bytes))
+                    if self._slice_roi is not None:
+                        conn.send(('slice_region', self._slice_roi))
+                    for request_id, request in self._pending.items():
+                        conn.send(('detect', request_id, request['frames_meta'], request['vehicle_classes']))
+                logger.info(f"Inference worker restarted (pid {process.pid})")
+                return True
+            except (RuntimeError, TimeoutError, OSError) as e:
+                logger.error(f"Failed to restart inference worker: {e}")
+        return False
+    
+    def _reader_loop(self):
+        """Thread nhận kết quả từ worker; phát hiện worker crash và khởi động lại"""
+        while not self._closed:
+            try:
+                message = self._conn.recv()
+            except (EOFError, OSError):
+                if self._closed:
+                    return
+                if self._restart_worker():
+                    continue
+                self._fail_pending(RuntimeError("Inference worker crashed and could not be restarted"))
+                return
+            
+            kind, request_id = message[0], message[1]
+            with self._lock:
+                request = self._pending.pop(request_id, None)
+            if request is None:
+                continue
+            for slot, _ in request['frames_meta']:
+                self._free_slots.put(slot)
+            
+            if kind == 'error':
+                request['future'].set_exception(RuntimeError(f"Inference worker error: {message[2]}"))
+                continue
+            self._complete(request, message[2])
+    
+    def _complete(self, request: Dict, results: List[Dict[str, np.ndarray]]):
+        """Ghép kết quả worker với các frame lấy từ cache, lưu cache và hoàn thành future"""
+        all_arrays = request['arrays']
+        with self._lock:
+            for idx, arrays in zip(request['indices'], results):
+                all_arrays[idx] = arrays
+                if request['tags'] is not None and self.cache is not None:
+                    self.cache.store(request['cache_keys'][idx][0], arrays, request['tags'][idx])
+        request['future'].set_result([arrays_to_detections(arrays) for arrays in all_arrays])
+    
+    def _fail_pending(self, error: Exception):
+        """Báo lỗi cho tất cả batch đang chờ"""
+        with self._lock:
+            pending = list(self._pending.values())
+            self._pending.clear()
+        for request in pending:
+            for slot, _ in request['frames_meta']:
+                self._free_slots.put(slot)
+            request['future'].set_exception(error)
+    
+    def attach_cache(self, cache):
+        """Gắn DetectionCache (tra cache ở process chính, chỉ gửi frames chưa có sang worker)"""
+        self.cache = cache
+    
+    def set_slice_region(self, roi_config: Optional[Dict]):
+        """Đặt ROI cho sliced inference trong worker (giữ lại để gửi lại khi worker restart)"""
+        self._slice_roi = roi_config
+        if self.slicing is not None:
+            with self._lock:
+                try:
+                    self._conn.send(('slice_region', roi_config))
+                except (BrokenPipeError, OSError):
+                    pass  # Worker vừa crash: gửi lại khi restart
+    
+    def submit_batch(
+        self,
+        images: List[np.ndarray],
+        vehicle_classes: Optional[List[str]] = None,
+        cache_keys: Optional[List[Tuple[int, int]]] = None
+    ) -> Future:
+        """
+        Gửi batch sang worker, không chờ kết quả
+        
+        Chặn nếu ring buffer hết slot (các batch trước chưa detect xong).
+        
+        Args:
+            images: List các image arrays (uint8)
+            vehicle_classes: List các class cần detect
+            cache_keys: (frame_index, tag) cho mỗi image để tra DetectionCache
+        
+        Returns:
+            Future: result() là detections (List[List[Dict]]) cho mỗi image
+        """
+        if self._closed:
+            raise RuntimeError("RemoteDetector is closed")
+        
+        future = Future()
+        all_arrays = [None] * len(images)
+        class_ids = [cid for cid, name in VEHICLE_CLASSES.items() if vehicle_classes is None or name in vehicle_classes]
+        tags = None
+        if self.cache is not None and cache_keys is not None:
+            tags = [config_tag(tag, class_ids) for _, tag in cache_keys]
+        
+        indices = []
+        with self._lock:
+            for i, image in enumerate(images):
+                if image is None or image.size == 0 or not class_ids:
+                    all_arrays[i] = empty_detection_arrays()
+                    continue
+                cached = self.cache.lookup(cache_keys[i][0], tags[i]) if tags is not None else None
+                if cached is not None:
+                    all_arrays[i] = cached
+                else:
+                    indices.append(i)
+        
+        if len(indices) > self.num_slots:
+            raise ValueError(f"Batch of {len(indices)} frames exceeds ring buffer ({self.num_slots} slots)")
+        
+        request = {
+            'future': future, 'arrays': all_arrays, 'indices': indices,
+            'cache_keys': cache_keys, 'tags': tags, 'vehicle_classes': vehicle_classes
+        }
+        if not indices:
+            self._complete(request, [])
+            return future
+        
+        # Ghi frames vào slots trống (không pickle ảnh)
+        batch = [np.ascontiguousarray(images[i], dtype=np.uint8) for i in indices]
+        self._ensure_slot_bytes(max(image.nbytes for image in batch))
+        with self._slots_lock:
+            slots = [self._free_slots.get() for _ in batch]
+        frames_meta = []
+        for slot, image in zip(slots, batch):
+            view = np.ndarray(image.shape, dtype=np.uint8, buffer=self._shm.buf, offset=slot * self.slot_bytes)
+            view[...] = image
+            del view
+            frames_meta.append((slot, image.shape))
+        request['frames_meta'] = frames_meta
+        
+        with self._lock:
+            request_id = self._next_request_id
+            self._next_request_id += 1
+            self._pending[request_id] = request
+            try:
+                self._conn.send(('detect', request_id, frames_meta, vehicle_classes))
+            except (BrokenPipeError, OSError):
+                # Worker vừa crash: reader thread sẽ restart và gửi lại request này
+                logger.warning("Inference worker pipe broken, request will be resent after restart")
+        return future
+    
+    def detect_vehicles_batch(
+        self,
+        images: List[np.ndarray],
+        vehicle_classes: Optional[List[str]] = None,
+        batch_size: Optional[int] = None,
+        cache_keys: Optional[List[Tuple[int, int]]] = None
+    ) -> List[List[Dict]]:
+        """
+        Detect đồng bộ (chia batch theo batch_size, chờ kết quả)
+        
+        Returns:
+            List[List[Dict]]: Detections cho mỗi image
+        """
+        batch_size = min(max(1, batch_size or self.batch_size), self.num_slots)
+        futures = []
+        for start in range(0, len(images), batch_size):
+            keys = cache_keys[start:start + batch_size] if cache_keys is not None else None
+            futures.append(self.submit_batch(images[start:start + batch_size], vehicle_classes, keys))
+        return [detections for future in futures for detections in future.result()]
+    
+    def detect_vehicles(self, image: np.ndarray, vehicle_classes: Optional[List[str]] = None) -> List[Dict]:
+        """Detect một ảnh (đồng bộ)"""
+        return self.submit_batch([image], vehicle_classes).result()[0]
+    
+    def close(self):
+        """Dừng worker và giải phóng shared memory"""
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            with self._lock:
+                self._conn.send(('stop',))
+            self._process.join(timeout=5)
+        except (BrokenPipeError, OSError):
+            pass
+        self._fail_pending(RuntimeError("RemoteDetector closed"))
+        self._finalizer()
+        logger.info("Inference worker stopped")
@@ -0,0 +1,201 @@
+"""
+Kalman Filter
+Constant-velocity Kalman filter cho bounding boxes, xử lý cả batch tracks bằng NumPy
+(state: cx, cy, aspect ratio, height và vận tốc tương ứng — giống DeepSORT/ByteTrack)
+"""
+import numpy as np
+from typing import Tuple
+
+# Phân vị 95% của chi-square 2 bậc tự do: ngưỡng gating Mahalanobis cho vị trí (cx, cy)
+CHI2INV95_2D = 5.9915
+
+
+def xyxy_to_xyah(boxes: np.ndarray) -> np.ndarray:
+    """[x1, y1, x2, y2] → [cx, cy, w / h, h]"""
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    w = boxes[:, 2] - boxes[:, 0]
+    h = np.maximum(boxes[:, 3] - boxes[:, 1], 1e-6)
+    return np.column_stack(((boxes[:, 0] + boxes[:, 2]) / 2.0, (boxes[:, 1] + boxes[:, 3]) / 2.0, w / h, h))
+
+
+def xyah_to_xyxy(xyah: np.ndarray) -> np.ndarray:
+    """[cx, cy, w / h, h] → [x1, y1, x2, y2]"""
+    xyah = np.asarray(xyah, dtype=np.float64).reshape(-1, 4)
+    w = xyah[:, 2] * xyah[:, 3]
+    h = xyah[:, 3]
+    return np.column_stack((xyah[:, 0] - w / 2.0, xyah[:, 1] - h / 2.0, xyah[:, 0] + w / 2.0, xyah[:, 1] + h / 2.0))
+
+
+class BatchKalmanFilter:
+    """
+    Kalman filter cho N tracks cùng lúc
+    
+    mean: (N, 8) [cx, cy, a, h, vcx, vcy, va, vh], covariance: (N, 8, 8).
+    Nhiễu process/measurement tỉ lệ với chiều cao box nên dùng được cho cả xe gần và xa.
+    """
+    
+    ndim = 4
+    
+    def __init__(self, std_weight_position: float = 1.0 / 20, std_weight_velocity: float = 1.0 / 160):
+        """
+        Args:
+            std_weight_position: Độ lệch chuẩn vị trí, tính theo chiều cao box
+            std_weight_velocity: Độ lệch chuẩn vận tốc, tính theo chiều cao box
+        """
+        self.std_weight_position = std_weight_position
+        self.std_weight_velocity = std_weight_velocity
+        
+        self._motion_mat = np.eye(2 * self.ndim)
+        self._motion_mat[:self.ndim, self.ndim:] = np.eye(self.ndim)  # x += v (dt = 1 frame)
+        self._update_mat = np.eye(self.ndim, 2 * self.ndim)
+    
+    def _std(self, height: np.ndarray, position: float, velocity: float, aspect_pos: float, aspect_vel: float) -> np.ndarray:
+        """Độ lệch chuẩn (N, 8) theo chiều cao box"""
+        n = len(height)
+        std = np.empty((n, 2 * self.ndim))
+        std[:, [0, 1, 3]] = (position * height)[:, None]
+        std[:, 2] = aspect_pos
+        std[:, [4, 5, 7]] = (velocity * height)[:, None]
+        std[:, 6] = aspect_vel
+        return std
+    
+    def initiate(self, measurements: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Tạo state cho tracks mới từ measurements (N, 4) xyah, vận tốc ban đầu = 0
+        
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: (mean (N, 8), covariance (N, 8, 8))
+        """
+        measurements = np.asarray(measurements, dtype=np.float64).reshape(-1, self.ndim)
+        mean = np.concatenate([measurements, np.zeros_like(measurements)], axis=1)
+        std = self._std(
+            measurements[:, 3], 2 * self.std_weight_position, 10 * self.std_weight_velocity, 1e-2, 1e-5
+        )
+        covariance = np.zeros((len(mean), 2 * self.ndim, 2 * self.ndim))
+        idx = np.arange(2 * self.ndim)
+        covariance[:, idx, idx] = std ** 2
+        return mean, covariance
+    
+    def initiate_moving(
+        self,
+        previous: np.ndarray,
+        measurements: np.ndarray,
+        frames: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Tạo lại state từ 2 measurements liên tiếp của cùng track (xyah), vận tốc = độ dời / số frame
+        
+        Dùng khi track mới (vận tốc 0) được ghép lần thứ hai: xe nhanh hoặc nhiều frame không
+        detect thì Kalman update từ vận tốc 0 hội tụ chậm.
+        
+        Args:
+            previous: Measurements trước (N, 4)
+            measurements: Measurements hiện tại (N, 4)
+            frames: Số frame giữa 2 measurements (N,)
+        
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: (mean (N, 8), covariance (N, 8, 8))
+        """
+        mean, covariance = self.initiate(measurements)
+        previous = np.asarray(previous, dtype=np.float64).reshape(-1, self.ndim)
+        frames = np.maximum(np.asarray(frames, dtype=np.float64).reshape(-1, 1), 1.0)
+        mean[:, self.ndim:] = (mean[:, :self.ndim] - previous) / frames
+        return mean, covariance
+    
+    def predict(self, mean: np.ndarray, covariance: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Dự đoán state ở frame tiếp theo cho tất cả tracks
+        
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: (mean, covariance) đã dự đoán
+        """
+        if len(mean) == 0:
+            return mean, covariance
+        std = self._std(mean[:, 3], self.std_weight_position, self.std_weight_velocity, 1e-2, 1e-5)
+        mean = mean @ self._motion_mat.T
+        covariance = self._motion_mat @ covariance @ self._motion_mat.T
+        idx = np.arange(2 * self.ndim)
+        covariance[:, idx, idx] += std ** 2
+        return mean, covariance
+    
+    def project(self, mean: np.ndarray, covariance: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Chiếu state sang không gian measurement
+        
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: (mean (N, 4), covariance (N, 4, 4))
+        """
+        std = self.std_weight_position * mean[:, 3]
+        innovation = np.zeros((len(mean), self.ndim))
+        innovation[:, [0, 1, 3]] = (std ** 2)[:, None]
+        innovation[:, 2] = 1e-2 ** 2
+        projected_cov = covariance[:, :self.ndim, :self.ndim].copy()
+        idx = np.arange(self.ndim)
+        projected_cov[:, idx, idx] += innovation
+        return mean[:, :self.ndim], projected_cov
+    
+    def update(self, mean: np.ndarray, covariance: np.ndarray, measurements: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Cập nhật state của N tracks với N measurements tương ứng (xyah)
+        
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: (mean, covariance) sau update
+        """
+        if len(mean) == 0:
+            return mean, covariance
+        projected_mean, projected_cov = self.project(mean, covariance)
+        # Kalman gain K = P H^T S^-1, giải hệ thay vì nghịch đảo S
+        cross_cov = covariance[:, :, :self.ndim]  # P H^T (N, 8, 4)
+        gain = np.linalg.solve(projected_cov, cross_cov.transpose(0, 2, 1)).transpose(0, 2, 1)
+        innovation = np.asarray(measurements, dtype=np.float64) - projected_mean
+        mean = mean + np.einsum('nij,nj->ni', gain, innovation)
+        covariance = covariance - gain @ projected_cov @ gain.transpose(0, 2, 1)
+        return mean, covariance
+    
+    def position_covariance(self, mean: np.ndarray, covariance: np.ndarray) -> np.ndarray:
+        """
+        Covariance (N, 2, 2) của vị trí (cx, cy) đã chiếu sang không gian measurement
+        """
+        return self.project(mean, covariance)[1][:, :2, :2]
+    
+    def gating_distance(self, mean: np.ndarray, covariance: np.ndarray, measurements: np.ndarray) -> np.ndarray:
+        """
+        Khoảng cách Mahalanobis bình phương (vị trí cx, cy) giữa mỗi track và mỗi measurement
+        
+        Args:
+            mean, covariance: State của N tracks
+            measurements: (M, 4) xyah
+        
+        Returns:
+            np.ndarray: (N, M), so với CHI2INV95_2D để gate
+        """
+        diff = np.asarray(measurements, dtype=np.float64)[None, :, :2] - mean[:, None, :2]  # (N, M, 2)
+        return mahalanobis_2d(diff, self.position_covariance(mean, covariance)[:, None])
+    
+    def gating_radius(self, mean: np.ndarray, covariance: np.ndarray, threshold: float = CHI2INV95_2D) -> np.ndarray:
+        """
+        Bán kính (pixels) bao vùng Mahalanobis <= threshold quanh vị trí dự đoán của mỗi track
+        
+        Returns:
+            np.ndarray: (N,) sqrt(threshold * trị riêng lớn nhất của covariance vị trí)
+        """
+        position_cov = self.position_covariance(mean, covariance)
+        a, b, c = position_cov[:, 0, 0], position_cov[:, 0, 1], position_cov[:, 1, 1]
+        largest = (a + c) / 2.0 + np.sqrt(((a - c) / 2.0) ** 2 + b ** 2)
+        return np.sqrt(threshold * largest)
+
+
+def mahalanobis_2d(diff: np.ndarray, covariance: np.ndarray) -> np.ndarray:
+    """
+    Khoảng cách Mahalanobis bình phương cho vector 2 chiều (nghịch đảo 2x2 dạng đóng, broadcast được)
+    
+    Args:
+        diff: (..., 2)
+        covariance: (..., 2, 2), broadcast với diff
+    
+    Returns:
+        np.ndarray: (...)
+    """
+    a, b, c = covariance[..., 0, 0], covariance[..., 0, 1], covariance[..., 1, 1]
+    dx, dy = diff[..., 0], diff[..., 1]
+    return (c * dx * dx - 2.0 * b * dx * dy + a * dy * dy) / (a * c - b * b)
@@ -4,12 +4,14 @@ Pipeline workflow: Segment video → Extract frames → Process → Detect → T
 """
 import os
 import sys
+import json
 import cv2
+import numpy as np
 import argparse
 import logging
 from pathlib import Path
 from tqdm import tqdm
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 
 # Add src directory to Python path to ensure imports work
 src_dir = Path(__file__).parent
@@ -23,17 +25,20 @@ from utils import (
 )
 from video_segmentation import segment_video
 from image_extraction import extract_frames
-from roi_processing import apply_roi_mask
-from duplicate_detection import check_duplicate, save_image_hash, initialize_database as init_hash_db
+from roi_processing import apply_roi_mask, warp_roi_config, warp_points
+from duplicate_detection import check_duplicate, save_image_hash, clear_image_hashes, initialize_database as init_hash_db
 from camera_shift_detection import (
-    detect_camera_shift, save_reference_frame, load_reference_frame
+    ReferenceBank, ShiftMonitor, reference_bank_dir, save_reference_frame, load_reference_frame
 )
 from vehicle_detection import VehicleDetector
-from vehicle_tracking import VehicleTracker
-from counting import VehicleCounter
+from inference_worker import RemoteDetector
+from detection_cache import DetectionCache, video_fingerprint, config_tag
+from vehicle_tracking import create_tracker
+from counting import VehicleCounter, CountingEngine, CountBins
+from speed_estimation import SpeedEstimator, SpeedBins
 from storage import (
-    initialize_database, save_counting_result, save_camera_shift,
-    export_to_json, export_to_csv, get_counting_summary
+    initialize_database, save_count_bins, save_speed_bins, save_camera_shift, save_trajectories,
+    delete_video_results, export_to_json, export_to_csv, get_counting_summary
 )
 
 logger = logging.getLogger(__name__)
@@ -42,7 +47,20 @@ logger = logging.getLogger(__name__)
 class SystemKPipeline:
     """Main pipeline cho System K vehicle counting"""
     
-    def __init__(self, config_path: str, db_path: str, reference_frame_path: Optional[str] = None):
+    def __init__(
+        self,
+        config_path: str,
+        db_path: str,
+        reference_frame_path: Optional[str] = None,
+        batch_size: int = 8,
+        backend: Optional[str] = None,
+        detection_cache_dir: Optional[str] = 'data/detection_cache',
+        use_worker: bool = False,
+        detection_stride: int = 1,
+        optical_flow: bool = False,
+        tracker_type: Optional[str] = None,
+        bin_minutes: Optional[float] = None
+    ):
         """
         Khởi tạo pipeline
         
@@ -50,6 +68,14 @@ class SystemKPipeline:
             config_path: Đường dẫn đến config file
             db_path: Đường dẫn đến database
             reference_frame_path: Đường dẫn đến reference frame (None = sẽ tạo từ frame đầu)
+            batch_size: Số frames gom lại cho mỗi lần gọi YOLO
+            backend: Inference backend ('torch', 'onnx', 'openvino'), None = theo config
+            detection_cache_dir: Thư mục cache detections (None = tắt cache)
+            use_worker: Chạy detector trong worker process riêng (crash không làm dừng pipeline)
+            detection_stride: Chạy detection mỗi N frames, các frame giữa do tracker dự đoán
+            optical_flow: Tracker dùng optical flow để dịch box ở các frame không detect
+            tracker_type: Tracker ('simple', 'bytetrack'), None = theo config
+            bin_minutes: Độ dài mỗi count bin (phút video), None = theo config hoặc 5
         """
         self.config = load_config(config_path)
         validate_config(self.config)
@@ -61,17 +87,90 @@ class SystemKPipeline:
         initialize_database(db_path)
         init_hash_db(db_path)  # Initialize hash database
         
-        # Initialize vehicle detector
-        self.detector = VehicleDetector(model_path='yolov8n.pt', conf_threshold=0.25)
+        # Tracker config ('tracker': type, tham số tracker)
+        tracker_config = dict(self.config.get('tracker', {}))
+        if tracker_type is not None:
+            tracker_config['type'] = tracker_type
+        
+        # Initialize vehicle detector (config 'detector': model_path, conf_threshold, backend, ...)
+        detector_config = dict(self.config.get('detector', {}))
+        if backend is not None:
+            detector_config['backend'] = backend
+        if tracker_config.get('type') == 'bytetrack' and 'conf_threshold' not in detector_config:
+            # ByteTrack cần cả detections confidence thấp để giữ track của xe bị che
+            detector_config['conf_threshold'] = tracker_config.get('track_low_thresh', 0.1)
+        detector_class = RemoteDetector if use_worker else VehicleDetector
+        self.detector = detector_class(
+            model_path=detector_config.pop('model_path', 'yolov8n.pt'),
+            conf_threshold=detector_config.pop('conf_threshold', 0.25),
+            batch_size=batch_size,
+            **detector_config
+        )
+        
+        # Frames đã qua bước tiền xử lý, chờ detect theo batch (giữ đúng thứ tự cho tracker)
+        self.batch_size = max(1, batch_size)
+        self._pending_frames = []
+        self._in_flight = None  # (frames, future) của batch đã gửi detector, chưa track/count
+        self._pending_detections = 0  # Số frames trong _pending_frames cần detect
+        
+        # Detection cache: chạy lại cùng video/model chỉ đọc detections từ đĩa
+        self.detection_cache = DetectionCache(detection_cache_dir) if detection_cache_dir else None
+        self.detector.attach_cache(self.detection_cache)
+        self._video_fingerprint = None
+        
+        # Initialize camera shift detection: bank reference frames (ngày/đêm) với features cache
+        # Monitor chỉ check mỗi vài giây video, chỉ ghi DB khi shift bắt đầu/kết thúc
+        # Config 'camera_shift': reference_bank_dir, threshold, check_interval
+        # Không có reference của người dùng: reference tạo từ frame đầu mỗi video, bank tạo lại theo video
+        self._user_reference = reference_frame_path is not None and os.path.exists(reference_frame_path)
+        self._create_shift_monitor(reference_frame_path if self._user_reference else None)
+        self.segment_duration = 300
         
         # Initialize tracker
-        self.tracker = VehicleTracker()
+        self.tracker = create_tracker(tracker_config, optical_flow=optical_flow)
+        self._video_path = None
+        self._video_frame = 0  # Số thứ tự frame trong video gốc (ghi vào trajectory)
+        self.detection_stride = max(1, detection_stride)
         
         # Initialize counter
         self.counter = VehicleCounter(self.config['counting_line'])
         
-        # Store previous centroids for tracking
-        self.previous_centroids = {}
+        # Nhiều counting lines / zones theo class và chiều (tùy chọn)
+        self.engine = None
+        if self.config.get('counting_lines') or self.config.get('counting_zones'):
+            self.engine = CountingEngine(
+                self.config.get('counting_lines'),
+                self.config.get('counting_zones'),
+                classes=self.config.get('vehicle_classes')
+            )
+        
+        # Số xe gom theo bin thời gian video, mỗi bin ghi vào DB một lần khi đóng
+        if bin_minutes is None:
+            bin_minutes = self.config.get('count_bin_minutes', 5)
+        self.count_bins = CountBins(
+            bin_minutes * 60.0,
+            lines=[self.counter.name] + (self.engine.line_names if self.engine is not None else []),
+            classes=self.config.get('vehicle_classes')
+        )
+        
+        # Tốc độ trung bình theo lane từ trajectories (cần phần 'calibration', tạo bằng calibration_tool.py)
+        self.speed_estimator = None
+        self.speed_bins = None
+        if 'calibration' in self.config:
+            self.speed_estimator = SpeedEstimator.from_config(self.config['calibration'])
+            self.speed_bins = SpeedBins(
+                self.count_bins.bin_seconds,
+                lanes=self.speed_estimator.lane_names,
+                classes=self.config.get('vehicle_classes')
+            )
+        self._fps = 30.0
+        self._frame_to_reference = None  # Homography frame → reference khi camera đang lệch
+        
+        # ROI/counting line đang dùng (được warp khi camera lệch, cache theo shift episode)
+        self.roi_config = self.config['roi']
+        self._geometry_episode = None
+        self._roi_tag = config_tag(self.roi_config)
+        self.detector.set_slice_region(self.roi_config)  # Sliced inference chỉ chia tile phần xa của ROI
         
         logger.info("System K Pipeline initialized")
     
@@ -84,6 +183,26 @@ class SystemKPipeline:
             segment_duration: Độ dài mỗi segment (giây)
         """
         logger.info(f"Processing video: {video_path}")
+        self.segment_duration = segment_duration
+        
+        # Bins còn mở của lần chạy trước (ví dụ process_video bị dừng giữa chừng) thuộc về video trước
+        save_count_bins(self.db_path, self.count_bins.flush(), self._video_path)
+        if self.speed_bins is not None:
+            save_speed_bins(self.db_path, self.speed_bins.flush(), self._video_path)
+        # Kết quả của lần chạy trước trên cùng video được thay thế, không cộng dồn
+        delete_video_results(self.db_path, video_path)
+        self._video_path = video_path
+        self._video_frame = 0
+        if self._user_reference:
+            self.shift_monitor.reset()
+        else:
+            self.reference_frame_path = None
+            self._create_shift_monitor(video_path)
+        self._update_shift_geometry()
+        self._video_fingerprint = video_fingerprint(video_path)
+        # Check duplicate chỉ so với frames của lần chạy này: hash của lần chạy trước trên cùng video
+        # sẽ đánh dấu mọi frame là trùng (và bỏ qua detection cache)
+        clear_image_hashes(self.db_path, self._video_fingerprint)
         
         # Step 1: Segment video
         logger.info("Step 1: Segmenting video...")
@@ -98,6 +217,13 @@ class SystemKPipeline:
             logger.info(f"Processing segment {segment_idx + 1}/{len(segment_files)}: {segment_path}")
             self.process_segment(segment_path, segment_idx)
         
+        # Lưu trajectories của các tracks còn lại
+        self.tracker.finish_all()
+        self._save_trajectories()
+        save_count_bins(self.db_path, self.count_bins.flush(), video_path)
+        if self.speed_bins is not None:
+            save_speed_bins(self.db_path, self.speed_bins.flush(), video_path)
+        
         # Export results
         self.export_results(video_path)
     
@@ -129,21 +255,42 @@ class SystemKPipeline:
         
         reference_frame = load_reference_frame(self.reference_frame_path)
         
+        # Thời gian của frame trong video gốc (cho shift monitor)
+        cap = cv2.VideoCapture(segment_path)
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+        cap.release()
+        self._fps = fps
+        segment_offset = segment_idx * self.segment_duration
+        
+        if self.detection_cache is not None and self._video_fingerprint is not None:
+            self.detection_cache.open_segment(
+                self._video_fingerprint, f"{self.segment_duration}s_{segment_idx:04d}", self.detector.model_key
+            )
+        
         # Process each frame
         for frame_idx, frame_path in enumerate(tqdm(frame_paths, desc="Processing frames")):
             self.process_frame(
                 frame_path,
                 segment_path,
                 frame_idx,
-                reference_frame
+                reference_frame,
+                frame_time=segment_offset + frame_idx / fps
             )
+        
+        # Detect các frames còn lại trong batch
+        self.drain_batches()
+        self._save_trajectories()
+        if self.detection_cache is not None:
+            self.detection_cache.close()
+            logger.info(f"Detection cache: {self.detection_cache.hits} hits, {self.detection_cache.misses} misses")
     
     def process_frame(
         self,
         frame_path: str,
         video_path: str,
         frame_number: int,
-        reference_frame: Optional[cv2.typing.MatLike]
+        reference_frame: Optional[cv2.typing.MatLike],
+        frame_time: Optional[float] = None
     ):
         """
         Xử lý một frame
@@ -153,7 +300,11 @@ class SystemKPipeline:
             video_path: Đường dẫn đến video gốc
             frame_number: Số thứ tự frame
             reference_frame: Reference frame để check camera shift
+            frame_time: Thời gian của frame trong video (giây, None = ước tính theo 30 FPS)
         """
+        video_frame = self._video_frame
+        self._video_frame += 1
+        
         # Load frame
         frame = cv2.imread(frame_path)
         if frame is None:
@@ -161,18 +312,22 @@ class SystemKPipeline:
             return
         
         # Step 3: Check duplicate
-        is_duplicate, _ = check_duplicate(frame_path, self.db_path)
+        is_duplicate, _ = check_duplicate(frame_path, self.db_path, scope=self._video_fingerprint)
         if is_duplicate:
             logger.debug(f"Skipping duplicate frame: {frame_path}")
             return
         
-        # Step 4: Check camera shift
+        # Step 4: Check camera shift (subsampled, chỉ lưu event start/end)
         if reference_frame is not None:
-            shift_result = detect_camera_shift(frame, reference_frame, threshold=0.1)
+            if frame_time is None:
+                frame_time = frame_number / 30.0
+            shift_event = self.shift_monitor.update(frame, frame_time, reference_frame)
             
-            if shift_result['is_shifted']:
+            if shift_event is not None:
+                shift_result = shift_event['result']
+                is_start = shift_event['event'] == 'start'
                 warning = (
-                    f"Camera shift detected: "
+                    f"Camera shift {'started' if is_start else 'ended'} at {shift_event['time']:.2f}s: "
                     f"shift_x={shift_result['shift_x']:.2f}, "
                     f"shift_y={shift_result['shift_y']:.2f}, "
                     f"rotation={shift_result['rotation']:.2f}°"
@@ -185,47 +340,199 @@ class SystemKPipeline:
                     shift_result['shift_x'],
                     shift_result['shift_y'],
                     shift_result['rotation'],
-                    True,
+                    is_start,
                     warning
                 )
         
+        # Bù camera shift cho ROI và counting line
+        self._update_shift_geometry()
+        
+        # Save image hash ngay để các frame sau trong cùng batch check duplicate đúng
+        save_image_hash(frame_path, self.db_path, scope=self._video_fingerprint)
+        
+        # Frames giữa 2 lần detect: tracker tự dự đoán vị trí (giữ thứ tự trong batch)
+        # Stride theo frame trong video gốc để nhịp detect không bị reset ở đầu mỗi segment
+        run_detection = video_frame % self.detection_stride == 0
+        item = {
+            'detect': run_detection,
+            'frame_path': frame_path,
+            'video_path': video_path,
+            'frame_number': frame_number,
+            'video_frame': video_frame,
+            'video_time': frame_time if frame_time is not None else frame_number / 30.0,
+            'roi_tag': self._roi_tag
+        }
+        
         # Step 5: Apply ROI mask
-        masked_frame = apply_roi_mask(frame, self.config['roi'])
+        if run_detection or self.tracker.use_optical_flow:
+            masked_frame = apply_roi_mask(frame, self.roi_config)
+            if run_detection:
+                item['masked_frame'] = masked_frame
+            if self.tracker.use_optical_flow:
+                item['gray'] = cv2.cvtColor(masked_frame, cv2.COLOR_BGR2GRAY)
+        
+        # Step 6: Gom frame vào batch, detect khi đủ batch_size frames cần detect
+        self._pending_frames.append(item)
+        if run_detection:
+            self._pending_detections += 1
+            if self._pending_detections >= self.batch_size:
+                self.flush_batch()
+    
+    def flush_batch(self):
+        """
+        Gửi các frames đang chờ cho detector, sau đó track/count batch gửi trước đó
         
-        # Step 6: Detect vehicles
-        detections = self.detector.detect_vehicles(
-            masked_frame,
-            vehicle_classes=self.config.get('vehicle_classes', None)
-        )
+        Với worker process, batch mới được detect trong lúc process chính track/count
+        batch trước và decode các frame tiếp theo. Gọi drain_batches() khi cần kết quả ngay.
+        """
+        submitted = None
+        if self._pending_frames:
+            pending = self._pending_frames
+            self._pending_frames = []
+            self._pending_detections = 0
+            to_detect = [item for item in pending if item['detect']]
+            future = self.detector.submit_batch(
+                [item['masked_frame'] for item in to_detect],
+                vehicle_classes=self.config.get('vehicle_classes', None),
+                cache_keys=[(item['frame_number'], item['roi_tag']) for item in to_detect]
+            )
+            submitted = (pending, future)
         
+        self._complete_in_flight()
+        self._in_flight = submitted
+    
+    def drain_batches(self):
+        """Detect + track/count tất cả frames đang chờ (giữ đúng thứ tự)"""
+        self.flush_batch()
+        self._complete_in_flight()
+    
+    def _complete_in_flight(self):
+        """Chờ kết quả batch đang detect và track/count theo thứ tự"""
+        if self._in_flight is None:
+            return
+        pending, future = self._in_flight
+        self._in_flight = None
+        detections_batch = iter(future.result())
+        for item in pending:
+            self._track_and_count(item, next(detections_batch) if item['detect'] else None)
+        self._save_trajectories()
+    
+    def _save_trajectories(self):
+        """
+        Lưu trajectories của các tracks đã kết thúc vào database (mỗi batch một transaction)
+        và cộng tốc độ của chúng vào speed bin hiện tại
+        """
+        trajectories = self.tracker.pop_finished_trajectories()
+        if self.speed_estimator is not None:
+            self.speed_bins.add(self.speed_estimator.estimate(trajectories, self._fps, self._frame_to_reference))
+        save_trajectories(self.db_path, trajectories, self._video_path)
+    
+    def _track_and_count(self, item: Dict, detections: Optional[List[Dict]]):
+        """
+        Track, count và lưu kết quả cho một frame
+        
+        Args:
+            item: Thông tin frame (frame_path, video_path, frame_number, video_time)
+            detections: Detections của frame, None = frame không chạy detection (tracker dự đoán)
+        """
         # Step 7: Track vehicles
-        tracked_objects = self.tracker.update(detections)
+        if detections is None:
+            tracked_objects = self.tracker.predict(item.get('gray'), item.get('video_frame'))
+        else:
+            tracked_objects = self.tracker.update(detections, item.get('gray'), item.get('video_frame'))
+        
+        # Step 8: Ghi các count bins đã đóng (bin đóng khi frame đầu tiên của bin sau đến),
+        # sau đó đếm xe vào bin hiện tại (counter giữ centroids frame trước)
+        save_count_bins(self.db_path, self.count_bins.advance(item['video_time']), self._video_path)
+        if self.speed_bins is not None:
+            save_speed_bins(self.db_path, self.speed_bins.advance(item['video_time']), self._video_path)
+        counting_result = self.counter.count_vehicles(tracked_objects)
+        self.count_bins.add(counting_result['new_counts'], line=self.counter.name)
+        if self.engine is not None:
+            self.count_bins.add(self.engine.update(tracked_objects)['new_counts'])
+    
+    def _create_shift_monitor(self, source: Optional[str]):
+        """
+        Tạo reference bank và shift monitor cho một camera
         
-        # Update previous centroids
-        current_centroids = {obj['track_id']: obj['centroid'] for obj in tracked_objects}
+        Bank được lưu trong thư mục riêng của camera (xem reference_bank_dir) để
+        reference frames của các camera khác nhau không bị trộn.
         
-        # Step 8: Count vehicles
-        counting_result, self.counter = self.counter.count_vehicles(
-            tracked_objects,
-            self.previous_centroids
+        Args:
+            source: Đường dẫn định danh camera: reference của người dùng, hoặc video
+                khi reference được tạo từ frame đầu của video (None = bank chỉ trong memory)
+        """
+        shift_config = self.config.get('camera_shift', {})
+        bank_dir = shift_config.get('reference_bank_dir', 'data/reference_frames')
+        self.reference_bank = ReferenceBank(
+            reference_bank_dir(bank_dir, source) if source is not None else None,
+            threshold=shift_config.get('threshold', 0.1)
         )
+        if self._user_reference:
+            # Reference của người dùng luôn có trong bank, kể cả khi bank đã có frames từ lần chạy trước
+            user_reference = load_reference_frame(self.reference_frame_path)
+            if user_reference is not None:
+                self.reference_bank.seed(user_reference)
+        self.shift_monitor = ShiftMonitor(self.reference_bank, check_interval=shift_config.get('check_interval', 5.0))
+    
+    def _update_shift_geometry(self):
+        """
+        Warp ROI và counting line theo homography khi camera đang lệch
         
-        # Update previous centroids
-        self.previous_centroids = current_centroids
-        
-        # Step 9: Save results
-        save_counting_result(
-            self.db_path,
-            video_path=video_path,
-            frame_path=frame_path,
-            vehicle_count_up=counting_result['count_up'],
-            vehicle_count_down=counting_result['count_down'],
-            total_count=counting_result['total'],
-            frame_number=frame_number
-        )
+        Geometry được tính một lần cho mỗi shift episode và khôi phục về
+        config gốc khi shift kết thúc.
+        """
+        monitor = self.shift_monitor
+        homography = None
+        if monitor.is_shifted and monitor.current_result is not None:
+            homography = monitor.current_result.get('homography')
+        
+        episode = monitor.episode_start if homography is not None else None
+        if episode == self._geometry_episode:
+            return
+        self._geometry_episode = episode
+        
+        # Frames đang chờ trong batch phải được đếm với counting line cũ
+        self.drain_batches()
+        self._frame_to_reference = homography
+        
+        counting_line = self.config['counting_line']
+        if homography is None:
+            self.roi_config = self.config['roi']
+            self._roi_tag = config_tag(self.roi_config)
+            self.detector.set_slice_region(self.roi_config)
+            self.counter.set_line(counting_line['start'], counting_line['end'])
+            self._set_engine_geometry(None)
+            logger.info("Using original ROI and counting line")
+            return
         
-        # Save image hash
-        save_image_hash(frame_path, self.db_path)
+        # Homography map frame hiện tại → reference, ROI/line ở tọa độ reference
+        reference_to_current = np.linalg.inv(homography)
+        self.roi_config = warp_roi_config(self.config['roi'], reference_to_current)
+        self._roi_tag = config_tag(self.roi_config)
+        self.detector.set_slice_region(self.roi_config)
+        start, end = warp_points([counting_line['start'], counting_line['end']], reference_to_current)
+        self.counter.set_line(start, end)
+        self._set_engine_geometry(reference_to_current)
+        logger.warning(
+            f"Camera shifted since {episode:.2f}s: using warped ROI and counting line "
+            f"{tuple(round(v, 1) for v in start)} -> {tuple(round(v, 1) for v in end)}"
+        )
+    
+    def _set_engine_geometry(self, homography: Optional[np.ndarray]):
+        """Đặt lines/zones của counting engine theo config gốc, hoặc warp theo homography"""
+        if self.engine is None:
+            return
+        line_points = [(line['start'], line['end']) for line in self.engine.lines]
+        zone_points = [zone['points'] for zone in self.engine.zones]
+        if homography is not None:
+            line_points = [tuple(warp_points([start, end], homography)) for start, end in line_points]
+            zone_points = [warp_points(points, homography) for points in zone_points]
+        self.engine.set_geometry(line_points, zone_points)
+    
+    def close(self):
+        """Giải phóng tài nguyên (dừng inference worker nếu có)"""
+        self.detector.close()
     
     def export_results(self, video_path: str):
         """Export kết quả ra JSON và CSV"""
@@ -234,12 +541,12 @@ class SystemKPipeline:
         timestamp = get_timestamp()
         video_name = get_video_name(video_path)
         
-        # Export counting results
+        # Export counting results (một row mỗi bin × line × class)
         json_path = f"results/counting_results_{video_name}_{timestamp}.json"
         csv_path = f"results/counting_results_{video_name}_{timestamp}.csv"
         
-        export_to_json(self.db_path, json_path, table='counting_results')
-        export_to_csv(self.db_path, csv_path, table='counting_results')
+        export_to_json(self.db_path, json_path, table='count_bins')
+        export_to_csv(self.db_path, csv_path, table='count_bins')
         
         # Export camera shifts
         json_shift_path = f"results/camera_shifts_{video_name}_{timestamp}.json"
@@ -248,8 +555,21 @@ class SystemKPipeline:
         export_to_json(self.db_path, json_shift_path, table='camera_shifts')
         export_to_csv(self.db_path, csv_shift_path, table='camera_shifts')
         
+        # Export counts theo line / zone / class và OD matrix
+        if self.engine is not None:
+            breakdown_path = f"results/counting_breakdown_{video_name}_{timestamp}.json"
+            create_directories("results")
+            with open(breakdown_path, 'w', encoding='utf-8') as f:
+                json.dump(self.engine.summary(), f, indent=2, ensure_ascii=False)
+            logger.info(f"Exported counting breakdown to {breakdown_path}")
+        
+        # Export tốc độ trung bình theo lane
+        if self.speed_estimator is not None:
+            export_to_json(self.db_path, f"results/speeds_{video_name}_{timestamp}.json", table='speed_bins')
+            export_to_csv(self.db_path, f"results/speeds_{video_name}_{timestamp}.csv", table='speed_bins')
+        
         # Print summary
-        summary = get_counting_summary(self.db_path, video_path)
+        summary = get_counting_summary(self.db_path, video_path, line=self.counter.name)
         logger.info("=" * 50)
         logger.info("COUNTING SUMMARY")
         logger.info(f"Count Up: {summary['count_up']}")
@@ -291,6 +611,59 @@ def main():
         default=None,
         help='Path to reference frame (optional, will use first frame if not provided)'
     )
+    parser.add_argument(
+        '--batch-size',
+        type=int,
+        default=8,
+        help='Number of frames per YOLO inference call (default: 8)'
+    )
+    parser.add_argument(
+        '--backend',
+        type=str,
+        default=None,
+        choices=['torch', 'onnx', 'openvino'],
+        help='Detector inference backend (default: from config, else torch)'
+    )
+    parser.add_argument(
+        '--detection-cache',
+        type=str,
+        default='data/detection_cache',
+        help='Directory for cached detections (default: data/detection_cache)'
+    )
+    parser.add_argument(
+        '--no-detection-cache',
+        action='store_true',
+        help='Always run the detector, do not read or write the detection cache'
+    )
+    parser.add_argument(
+        '--detection-stride',
+        type=int,
+        default=1,
+        help='Run detection every N frames, the tracker predicts the frames in between (default: 1)'
+    )
+    parser.add_argument(
+        '--optical-flow',
+        action='store_true',
+        help='Refine tracker predictions on non-detection frames with optical flow'
+    )
+    parser.add_argument(
+        '--tracker',
+        type=str,
+        default=None,
+        choices=['simple', 'bytetrack'],
+        help='Vehicle tracker (default: from config, else simple)'
+    )
+    parser.add_argument(
+        '--bin-minutes',
+        type=float,
+        default=None,
+        help='Length of each count bin in minutes of video time (default: from config, else 5)'
+    )
+    parser.add_argument(
+        '--inference-worker',
+        action='store_true',
+        help='Run the detector in a separate worker process (auto-restarted if it crashes)'
+    )
     parser.add_argument(
         '--log-level',
         type=str,
@@ -330,14 +703,25 @@ def main():
         pipeline = SystemKPipeline(
             config_path=args.config,
             db_path=args.db,
-            reference_frame_path=args.reference_frame
+            reference_frame_path=args.reference_frame,
+            batch_size=args.batch_size,
+            backend=args.backend,
+            detection_cache_dir=None if args.no_detection_cache else args.detection_cache,
+            use_worker=args.inference_worker,
+            detection_stride=args.detection_stride,
+            optical_flow=args.optical_flow,
+            tracker_type=args.tracker,
+            bin_minutes=args.bin_minutes
         )
         
         # Process video
-        pipeline.process_video(args.video, segment_duration=args.segment_duration)
+        try:
+            pipeline.process_video(args.video, segment_duration=args.segment_duration)
+        finally:
+            pipeline.close()
         
         logger.info("Processing completed successfully!")
-        
+    
     except Exception as e:
         logger.error(f"Error during processing: {e}", exc_info=True)
         sys.exit(1)
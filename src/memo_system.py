@@ -2,13 +2,14 @@
 Memo System
 Ghi chú kết quả check video: duplicate và camera shift
 """
-import sqlite3
 import os
 import logging
 from pathlib import Path
 from datetime import datetime
 from typing import List, Dict, Optional, Tuple
 
+from db_connection import get_connection
+
 logger = logging.getLogger(__name__)
 
 
@@ -16,7 +17,7 @@ def initialize_memo_database(db_path: str):
     """Khởi tạo database cho memo system"""
     Path(db_path).parent.mkdir(parents=True, exist_ok=True)
     
-    conn = sqlite3.connect(db_path)
+    conn = get_connection(db_path)
     cursor = conn.cursor()
     
     # Table video_checks: Lưu kết quả check video
@@ -68,7 +69,6 @@ def initialize_memo_database(db_path: str):
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_shift_video ON camera_shift_points(video_path)')
     
     conn.commit()
-    conn.close()
     logger.info(f"Memo database initialized: {db_path}")
 
 
@@ -94,7 +94,7 @@ def save_duplicate_memo(
     if not os.path.exists(db_path):
         initialize_memo_database(db_path)
     
-    conn = sqlite3.connect(db_path)
+    conn = get_connection(db_path)
     cursor = conn.cursor()
     
     created_at = datetime.now().isoformat()
@@ -109,9 +109,8 @@ def save_duplicate_memo(
         conn.commit()
         logger.info(f"Saved duplicate memo: {video_path} [{start_time:.2f}s - {end_time:.2f}s]")
     except Exception as e:
+        conn.rollback()
         logger.error(f"Error saving duplicate memo: {e}")
-    finally:
-        conn.close()
 
 
 def save_camera_shift_memo(
@@ -138,7 +137,7 @@ def save_camera_shift_memo(
     if not os.path.exists(db_path):
         initialize_memo_database(db_path)
     
-    conn = sqlite3.connect(db_path)
+    conn = get_connection(db_path)
     cursor = conn.cursor()
     
     created_at = datetime.now().isoformat()
@@ -153,9 +152,8 @@ def save_camera_shift_memo(
         conn.commit()
         logger.info(f"Saved camera shift memo: {video_path} at {shift_time:.2f}s")
     except Exception as e:
+        conn.rollback()
         logger.error(f"Error saving camera shift memo: {e}")
-    finally:
-        conn.close()
 
 
 def get_duplicate_segments(db_path: str, video_path: str) -> List[Dict]:
@@ -172,7 +170,7 @@ def get_duplicate_segments(db_path: str, video_path: str) -> List[Dict]:
     if not os.path.exists(db_path):
         return []
     
-    conn = sqlite3.connect(db_path)
+    conn = get_connection(db_path)
     cursor = conn.cursor()
     
     try:
@@ -196,8 +194,6 @@ def get_duplicate_segments(db_path: str, video_path: str) -> List[Dict]:
     except Exception as e:
         logger.error(f"Error getting duplicate segments: {e}")
         return []
-    finally:
-        conn.close()
 
 
 def get_camera_shift_points(db_path: str, video_path: str) -> List[Dict]:
@@ -214,7 +210,7 @@ def get_camera_shift_points(db_path: str, video_path: str) -> List[Dict]:
     if not os.path.exists(db_path):
         return []
     
-    conn = sqlite3.connect(db_path)
+    conn = get_connection(db_path)
     cursor = conn.cursor()
     
     try:
@@ -239,8 +235,6 @@ def get_camera_shift_points(db_path: str, video_path: str) -> List[Dict]:
     except Exception as e:
         logger.error(f"Error getting camera shift points: {e}")
         return []
-    finally:
-        conn.close()
 
 
 def generate_cut_plan(
@@ -0,0 +1,108 @@
+"""
+Model Registry
+Cache VehicleDetector dùng chung trong process: mỗi (model, backend, conf, ...)
+chỉ load + warm-up một lần, các job/thread sau dùng lại instance đã load
+"""
+import threading
+import logging
+import numpy as np
+from typing import Dict, Tuple, List
+
+logger = logging.getLogger(__name__)
+
+_registry_lock = threading.Lock()
+_registry: Dict[Tuple, object] = {}
+_load_locks: Dict[Tuple, threading.Lock] = {}
+
+
+def _make_key(model_path: str, backend: str, conf_threshold: float, backend_kwargs: Dict) -> Tuple:
+    """Key của registry; backend_kwargs được sort để thứ tự truyền vào không ảnh hưởng"""
+    extra = tuple(sorted((name, repr(value)) for name, value in backend_kwargs.items()))
+    return (model_path, backend, float(conf_threshold), extra)
+
+
+def warmup_detector(detector, imgsz: int = 640, runs: int = 1):
+    """
+    Chạy inference với ảnh đen để khởi tạo predictor, allocate memory, JIT...
+    
+    Args:
+        detector: VehicleDetector
+        imgsz: Kích thước ảnh dummy
+        runs: Số lần chạy
+    """
+    dummy = np.zeros((imgsz, imgsz, 3), dtype=np.uint8)
+    for _ in range(runs):
+        detector.detect_vehicles_arrays(dummy)
+
+
+def get_detector(
+    model_path: str = 'yolov8n.pt',
+    conf_threshold: float = 0.25,
+    backend: str = 'torch',
+    warmup: bool = True,
+    **backend_kwargs
+):
+    """
+    Lấy VehicleDetector dùng chung cho (model_path, backend, conf_threshold, backend_kwargs)
+    
+    Lần gọi đầu load model và warm-up; các lần sau trả về ngay instance đã cache.
+    Instance an toàn khi dùng từ nhiều thread (inference được serialize trong detector).
+    
+    Args:
+        model_path: Đường dẫn đến YOLO model
+        conf_threshold: Confidence threshold
+        backend: Inference backend ('torch', 'onnx', 'openvino')
+        warmup: Chạy một inference dummy ngay sau khi load
+        **backend_kwargs: Tham số riêng của backend
+    
+    Returns:
+        VehicleDetector: Detector dùng chung
+    """
+    key = _make_key(model_path, backend, conf_threshold, backend_kwargs)
+    
+    with _registry_lock:
+        detector = _registry.get(key)
+        if detector is not None:
+            return detector
+        load_lock = _load_locks.setdefault(key, threading.Lock())
+    
+    # Lock riêng cho từng key: thread khác chờ load xong thay vì load lần nữa,
+    # còn các model khác vẫn load song song được
+    with load_lock:
+        with _registry_lock:
+            detector = _registry.get(key)
+        if detector is not None:
+            return detector
+        
+        from vehicle_detection import VehicleDetector
+        detector = VehicleDetector(
+            model_path=model_path, conf_threshold=conf_threshold, backend=backend, **backend_kwargs
+        )
+        if warmup:
+            warmup_detector(detector, imgsz=backend_kwargs.get('imgsz', 640))
+            logger.info(f"Warmed up detector: {model_path} (backend: {backend})")
+        
+        with _registry_lock:
+            _registry[key] = detector
+    
+    return detector
+
+
+def registered_models() -> List[Tuple]:
+    """
+    Danh sách keys đã load trong registry
+    
+    Returns:
+        List[Tuple]: (model_path, backend, conf_threshold, backend_kwargs)
+    """
+    with _registry_lock:
+        return list(_registry.keys())
+
+
+def clear_registry():
+    """Bỏ tất cả detectors đã cache (ví dụ: sau khi cập nhật model file)"""
+    with _registry_lock:
+        count = len(_registry)
+        _registry.clear()
+        _load_locks.clear()
+    logger.debug(f"Cleared {count} cached detectors")
@@ -0,0 +1,302 @@
+"""
+INT8 Quantization
+Post-training INT8 quantization cho vehicle model (ONNX Runtime), calibrate bằng
+frames lấy từ footage của chính camera, kèm report latency / độ khớp với FP32
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import logging
+import cv2
+import numpy as np
+from pathlib import Path
+from typing import List, Dict, Optional
+
+# Add src directory to Python path to ensure imports work
+src_dir = Path(__file__).parent
+if str(src_dir) not in sys.path:
+    sys.path.insert(0, str(src_dir))
+
+from utils import setup_logging, create_directories, get_timestamp, get_video_name
+from image_extraction import extract_frames_by_time_interval
+from detection_backends import OnnxBackend, preprocess_batch, detection_recall
+from vehicle_detection import VEHICLE_CLASSES
+
+logger = logging.getLogger(__name__)
+
+
+def sample_calibration_frames(
+    video_path: str,
+    frames_dir: str,
+    time_interval: float = 10.0,
+    max_frames: int = 200
+) -> List[str]:
+    """
+    Lấy frames mẫu từ video bằng image extraction module
+    
+    Args:
+        video_path: Đường dẫn video của camera
+        frames_dir: Thư mục lưu frames
+        time_interval: Khoảng thời gian giữa các frame (giây)
+        max_frames: Số frames tối đa (lấy đều trên toàn video)
+    
+    Returns:
+        List[str]: Đường dẫn các frames
+    """
+    frame_paths = extract_frames_by_time_interval(video_path, frames_dir, time_interval_seconds=time_interval)
+    if len(frame_paths) > max_frames:
+        indices = np.linspace(0, len(frame_paths) - 1, max_frames).astype(int)
+        frame_paths = [frame_paths[i] for i in indices]
+    logger.info(f"Sampled {len(frame_paths)} frames from {video_path}")
+    return frame_paths
+
+
+class FrameCalibrationReader:
+    """CalibrationDataReader cho ONNX Runtime, đọc từng frame và letterbox như lúc inference"""
+    
+    def __init__(self, frame_paths: List[str], input_name: str, imgsz: int = 640):
+        self.frame_paths = frame_paths
+        self.input_name = input_name
+        self.imgsz = imgsz
+        self._iter = iter(frame_paths)
+    
+    def get_next(self) -> Optional[Dict[str, np.ndarray]]:
+        for path in self._iter:
+            image = cv2.imread(path)
+            if image is None:
+                logger.warning(f"Could not load calibration frame: {path}")
+                continue
+            batch, _ = preprocess_batch([image], self.imgsz)
+            return {self.input_name: batch}
+        return None
+    
+    def rewind(self):
+        self._iter = iter(self.frame_paths)
+
+
+def _head_nodes_to_exclude(model_path: str) -> List[str]:
+    """
+    Các node của detection head (trừ Conv) giữ ở FP32
+    
+    Box decoding (DFL, Concat, Sigmoid, ...) rất nhạy với INT8, quantize phần này
+    làm giảm mạnh độ chính xác mà gần như không tăng tốc.
+    """
+    import onnx
+    
+    model = onnx.load(model_path)
+    head_prefix = None
+    for node in model.graph.node:
+        # YOLOv8 export đặt tên node theo module: /model.<idx>/...; head là module cuối
+        if node.name.startswith('/model.'):
+            head_prefix = '/' + node.name.split('/')[1] + '/'
+    
+    if head_prefix is None:
+        return []
+    return [
+        node.name for node in model.graph.node
+        if node.name.startswith(head_prefix) and node.op_type != 'Conv'
+    ]
+
+
+def quantize_model(
+    fp32_path: str,
+    int8_path: str,
+    calibration_frames: List[str],
+    imgsz: int = 640,
+    per_channel: bool = True
+) -> str:
+    """
+    Quantize model ONNX FP32 sang INT8 (static, QDQ format)
+    
+    Args:
+        fp32_path: Model ONNX FP32
+        int8_path: Đường dẫn lưu model INT8
+        calibration_frames: Frames để calibrate activation ranges
+        imgsz: Kích thước input của model
+        per_channel: Quantize weights theo từng channel
+    
+    Returns:
+        str: Đường dẫn model INT8
+    """
+    try:
+        import onnxruntime as ort
+        from onnxruntime.quantization import (
+            quantize_static, QuantFormat, QuantType, CalibrationMethod
+        )
+        from onnxruntime.quantization.shape_inference import quant_pre_process
+    except ImportError:
+        raise ImportError("onnxruntime is required for INT8 quantization: pip install onnxruntime")
+    
+    Path(int8_path).parent.mkdir(parents=True, exist_ok=True)
+    
+    # Shape inference + graph optimization trước khi quantize
+    prepared_path = str(Path(int8_path).with_suffix('.prep.onnx'))
+    quant_pre_process(fp32_path, prepared_path)
+    
+    input_name = ort.InferenceSession(prepared_path, providers=['CPUExecutionProvider']).get_inputs()[0].name
+    reader = FrameCalibrationReader(calibration_frames, input_name, imgsz)
+    
+    logger.info(f"Calibrating INT8 model on {len(calibration_frames)} frames...")
+    quantize_static(
+        prepared_path,
+        int8_path,
+        reader,
+        quant_format=QuantFormat.QDQ,
+        per_channel=per_channel,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        calibrate_method=CalibrationMethod.MinMax,
+        nodes_to_exclude=_head_nodes_to_exclude(prepared_path)
+    )
+    os.remove(prepared_path)
+    
+    logger.info(f"Saved INT8 model: {int8_path}")
+    return int8_path
+
+
+def _measure(backend: OnnxBackend, frames: List[np.ndarray], class_ids: List[int], warmup: int = 3):
+    """Chạy backend trên từng frame, trả về (detections, latencies_ms)"""
+    for frame in frames[:warmup]:
+        backend.predict([frame], class_ids)
+    
+    detections = []
+    latencies = []
+    for frame in frames:
+        start = time.perf_counter()
+        detections.append(backend.predict([frame], class_ids)[0])
+        latencies.append((time.perf_counter() - start) * 1000.0)
+    return detections, np.array(latencies)
+
+
+def evaluate_quantization(
+    fp32_path: str,
+    int8_path: str,
+    eval_frames: List[str],
+    conf_threshold: float = 0.25,
+    iou_threshold: float = 0.5,
+    imgsz: int = 640
+) -> Dict:
+    """
+    So sánh latency và độ khớp detections giữa model FP32 và INT8
+    
+    Args:
+        fp32_path: Model ONNX FP32
+        int8_path: Model ONNX INT8
+        eval_frames: Frames dùng để đánh giá (nên khác frames calibrate)
+        conf_threshold: Confidence threshold
+        iou_threshold: IoU tối thiểu để coi 2 detections là khớp
+        imgsz: Kích thước input của model
+    
+    Returns:
+        Dict: Report (latency FP32/INT8, speedup, recall/precision so với FP32)
+    """
+    frames = [cv2.imread(p) for p in eval_frames]
+    frames = [f for f in frames if f is not None]
+    if not frames:
+        raise ValueError("No evaluation frames could be loaded")
+    
+    class_ids = list(VEHICLE_CLASSES.keys())
+    fp32 = OnnxBackend(model_path=fp32_path, conf_threshold=conf_threshold, imgsz=imgsz)
+    int8 = OnnxBackend(model_path=int8_path, conf_threshold=conf_threshold, imgsz=imgsz)
+    
+    fp32_detections, fp32_latency = _measure(fp32, frames, class_ids)
+    int8_detections, int8_latency = _measure(int8, frames, class_ids)
+    
+    # Recall: detections FP32 được INT8 tìm lại; precision: ngược lại
+    matched = total_fp32 = 0
+    matched_int8 = total_int8 = 0
+    for reference, candidate in zip(fp32_detections, int8_detections):
+        m, t = detection_recall(reference, candidate, iou_threshold)
+        matched += m
+        total_fp32 += t
+        m, t = detection_recall(candidate, reference, iou_threshold)
+        matched_int8 += m
+        total_int8 += t
+    
+    return {
+        'num_frames': len(frames),
+        'iou_threshold': iou_threshold,
+        'conf_threshold': conf_threshold,
+        'fp32': {
+            'model': fp32_path,
+            'latency_ms_mean': float(fp32_latency.mean()),
+            'latency_ms_p95': float(np.percentile(fp32_latency, 95)),
+            'detections': total_fp32
+        },
+        'int8': {
+            'model': int8_path,
+            'latency_ms_mean': float(int8_latency.mean()),
+            'latency_ms_p95': float(np.percentile(int8_latency, 95)),
+            'detections': total_int8
+        },
+        'speedup': float(fp32_latency.mean() / max(int8_latency.mean(), 1e-9)),
+        'recall_vs_fp32': matched / total_fp32 if total_fp32 else 1.0,
+        'precision_vs_fp32': matched_int8 / total_int8 if total_int8 else 1.0
+    }
+
+
+def main():
+    """CLI: calibrate + quantize + report cho một camera"""
+    parser = argparse.ArgumentParser(description='INT8 quantization cho vehicle detector (per camera)')
+    parser.add_argument('--video', type=str, required=True, help='Video footage của camera dùng để calibrate')
+    parser.add_argument('--model', type=str, default='yolov8n.pt', help='Model FP32 (.pt hoặc .onnx, default: yolov8n.pt)')
+    parser.add_argument('--output', type=str, default=None,
+                        help='Đường dẫn model INT8 (default: <model>_int8_<video>.onnx)')
+    parser.add_argument('--interval', type=float, default=10.0, help='Khoảng thời gian lấy frame (giây, default: 10)')
+    parser.add_argument('--max-frames', type=int, default=200, help='Số frames tối đa lấy từ video (default: 200)')
+    parser.add_argument('--imgsz', type=int, default=640, help='Kích thước input model (default: 640)')
+    parser.add_argument('--conf', type=float, default=0.25, help='Confidence threshold khi đánh giá (default: 0.25)')
+    parser.add_argument('--report', type=str, default=None,
+                        help='Đường dẫn report JSON (default: results/quantization_<video>_<timestamp>.json)')
+    parser.add_argument('--log-level', type=str, default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'])
+    args = parser.parse_args()
+    
+    setup_logging(getattr(logging, args.log_level.upper()))
+    
+    if not os.path.exists(args.video):
+        logger.error(f"Video file not found: {args.video}")
+        sys.exit(1)
+    
+    video_name = get_video_name(args.video)
+    frames_dir = os.path.join('data', 'calibration', video_name)
+    create_directories(frames_dir, 'results')
+    
+    # Step 1: Lấy frames từ footage; nửa để calibrate, nửa để đánh giá
+    frame_paths = sample_calibration_frames(args.video, frames_dir, args.interval, args.max_frames)
+    if len(frame_paths) < 2:
+        logger.error("Not enough frames for calibration and evaluation, try a smaller --interval")
+        sys.exit(1)
+    calibration_frames = frame_paths[0::2]
+    eval_frames = frame_paths[1::2]
+    
+    # Step 2: Model FP32 ONNX (export + cache bên cạnh .pt nếu cần)
+    fp32_path = OnnxBackend(model_path=args.model, imgsz=args.imgsz).exported_path
+    
+    # Step 3: Quantize
+    int8_path = args.output or str(Path(fp32_path).with_name(f"{Path(fp32_path).stem}_int8_{video_name}.onnx"))
+    quantize_model(fp32_path, int8_path, calibration_frames, imgsz=args.imgsz)
+    
+    # Step 4: Report
+    report = evaluate_quantization(fp32_path, int8_path, eval_frames, conf_threshold=args.conf, imgsz=args.imgsz)
+    report['video'] = args.video
+    report['calibration_frames'] = len(calibration_frames)
+    
+    report_path = args.report or f"results/quantization_{video_name}_{get_timestamp()}.json"
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    
+    logger.info("=" * 50)
+    logger.info("QUANTIZATION REPORT")
+    logger.info(f"FP32 latency: {report['fp32']['latency_ms_mean']:.1f} ms (p95 {report['fp32']['latency_ms_p95']:.1f})")
+    logger.info(f"INT8 latency: {report['int8']['latency_ms_mean']:.1f} ms (p95 {report['int8']['latency_ms_p95']:.1f})")
+    logger.info(f"Speedup: {report['speedup']:.2f}x")
+    logger.info(f"Recall vs FP32: {report['recall_vs_fp32']:.3f}, precision vs FP32: {report['precision_vs_fp32']:.3f}")
+    logger.info(f"INT8 model: {int8_path}")
+    logger.info(f"Report: {report_path}")
+    logger.info("=" * 50)
+
+
+if __name__ == '__main__':
+    main()
@@ -5,7 +5,7 @@ Bôi đen phần thừa (ROI masking)
 import cv2
 import numpy as np
 import logging
-from typing import Dict, List, Tuple
+from typing import Dict, List, Tuple, Optional
 
 logger = logging.getLogger(__name__)
 
@@ -120,3 +120,76 @@ def create_roi_mask(image_shape: Tuple[int, int], roi_config: Dict) -> np.ndarra
     
     return mask
 
+
+def roi_bounds(roi_config: Dict) -> Optional[Tuple[float, float, float, float]]:
+    """
+    Bounding box của ROI
+    
+    Args:
+        roi_config: Config dictionary chứa ROI settings
+    
+    Returns:
+        Optional[Tuple]: (x1, y1, x2, y2) hoặc None nếu ROI không hợp lệ
+    """
+    roi_type = roi_config.get('type', 'polygon')
+    if roi_type == 'polygon':
+        points = roi_config.get('points', [])
+        if len(points) < 3:
+            return None
+        pts = np.asarray(points, dtype=np.float32)
+        return (float(pts[:, 0].min()), float(pts[:, 1].min()), float(pts[:, 0].max()), float(pts[:, 1].max()))
+    if roi_type == 'rectangle' and all(k in roi_config for k in ('x', 'y', 'width', 'height')):
+        x, y = roi_config['x'], roi_config['y']
+        return (float(x), float(y), float(x + roi_config['width']), float(y + roi_config['height']))
+    return None
+
+
+
+def warp_points(points: List[List[float]], homography: np.ndarray) -> List[List[float]]:
+    """
+    Biến đổi danh sách điểm bằng homography
+    
+    Args:
+        points: List các điểm [x, y]
+        homography: Homography matrix 3x3
+    
+    Returns:
+        List[List[float]]: Các điểm sau khi biến đổi
+    """
+    if len(points) == 0:
+        return []
+    pts = np.asarray(points, dtype=np.float32).reshape(-1, 1, 2)
+    warped = cv2.perspectiveTransform(pts, np.asarray(homography, dtype=np.float64))
+    return warped.reshape(-1, 2).tolist()
+
+
+def warp_roi_config(roi_config: Dict, homography: np.ndarray) -> Dict:
+    """
+    Tạo ROI config mới đã biến đổi theo homography (bù camera shift)
+    
+    Rectangle ROI được chuyển thành polygon 4 điểm vì sau khi biến đổi
+    không còn là hình chữ nhật.
+    
+    Args:
+        roi_config: Config dictionary chứa ROI settings
+        homography: Homography matrix 3x3 (tọa độ reference → frame hiện tại)
+    
+    Returns:
+        Dict: ROI config mới (config gốc không bị thay đổi)
+    """
+    roi_type = roi_config.get('type', 'polygon')
+    warped_config = dict(roi_config)
+    
+    if roi_type == 'polygon':
+        points = roi_config.get('points', [])
+    elif roi_type == 'rectangle' and all(k in roi_config for k in ('x', 'y', 'width', 'height')):
+        x, y = roi_config['x'], roi_config['y']
+        w, h = roi_config['width'], roi_config['height']
+        points = [[x, y], [x + w, y], [x + w, y + h], [x, y + h]]
+    else:
+        logger.warning(f"Cannot warp ROI type: {roi_type}")
+        return warped_config
+    
+    warped_config['type'] = 'polygon'
+    warped_config['points'] = warp_points(points, homography)
+    return warped_config
@@ -0,0 +1,92 @@
+"""
+Spatial Grid
+Uniform grid để tìm các cặp (điểm, vùng tròn) gần nhau trong O(N) (bucket counting) thay vì so sánh tất cả các cặp
+(dùng cho gating của tracker khi có hàng trăm detections / tracks mỗi frame)
+"""
+import numpy as np
+from typing import Tuple
+
+# Số ô tối đa của bảng bucket dày đặc: chỉ số ô vừa uint16 nên NumPy sắp xếp bằng radix sort (O(n))
+MAX_DENSE_CELLS = 1 << 16
+
+
+def _cell_keys(cx: np.ndarray, cy: np.ndarray) -> np.ndarray:
+    """Key 64-bit duy nhất cho mỗi ô (cx, cy), chấp nhận chỉ số âm"""
+    return (cx.astype(np.int64) << 32) + (cy.astype(np.int64) & 0xFFFFFFFF)
+
+
+def candidate_pairs(
+    points: np.ndarray,
+    centers: np.ndarray,
+    radii: np.ndarray,
+    cell_size: float
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Các cặp (point, center) có thể nằm trong bán kính của center
+    
+    Mỗi center được đưa vào tất cả các ô mà hình vuông bao vòng tròn bán kính radius chạm tới,
+    mỗi point chỉ tra ô chứa nó, nên mọi cặp có khoảng cách <= radius đều có mặt (có thể thừa
+    một ít cặp ở góc ô, caller lọc lại bằng khoảng cách thật). Grid dựng lại mỗi lần gọi.
+    
+    Khi vùng các centers phủ không quá MAX_DENSE_CELLS ô, các ô được đánh số dày đặc và gom bằng
+    bucket counting (bincount + cumsum, radix sort), tổng O(N + M + số ô). Vùng rộng hơn (tọa độ
+    rất tản mát) dùng sort theo key của ô, O((N + M) log M).
+    
+    Args:
+        points: (N, 2) ví dụ centroids của detections
+        centers: (M, 2) ví dụ vị trí dự đoán của tracks
+        radii: (M,) bán kính gating của mỗi center
+        cell_size: Kích thước ô (nên xấp xỉ bán kính gating phổ biến)
+    
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: (point indices, center indices), mỗi cặp xuất hiện một lần
+    """
+    empty = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+    if len(points) == 0 or len(centers) == 0:
+        return empty
+    
+    # Dải ô của mỗi center
+    low = np.floor((centers - radii[:, None]) / cell_size).astype(np.int64)
+    high = np.floor((centers + radii[:, None]) / cell_size).astype(np.int64)
+    spans = high - low + 1  # (M, 2)
+    counts = spans[:, 0] * spans[:, 1]
+    
+    # Mở rộng thành các cặp (center, ô) bằng repeat: offset trong dải ô của từng center
+    owners = np.repeat(np.arange(len(centers)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    cell_x = low[owners, 0] + offsets // spans[owners, 1]
+    cell_y = low[owners, 1] + offsets % spans[owners, 1]
+    
+    point_cells = np.floor(points / cell_size).astype(np.int64)
+    origin = low.min(axis=0)
+    extent = high.max(axis=0) - origin + 1
+    if extent[0] * extent[1] <= MAX_DENSE_CELLS:
+        # Bucket counting: ô → chỉ số dày đặc, mỗi point tra bảng start/count của ô chứa nó
+        buckets = ((cell_x - origin[0]) * extent[1] + (cell_y - origin[1])).astype(np.uint16)
+        owners = owners[np.argsort(buckets, kind='stable')]
+        bucket_counts = np.bincount(buckets, minlength=extent[0] * extent[1])
+        bucket_starts = np.cumsum(bucket_counts) - bucket_counts
+        
+        local = point_cells - origin
+        inside = np.all((local >= 0) & (local < extent), axis=1)
+        point_buckets = local[inside, 0] * extent[1] + local[inside, 1]
+        start = np.zeros(len(points), dtype=np.int64)
+        matches = np.zeros(len(points), dtype=np.int64)
+        start[inside] = bucket_starts[point_buckets]
+        matches[inside] = bucket_counts[point_buckets]
+    else:
+        keys = _cell_keys(cell_x, cell_y)
+        order = np.argsort(keys, kind='stable')
+        keys = keys[order]
+        owners = owners[order]
+        
+        # Mỗi point tra đúng một ô: các centers trong ô đó là ứng viên
+        point_keys = _cell_keys(point_cells[:, 0], point_cells[:, 1])
+        start = np.searchsorted(keys, point_keys, side='left')
+        matches = np.searchsorted(keys, point_keys, side='right') - start
+    if matches.sum() == 0:
+        return empty
+    
+    point_idx = np.repeat(np.arange(len(points)), matches)
+    entry = np.repeat(start, matches) + np.arange(matches.sum()) - np.repeat(np.cumsum(matches) - matches, matches)
+    return point_idx, owners[entry]
@@ -0,0 +1,221 @@
+"""
+Speed Estimation
+Ước lượng tốc độ xe từ trajectories đã kết thúc: chuyển vị trí sang mặt đường (homography đã calibrate)
+và hồi quy robust (Theil-Sen) theo thời gian, gom theo lane vào cùng các bin thời gian với counts
+"""
+import cv2
+import logging
+import warnings
+import numpy as np
+from typing import Dict, List, Optional
+
+from counting import CountBins, points_in_polygons
+
+logger = logging.getLogger(__name__)
+
+
+def ground_homography(image_points: List[List[float]], world_points: List[List[float]]) -> np.ndarray:
+    """
+    Homography từ tọa độ ảnh sang tọa độ mặt đường
+    
+    Args:
+        image_points: 4 điểm trên mặt đường trong ảnh [[x, y], ...] (pixels)
+        world_points: 4 điểm tương ứng trên mặt đường [[X, Y], ...] (mét)
+    
+    Returns:
+        np.ndarray: Homography 3x3 (ảnh → mặt đường)
+    """
+    image_points = np.asarray(image_points, dtype=np.float32).reshape(-1, 2)
+    world_points = np.asarray(world_points, dtype=np.float32).reshape(-1, 2)
+    if len(image_points) != 4 or len(world_points) != 4:
+        raise ValueError("Calibration cần đúng 4 image_points và 4 world_points")
+    return cv2.getPerspectiveTransform(image_points, world_points).astype(np.float64)
+
+
+def transform_points(points: np.ndarray, homography: np.ndarray) -> np.ndarray:
+    """
+    Áp dụng homography cho (..., 2) điểm trong một phép nhân ma trận
+    
+    Returns:
+        np.ndarray: (..., 2) điểm sau biến đổi
+    """
+    points = np.asarray(points, dtype=np.float64)
+    projected = points @ homography[:, :2].T + homography[:, 2]
+    return projected[..., :2] / projected[..., 2:3]
+
+
+def theil_sen_slopes(times: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """
+    Hệ số góc Theil-Sen (median của slopes giữa mọi cặp điểm) cho nhiều chuỗi cùng lúc
+    
+    Ít bị ảnh hưởng bởi vài điểm sai (box bị che, nhảy box) hơn least squares hoặc sai phân
+    giữa hai frame liên tiếp.
+    
+    Args:
+        times: (T, N) thời gian, NaN ở các vị trí padding
+        values: (T, N, D) giá trị, NaN ở các vị trí padding
+    
+    Returns:
+        np.ndarray: (T, D) hệ số góc, NaN nếu chuỗi có ít hơn 2 điểm
+    """
+    first, second = np.triu_indices(times.shape[1], 1)
+    dt = times[:, second] - times[:, first]  # (T, P)
+    dt[~(dt > 0)] = np.nan
+    slopes = (values[:, second] - values[:, first]) / dt[..., None]  # (T, P, D)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)  # All-NaN slice khi chuỗi < 2 điểm
+        return np.nanmedian(slopes, axis=1)
+
+
+class SpeedEstimator:
+    """
+    Tốc độ (km/h) của các tracks đã kết thúc, tính theo batch
+    
+    Vị trí dùng điểm giữa cạnh dưới của box (điểm tiếp xúc mặt đường) nên không bị lệch theo
+    chiều cao xe như centroid. Lane của track là lane chứa nhiều điểm trajectory nhất.
+    """
+    
+    def __init__(
+        self,
+        homography: np.ndarray,
+        lanes: Optional[List[Dict]] = None,
+        min_points: int = 8,
+        max_speed: float = 250.0
+    ):
+        """
+        Args:
+            homography: Homography 3x3 ảnh → mặt đường (mét)
+            lanes: List lanes {'name', 'points': [[x, y], ...]} trong ảnh (None = một lane 'all')
+            min_points: Số điểm trajectory tối thiểu để ước lượng tốc độ
+            max_speed: Tốc độ tối đa hợp lệ (km/h), lớn hơn coi là lỗi tracking và bỏ qua
+        """
+        self.homography = np.asarray(homography, dtype=np.float64)
+        self.lanes = [dict(lane) for lane in (lanes or [])]
+        self.lane_names = [lane.get('name', f"lane_{idx}") for idx, lane in enumerate(self.lanes)] or ['all']
+        self._lane_polygons = [np.asarray(lane['points'], dtype=np.float64).reshape(-1, 2) for lane in self.lanes]
+        self.min_points = min_points
+        self.max_speed = max_speed
+    
+    @classmethod
+    def from_config(cls, calibration: Dict) -> 'SpeedEstimator':
+        """
+        Tạo estimator từ phần 'calibration' của config (do calibration_tool.py ghi)
+        
+        Args:
+            calibration: {'image_points', 'world_points', 'lanes' (tùy chọn), 'min_points', 'max_speed'}
+        """
+        return cls(
+            ground_homography(calibration['image_points'], calibration['world_points']),
+            lanes=calibration.get('lanes'),
+            min_points=calibration.get('min_points', 8),
+            max_speed=calibration.get('max_speed', 250.0)
+        )
+    
+    def estimate(
+        self,
+        trajectories: List[Dict],
+        fps: float,
+        frame_to_reference: Optional[np.ndarray] = None
+    ) -> List[Dict]:
+        """
+        Ước lượng tốc độ của các trajectories (một lần cho cả batch)
+        
+        Args:
+            trajectories: Trajectories từ tracker.pop_finished_trajectories() ({'frames', 'boxes', ...})
+            fps: FPS của video (frames trong trajectory là số thứ tự frame)
+            frame_to_reference: Homography frame hiện tại → reference frame khi camera lệch (None = không lệch)
+        
+        Returns:
+            List[Dict]: {'track_id', 'class', 'lane', 'speed' (km/h)} cho các tracks ước lượng được
+        """
+        trajectories = [t for t in trajectories if len(t['frames']) >= self.min_points]
+        if not trajectories:
+            return []
+        
+        # Pad các trajectories thành (T, N), các điểm của tất cả tracks biến đổi trong một lần
+        lengths = np.array([len(t['frames']) for t in trajectories])
+        count, width = len(trajectories), int(lengths.max())
+        valid = np.arange(width) < lengths[:, None]
+        boxes = np.concatenate([np.asarray(t['boxes'], dtype=np.float64) for t in trajectories])
+        image_points = np.column_stack(((boxes[:, 0] + boxes[:, 2]) / 2.0, boxes[:, 3]))
+        if frame_to_reference is not None:
+            image_points = transform_points(image_points, frame_to_reference)
+        
+        times = np.full((count, width), np.nan)
+        times[valid] = np.concatenate([np.asarray(t['frames'], dtype=np.float64) for t in trajectories]) / fps
+        ground = np.full((count, width, 2), np.nan)
+        ground[valid] = transform_points(image_points, self.homography)
+        
+        velocity = theil_sen_slopes(times, ground)  # m/s
+        speeds = np.hypot(velocity[:, 0], velocity[:, 1]) * 3.6
+        
+        # Lane = lane chứa nhiều điểm nhất (-1 = ngoài mọi lane)
+        if self._lane_polygons:
+            inside = points_in_polygons(image_points, self._lane_polygons).astype(np.int32)
+            votes = np.add.reduceat(inside, np.concatenate([[0], np.cumsum(lengths)[:-1]]), axis=0)
+            lanes = np.where(votes.max(axis=1) > 0, votes.argmax(axis=1), -1)
+        else:
+            lanes = np.zeros(count, dtype=np.int64)
+        
+        keep = np.isfinite(speeds) & (speeds <= self.max_speed) & (lanes >= 0)
+        if (~keep).any():
+            logger.debug(f"Speed estimation skipped {int((~keep).sum())}/{count} trajectories")
+        return [
+            {
+                'track_id': int(trajectories[idx]['track_id']),
+                'class': trajectories[idx].get('class', 'unknown'),
+                'lane': self.lane_names[lanes[idx]],
+                'speed': float(speeds[idx])
+            }
+            for idx in np.flatnonzero(keep).tolist()
+        ]
+
+
+class SpeedBins(CountBins):
+    """
+    Tốc độ trung bình theo (bin thời gian, lane, class), dùng cùng bin clock với CountBins
+    
+    counts: (K, C, 2) [tổng tốc độ, số tracks] của bin hiện tại. Tốc độ của một track được tính
+    vào bin đang mở khi track kết thúc.
+    """
+    
+    def __init__(self, bin_seconds: float = 300.0, lanes: Optional[List[str]] = None, classes: Optional[List[str]] = None):
+        """
+        Args:
+            bin_seconds: Độ dài mỗi bin (giây video), nên bằng bin của counts
+            lanes: Tên các lanes
+            classes: Các class biết trước
+        """
+        super().__init__(bin_seconds, lines=lanes, classes=classes)
+        self.counts = self.counts.astype(np.float64)
+    
+    def add(self, speeds: List[Dict], line: Optional[str] = None):
+        """
+        Cộng tốc độ của các tracks vào bin hiện tại
+        
+        Args:
+            speeds: Kết quả SpeedEstimator.estimate()
+            line: Không dùng (lane lấy từ mỗi kết quả)
+        """
+        for result in speeds:
+            lane_id = self._line_id(result['lane'])
+            class_id = self._class_id(result['class'])
+            self.counts[lane_id, class_id] += (result['speed'], 1.0)
+    
+    def _close(self) -> List[Dict]:
+        """Rows của bin hiện tại {'bin_start', 'bin_end', 'lane', 'class', 'num_tracks', 'avg_speed'}"""
+        bin_start = self.current_bin * self.bin_seconds
+        rows = []
+        for lane_id, lane in enumerate(self.lines):
+            for class_id, cls in enumerate(self.classes):
+                total, samples = self.counts[lane_id, class_id]
+                rows.append({
+                    'bin_start': bin_start,
+                    'bin_end': bin_start + self.bin_seconds,
+                    'lane': lane,
+                    'class': cls,
+                    'num_tracks': int(samples),
+                    'avg_speed': float(total / samples) if samples else None
+                })
+        self.counts[:] = 0
+        return rows
@@ -3,15 +3,17 @@ Module 9: Storage
 Lưu kết quả vào SQLite, JSON, CSV
 """
 import os
-import sqlite3
 import json
 import csv
+import numpy as np
 import pandas as pd
 import logging
 from pathlib import Path
 from datetime import datetime
 from typing import Dict, List, Optional
 
+from db_connection import get_connection
+
 logger = logging.getLogger(__name__)
 
 
@@ -19,10 +21,11 @@ def initialize_database(db_path: str):
     """Khởi tạo database với các tables cần thiết"""
     Path(db_path).parent.mkdir(parents=True, exist_ok=True)
     
-    conn = sqlite3.connect(db_path)
+    conn = get_connection(db_path)
     cursor = conn.cursor()
     
-    # Table counting_results
+    # Table counting_results: format cũ (tổng tích lũy theo từng frame), pipeline không ghi nữa;
+    # giữ lại để database cũ vẫn mở / export được, số liệu hiện tại nằm trong count_bins
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS counting_results (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -37,6 +40,37 @@ def initialize_database(db_path: str):
         )
     ''')
     
+    # Table count_bins: số xe theo (bin thời gian video, line, class), mỗi bin ghi một lần khi đóng
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS count_bins (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            video_path TEXT,
+            bin_start REAL NOT NULL,
+            bin_end REAL NOT NULL,
+            line TEXT NOT NULL,
+            class TEXT NOT NULL,
+            count_up INTEGER DEFAULT 0,
+            count_down INTEGER DEFAULT 0,
+            total_count INTEGER DEFAULT 0,
+            created_at TEXT NOT NULL
+        )
+    ''')
+    
+    # Table speed_bins: tốc độ trung bình (km/h) theo (bin thời gian video, lane, class)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS speed_bins (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            video_path TEXT,
+            bin_start REAL NOT NULL,
+            bin_end REAL NOT NULL,
+            lane TEXT NOT NULL,
+            class TEXT NOT NULL,
+            num_tracks INTEGER DEFAULT 0,
+            avg_speed REAL,
+            created_at TEXT NOT NULL
+        )
+    ''')
+    
     # Table camera_shifts
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS camera_shifts (
@@ -51,59 +85,127 @@ def initialize_database(db_path: str):
         )
     ''')
     
+    # Table trajectories: mỗi dòng là trajectory của một track đã kết thúc, lưu dạng binary
+    # (frames: int32 offset từ start_frame, boxes: float32 (num_points, 4), little-endian)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS trajectories (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            video_path TEXT,
+            track_id INTEGER NOT NULL,
+            class TEXT,
+            start_frame INTEGER,
+            end_frame INTEGER,
+            num_points INTEGER,
+            frames BLOB,
+            boxes BLOB,
+            created_at TEXT NOT NULL
+        )
+    ''')
+    
     # Create indexes
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_timestamp ON counting_results(timestamp)')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_video_path ON counting_results(video_path)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_count_bins_video ON count_bins(video_path, bin_start)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_speed_bins_video ON speed_bins(video_path, bin_start)')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_camera_timestamp ON camera_shifts(timestamp)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_trajectory_video ON trajectories(video_path, track_id)')
     
     conn.commit()
-    conn.close()
     logger.info(f"Database initialized: {db_path}")
 
 
-def save_counting_result(
-    db_path: str,
-    video_path: Optional[str] = None,
-    frame_path: Optional[str] = None,
-    vehicle_count_up: int = 0,
-    vehicle_count_down: int = 0,
-    total_count: int = 0,
-    frame_number: Optional[int] = None
-):
+def save_count_bins(db_path: str, rows: List[Dict], video_path: Optional[str] = None):
     """
-    Lưu kết quả đếm xe vào database
+    Lưu các count bins đã đóng vào database (một transaction)
     
     Args:
         db_path: Đường dẫn đến database
+        rows: Rows từ CountBins.advance() / flush()
         video_path: Đường dẫn video
-        frame_path: Đường dẫn frame
-        vehicle_count_up: Số xe đếm được chiều lên
-        vehicle_count_down: Số xe đếm được chiều xuống
-        total_count: Tổng số xe
-        frame_number: Số thứ tự frame
     """
+    if not rows:
+        return
     if not os.path.exists(db_path):
         initialize_database(db_path)
     
-    conn = sqlite3.connect(db_path)
+    conn = get_connection(db_path)
     cursor = conn.cursor()
+    created_at = datetime.now().isoformat()
     
-    timestamp = datetime.now().isoformat()
+    try:
+        cursor.executemany('''
+            INSERT INTO count_bins
+            (video_path, bin_start, bin_end, line, class, count_up, count_down, total_count, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', [
+            (video_path, row['bin_start'], row['bin_end'], row['line'], row['class'],
+             row['count_up'], row['count_down'], row['count_up'] + row['count_down'], created_at)
+            for row in rows
+        ])
+        conn.commit()
+        logger.debug(f"Saved {len(rows)} count bin rows")
+    except Exception as e:
+        conn.rollback()
+        logger.error(f"Error saving count bins: {e}")
+
+
+def save_speed_bins(db_path: str, rows: List[Dict], video_path: Optional[str] = None):
+    """
+    Lưu các speed bins đã đóng vào database (một transaction)
+    
+    Args:
+        db_path: Đường dẫn đến database
+        rows: Rows từ SpeedBins.advance() / flush()
+        video_path: Đường dẫn video
+    """
+    if not rows:
+        return
+    if not os.path.exists(db_path):
+        initialize_database(db_path)
+    
+    conn = get_connection(db_path)
+    cursor = conn.cursor()
     created_at = datetime.now().isoformat()
     
     try:
-        cursor.execute('''
-            INSERT INTO counting_results 
-            (timestamp, video_path, frame_path, vehicle_count_up, vehicle_count_down, total_count, frame_number, created_at)
+        cursor.executemany('''
+            INSERT INTO speed_bins
+            (video_path, bin_start, bin_end, lane, class, num_tracks, avg_speed, created_at)
             VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (timestamp, video_path, frame_path, vehicle_count_up, vehicle_count_down, total_count, frame_number, created_at))
-        
+        ''', [
+            (video_path, row['bin_start'], row['bin_end'], row['lane'], row['class'],
+             row['num_tracks'], row['avg_speed'], created_at)
+            for row in rows
+        ])
         conn.commit()
-        logger.debug(f"Saved counting result: total={total_count}")
+        logger.debug(f"Saved {len(rows)} speed bin rows")
     except Exception as e:
-        logger.error(f"Error saving counting result: {e}")
-    finally:
-        conn.close()
+        conn.rollback()
+        logger.error(f"Error saving speed bins: {e}")
+
+
+def delete_video_results(db_path: str, video_path: str):
+    """
+    Xóa count bins, speed bins và trajectories đã lưu của một video (trước khi xử lý lại video)
+    
+    Args:
+        db_path: Đường dẫn đến database
+        video_path: Đường dẫn video
+    """
+    if not os.path.exists(db_path):
+        return
+    
+    conn = get_connection(db_path)
+    cursor = conn.cursor()
+    
+    try:
+        for table in ('count_bins', 'speed_bins', 'trajectories'):
+            cursor.execute(f'DELETE FROM {table} WHERE video_path = ?', (video_path,))
+        conn.commit()
+        logger.debug(f"Deleted previous results of {video_path}")
+    except Exception as e:
+        conn.rollback()
+        logger.error(f"Error deleting results of {video_path}: {e}")
 
 
 def save_camera_shift(
@@ -130,7 +232,7 @@ def save_camera_shift(
     if not os.path.exists(db_path):
         initialize_database(db_path)
     
-    conn = sqlite3.connect(db_path)
+    conn = get_connection(db_path)
     cursor = conn.cursor()
     
     timestamp = datetime.now().isoformat()
@@ -145,12 +247,96 @@ def save_camera_shift(
         conn.commit()
         logger.debug(f"Saved camera shift: is_shifted={is_shifted}")
     except Exception as e:
+        conn.rollback()
         logger.error(f"Error saving camera shift: {e}")
-    finally:
-        conn.close()
 
 
-def export_to_json(db_path: str, output_path: str, table: str = 'counting_results'):
+def save_trajectories(db_path: str, trajectories: List[Dict], video_path: Optional[str] = None):
+    """
+    Lưu trajectories của các tracks đã kết thúc vào database (một transaction)
+    
+    Args:
+        db_path: Đường dẫn đến database
+        trajectories: Trajectories từ tracker.pop_finished_trajectories()
+        video_path: Đường dẫn video
+    """
+    if not trajectories:
+        return
+    if not os.path.exists(db_path):
+        initialize_database(db_path)
+    
+    conn = get_connection(db_path)
+    cursor = conn.cursor()
+    created_at = datetime.now().isoformat()
+    
+    rows = []
+    for trajectory in trajectories:
+        frames = np.asarray(trajectory['frames'], dtype=np.int64)
+        if len(frames) == 0:
+            continue
+        start_frame = int(frames[0])
+        rows.append((
+            video_path,
+            int(trajectory['track_id']),
+            trajectory.get('class', 'unknown'),
+            start_frame,
+            int(frames[-1]),
+            len(frames),
+            (frames - start_frame).astype('<i4').tobytes(),
+            np.asarray(trajectory['boxes'], dtype='<f4').tobytes(),
+            created_at
+        ))
+    
+    try:
+        cursor.executemany('''
+            INSERT INTO trajectories
+            (video_path, track_id, class, start_frame, end_frame, num_points, frames, boxes, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', rows)
+        conn.commit()
+        logger.debug(f"Saved {len(rows)} trajectories")
+    except Exception as e:
+        conn.rollback()
+        logger.error(f"Error saving trajectories: {e}")
+
+
+def load_trajectories(db_path: str, video_path: Optional[str] = None) -> List[Dict]:
+    """
+    Đọc trajectories từ database
+    
+    Args:
+        db_path: Đường dẫn đến database
+        video_path: Đường dẫn video (None = tất cả videos)
+    
+    Returns:
+        List[Dict]: {'video_path', 'track_id', 'class', 'frames' (N,), 'boxes' (N, 4), 'centroids' (N, 2)}
+    """
+    if not os.path.exists(db_path):
+        return []
+    
+    conn = get_connection(db_path)
+    cursor = conn.cursor()
+    query = 'SELECT video_path, track_id, class, start_frame, frames, boxes FROM trajectories'
+    if video_path:
+        cursor.execute(query + ' WHERE video_path = ? ORDER BY id', (video_path,))
+    else:
+        cursor.execute(query + ' ORDER BY id')
+    
+    trajectories = []
+    for video, track_id, class_name, start_frame, frames_blob, boxes_blob in cursor.fetchall():
+        boxes = np.frombuffer(boxes_blob, dtype='<f4').reshape(-1, 4)
+        trajectories.append({
+            'video_path': video,
+            'track_id': track_id,
+            'class': class_name,
+            'frames': np.frombuffer(frames_blob, dtype='<i4').astype(np.int64) + start_frame,
+            'boxes': boxes,
+            'centroids': (boxes[:, :2] + boxes[:, 2:]) / 2.0
+        })
+    return trajectories
+
+
+def export_to_json(db_path: str, output_path: str, table: str = 'count_bins'):
     """
     Export dữ liệu từ database ra JSON
     
@@ -163,7 +349,7 @@ def export_to_json(db_path: str, output_path: str, table: str = 'counting_result
         logger.warning(f"Database not found: {db_path}")
         return
     
-    conn = sqlite3.connect(db_path)
+    conn = get_connection(db_path)
     cursor = conn.cursor()
     
     try:
@@ -180,11 +366,9 @@ def export_to_json(db_path: str, output_path: str, table: str = 'counting_result
         logger.info(f"Exported {len(data)} records to {output_path}")
     except Exception as e:
         logger.error(f"Error exporting to JSON: {e}")
-    finally:
-        conn.close()
 
 
-def export_to_csv(db_path: str, output_path: str, table: str = 'counting_results'):
+def export_to_csv(db_path: str, output_path: str, table: str = 'count_bins'):
     """
     Export dữ liệu từ database ra CSV
     
@@ -198,9 +382,8 @@ def export_to_csv(db_path: str, output_path: str, table: str = 'counting_results
         return
     
     try:
-        conn = sqlite3.connect(db_path)
+        conn = get_connection(db_path)
         df = pd.read_sql_query(f'SELECT * FROM {table}', conn)
-        conn.close()
         
         Path(output_path).parent.mkdir(parents=True, exist_ok=True)
         df.to_csv(output_path, index=False, encoding='utf-8')
@@ -210,49 +393,47 @@ def export_to_csv(db_path: str, output_path: str, table: str = 'counting_results
         logger.error(f"Error exporting to CSV: {e}")
 
 
-def get_counting_summary(db_path: str, video_path: Optional[str] = None) -> Dict:
+def get_counting_summary(db_path: str, video_path: Optional[str] = None, line: str = 'main') -> Dict:
     """
-    Lấy tổng kết kết quả đếm xe
+    Lấy tổng kết kết quả đếm xe từ count bins
+    
+    Rows format cũ trong counting_results (tổng tích lũy theo frame, không có line/bin) không
+    được tính vào summary.
     
     Args:
         db_path: Đường dẫn đến database
         video_path: Đường dẫn video (None = tất cả videos)
+        line: Line dùng cho count_up / count_down / total (tên counting_line, mặc định 'main')
     
     Returns:
-        Dict: Summary với total counts
+        Dict: Summary với total counts của line và tổng theo từng line ('lines')
     """
+    empty = {'count_up': 0, 'count_down': 0, 'total': 0, 'lines': {}}
     if not os.path.exists(db_path):
-        return {'count_up': 0, 'count_down': 0, 'total': 0}
+        return empty
     
-    conn = sqlite3.connect(db_path)
+    conn = get_connection(db_path)
     cursor = conn.cursor()
     
     try:
+        # Mỗi row là số xe của một bin (không phải tổng tích lũy) nên SUM là tổng đúng
+        query = '''
+            SELECT line, SUM(count_up), SUM(count_down), SUM(total_count)
+            FROM count_bins
+        '''
+        params = ()
         if video_path:
-            cursor.execute('''
-                SELECT SUM(vehicle_count_up), SUM(vehicle_count_down), SUM(total_count)
-                FROM counting_results
-                WHERE video_path = ?
-            ''', (video_path,))
-        else:
-            cursor.execute('''
-                SELECT SUM(vehicle_count_up), SUM(vehicle_count_down), SUM(total_count)
-                FROM counting_results
-            ''')
-        
-        result = cursor.fetchone()
-        count_up = result[0] or 0
-        count_down = result[1] or 0
-        total = result[2] or 0
+            query += ' WHERE video_path = ?'
+            params = (video_path,)
+        cursor.execute(query + ' GROUP BY line', params)
         
-        return {
-            'count_up': int(count_up),
-            'count_down': int(count_down),
-            'total': int(total)
+        lines = {
+            name: {'count_up': int(up or 0), 'count_down': int(down or 0), 'total': int(total or 0)}
+            for name, up, down, total in cursor.fetchall()
         }
+        summary = dict(lines.get(line, {'count_up': 0, 'count_down': 0, 'total': 0}))
+        summary['lines'] = lines
+        return summary
     except Exception as e:
         logger.error(f"Error getting summary: {e}")
-        return {'count_up': 0, 'count_down': 0, 'total': 0}
-    finally:
-        conn.close()
-
+        return empty
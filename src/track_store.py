@@ -0,0 +1,272 @@
+"""
+Track Store
+Lưu tracks dạng structure-of-arrays (arrays cấp phát trước + free-list slot) và view nhẹ
+cho kết quả tracking, tránh tạo dict mới cho mỗi track ở mỗi frame
+"""
+import logging
+import numpy as np
+from collections import deque
+from collections.abc import Mapping, Sequence
+from typing import Dict, List
+
+logger = logging.getLogger(__name__)
+
+
+class TrackStore:
+    """
+    Arrays cho tất cả tracks, mỗi track chiếm một slot
+    
+    Slot của track đã xóa được đưa vào free-list và dùng lại cho track mới; capacity chỉ tăng
+    (gấp đôi) khi số tracks đồng thời vượt capacity, nên chạy lâu không làm chậm dần.
+    Track ID vẫn tăng dần và không bao giờ dùng lại (counter dựa vào ID để tránh đếm trùng).
+    
+    Mỗi slot có một ring buffer trajectory (frame, bbox) kích thước cố định; khi track bị xóa,
+    trajectory được chuyển vào hàng đợi finished (có giới hạn) để caller lưu lại.
+    """
+    
+    def __init__(self, capacity: int = 64, history_size: int = 64, max_finished: int = 4096):
+        """
+        Args:
+            capacity: Số slots cấp phát ban đầu
+            history_size: Số điểm trajectory giữ cho mỗi track (0 = không lưu trajectory)
+            max_finished: Số trajectories tối đa chờ caller lấy ra (cũ nhất bị bỏ khi đầy)
+        """
+        self.history_size = history_size
+        self.capacity = 0
+        self.track_ids = np.zeros(0, dtype=np.int64)
+        self.boxes = np.zeros((0, 4))
+        self.centroids = np.zeros((0, 2))
+        self.disappeared = np.zeros(0, dtype=np.int32)
+        self.class_ids = np.zeros(0, dtype=np.int32)
+        self.confidences = np.zeros(0)
+        self.mean = np.zeros((0, 8))            # Kalman state
+        self.covariance = np.zeros((0, 8, 8))
+        self.alive = np.zeros(0, dtype=bool)
+        self.state = np.zeros(0, dtype=np.int8)        # Trạng thái track (do tracker định nghĩa)
+        self.last_frame = np.zeros(0, dtype=np.int64)  # Frame của detection gần nhất
+        self._free: List[int] = []
+        
+        # Ring buffer trajectory: history_head = vị trí ghi tiếp theo, history_len = số điểm hợp lệ
+        self.history_frames = np.zeros((0, history_size), dtype=np.int64)
+        self.history_boxes = np.zeros((0, history_size, 4), dtype=np.float32)
+        self.history_head = np.zeros(0, dtype=np.int32)
+        self.history_len = np.zeros(0, dtype=np.int32)
+        self.finished = deque(maxlen=max_finished)
+        self.dropped_trajectories = 0
+        
+        # Tên class ↔ class id (chỉ thêm mới, không xóa)
+        self.class_names: List[str] = []
+        self._class_index: Dict[str, int] = {}
+        
+        self._grow(max(1, capacity))
+    
+    def _grow(self, capacity: int):
+        """Tăng capacity, giữ nguyên dữ liệu của các slots cũ"""
+        old = self.capacity
+        
+        def extend(array, fill=0):
+            extended = np.full((capacity,) + array.shape[1:], fill, dtype=array.dtype)
+            extended[:old] = array
+            return extended
+        
+        self.track_ids = extend(self.track_ids, -1)
+        self.boxes = extend(self.boxes)
+        self.centroids = extend(self.centroids)
+        self.disappeared = extend(self.disappeared)
+        self.class_ids = extend(self.class_ids)
+        self.confidences = extend(self.confidences)
+        self.mean = extend(self.mean)
+        self.covariance = extend(self.covariance)
+        self.alive = extend(self.alive, False)
+        self.state = extend(self.state)
+        self.last_frame = extend(self.last_frame)
+        self.history_frames = extend(self.history_frames)
+        self.history_boxes = extend(self.history_boxes)
+        self.history_head = extend(self.history_head)
+        self.history_len = extend(self.history_len)
+        # Slot nhỏ ở cuối list để pop() lấy slot nhỏ trước
+        self._free.extend(range(capacity - 1, old - 1, -1))
+        self.capacity = capacity
+    
+    def __len__(self) -> int:
+        return self.capacity - len(self._free)
+    
+    def class_id(self, name: str) -> int:
+        """Class id của tên class (thêm mới nếu chưa có)"""
+        index = self._class_index.get(name)
+        if index is None:
+            index = self._class_index[name] = len(self.class_names)
+            self.class_names.append(name)
+        return index
+    
+    def allocate(self, track_ids: np.ndarray) -> np.ndarray:
+        """
+        Lấy slots cho tracks mới
+        
+        Args:
+            track_ids: IDs của các tracks mới
+        
+        Returns:
+            np.ndarray: Slots đã cấp (các field khác do caller ghi)
+        """
+        count = len(track_ids)
+        if count > len(self._free):
+            self._grow(max(2 * self.capacity, len(self) + count))
+        slots = np.array([self._free.pop() for _ in range(count)], dtype=np.int64)
+        self.track_ids[slots] = track_ids
+        self.disappeared[slots] = 0
+        self.state[slots] = 0
+        self.history_head[slots] = 0
+        self.history_len[slots] = 0
+        self.alive[slots] = True
+        return slots
+    
+    def release(self, slots: np.ndarray, keep_trajectory: bool = True):
+        """
+        Trả slots của tracks đã xóa về free-list
+        
+        Args:
+            slots: Slots cần xóa
+            keep_trajectory: Chuyển trajectory của các tracks vào hàng đợi finished
+        """
+        if keep_trajectory and self.history_size:
+            for slot in np.asarray(slots).tolist():
+                if self.history_len[slot] == 0:
+                    continue
+                if len(self.finished) == self.finished.maxlen:
+                    if self.dropped_trajectories == 0:
+                        logger.warning("Finished trajectory queue is full, dropping the oldest trajectories")
+                    self.dropped_trajectories += 1
+                self.finished.append(self.trajectory(slot))
+        self.alive[slots] = False
+        self.track_ids[slots] = -1
+        self._free.extend(np.asarray(slots).tolist())
+    
+    def set_boxes(self, slots: np.ndarray, boxes: np.ndarray):
+        """Ghi boxes (N, 4) và centroids tương ứng"""
+        self.boxes[slots] = boxes
+        self.centroids[slots] = (boxes[:, :2] + boxes[:, 2:]) / 2.0
+    
+    def record(self, slots: np.ndarray, frame_number: int):
+        """Ghi (frame, bbox) hiện tại của các tracks vào ring buffer"""
+        if not self.history_size or len(slots) == 0:
+            return
+        head = self.history_head[slots]
+        self.history_frames[slots, head] = frame_number
+        self.history_boxes[slots, head] = self.boxes[slots]
+        self.history_head[slots] = (head + 1) % self.history_size
+        self.history_len[slots] = np.minimum(self.history_len[slots] + 1, self.history_size)
+    
+    def trajectory(self, slot: int) -> Dict:
+        """
+        Trajectory của một track theo thứ tự thời gian (tối đa history_size điểm gần nhất)
+        
+        Returns:
+            Dict: {'track_id', 'class', 'frames' (N,), 'boxes' (N, 4), 'centroids' (N, 2)}
+        """
+        length = int(self.history_len[slot])
+        order = (self.history_head[slot] - length + np.arange(length)) % self.history_size
+        boxes = self.history_boxes[slot, order]
+        return {
+            'track_id': int(self.track_ids[slot]),
+            'class': self.class_names[self.class_ids[slot]] if self.class_names else 'unknown',
+            'frames': self.history_frames[slot, order],
+            'boxes': boxes,
+            'centroids': (boxes[:, :2] + boxes[:, 2:]) / 2.0
+        }
+    
+    def pop_finished(self) -> List[Dict]:
+        """Lấy và xóa các trajectories của tracks đã kết thúc"""
+        trajectories = list(self.finished)
+        self.finished.clear()
+        return trajectories
+    
+    def by_track_id(self, slots: np.ndarray) -> np.ndarray:
+        """Sắp xếp slots theo track ID"""
+        return slots[np.argsort(self.track_ids[slots], kind='stable')]
+    
+    def alive_slots(self) -> np.ndarray:
+        """Slots của tất cả tracks (kể cả đang tạm mất)"""
+        return np.flatnonzero(self.alive)
+    
+    def active_slots(self) -> np.ndarray:
+        """Slots của tracks đang active (disappeared == 0), theo thứ tự track ID"""
+        return self.by_track_id(np.flatnonzero(self.alive & (self.disappeared == 0)))
+
+
+class TrackedObject(Mapping):
+    """
+    View của một track, đọc được như dict {'track_id', 'bbox', 'centroid', 'class', 'confidence'}
+    
+    Giá trị đọc trực tiếp từ TrackStore nên chỉ đúng đến lần update()/predict() tiếp theo của tracker.
+    """
+    
+    __slots__ = ('_store', '_slot')
+    _keys = ('track_id', 'bbox', 'centroid', 'class', 'confidence')
+    
+    def __init__(self, store: TrackStore, slot: int):
+        self._store = store
+        self._slot = slot
+    
+    def __getitem__(self, key):
+        store, slot = self._store, self._slot
+        if key == 'track_id':
+            return int(store.track_ids[slot])
+        if key == 'centroid':
+            return (float(store.centroids[slot, 0]), float(store.centroids[slot, 1]))
+        if key == 'bbox':
+            return store.boxes[slot].tolist()
+        if key == 'class':
+            return store.class_names[store.class_ids[slot]]
+        if key == 'confidence':
+            return float(store.confidences[slot])
+        raise KeyError(key)
+    
+    def __iter__(self):
+        return iter(self._keys)
+    
+    def __len__(self) -> int:
+        return len(self._keys)
+    
+    def __repr__(self) -> str:
+        return repr(dict(self))
+
+
+class TrackedObjects(Sequence):
+    """
+    Kết quả tracking của một frame: sequence các TrackedObject, kèm arrays cho xử lý vector
+    
+    Chỉ giữ slots của các tracks; không copy dữ liệu cho đến khi được đọc.
+    """
+    
+    __slots__ = ('_store', 'slots')
+    
+    def __init__(self, store: TrackStore, slots: np.ndarray):
+        self._store = store
+        self.slots = slots
+    
+    def __len__(self) -> int:
+        return len(self.slots)
+    
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return TrackedObjects(self._store, self.slots[index])
+        return TrackedObject(self._store, int(self.slots[index]))
+    
+    @property
+    def track_ids(self) -> np.ndarray:
+        """Track IDs (N,)"""
+        return self._store.track_ids[self.slots]
+    
+    @property
+    def centroids(self) -> np.ndarray:
+        """Centroids (N, 2)"""
+        return self._store.centroids[self.slots]
+    
+    @property
+    def boxes(self) -> np.ndarray:
+        """Boxes (N, 4)"""
+        return self._store.boxes[self.slots]
+    
+    def __repr__(self) -> str:
+        return repr(list(self))
@@ -66,5 +66,13 @@ def validate_config(config):
     if 'type' not in counting_line or 'start' not in counting_line or 'end' not in counting_line:
         raise ValueError("Counting line config must have 'type', 'start', and 'end'")
     
+    # Validate counting lines / zones (tùy chọn)
+    for line in config.get('counting_lines', []):
+        if 'start' not in line or 'end' not in line:
+            raise ValueError("Each counting line must have 'start' and 'end'")
+    for zone in config.get('counting_zones', []):
+        if len(zone.get('points', [])) < 3:
+            raise ValueError("Each counting zone must have at least 3 'points'")
+    
     return True
 
@@ -5,8 +5,13 @@ Phát hiện xe sử dụng YOLOv8
 import cv2
 import numpy as np
 import logging
-from ultralytics import YOLO
-from typing import List, Dict, Optional
+import threading
+from concurrent.futures import Future
+from typing import List, Dict, Optional, Tuple
+
+from detection_backends import create_backend, empty_detection_arrays, merge_detection_arrays
+from roi_processing import roi_bounds
+from detection_cache import model_key, config_tag
 
 logger = logging.getLogger(__name__)
 
@@ -18,21 +23,156 @@ VEHICLE_CLASSES = {
     7: 'truck'
 }
 
+# Cấu hình mặc định cho sliced inference (config 'detector.slicing')
+DEFAULT_SLICING = {
+    'tile_size': 640,        # Kích thước tile (pixel ảnh gốc), nên bằng imgsz của model
+    'overlap': 0.2,          # Tỉ lệ chồng lấn giữa 2 tile liền kề
+    'far_fraction': 0.35,    # Phần trên cùng của ROI (xa camera) được chia tile
+    'merge_threshold': 0.5   # IoS để gộp detections giữa các tile / full frame
+}
+
+
+def normalize_slicing(slicing: Optional[Dict]) -> Optional[Dict]:
+    """Config slicing đầy đủ (merge với DEFAULT_SLICING), None nếu tắt"""
+    if slicing is None or not slicing.get('enabled', True):
+        return None
+    return {**DEFAULT_SLICING, **{k: v for k, v in slicing.items() if k != 'enabled'}}
+
 
 class VehicleDetector:
-    """Vehicle detector sử dụng YOLOv8"""
+    """Vehicle detector sử dụng YOLOv8 (backend PyTorch, ONNX Runtime hoặc OpenVINO)"""
     
-    def __init__(self, model_path: str = 'yolov8n.pt', conf_threshold: float = 0.25):
+    def __init__(
+        self,
+        model_path: str = 'yolov8n.pt',
+        conf_threshold: float = 0.25,
+        batch_size: int = 8,
+        backend: str = 'torch',
+        slicing: Optional[Dict] = None,
+        **backend_kwargs
+    ):
         """
         Khởi tạo vehicle detector
         
         Args:
             model_path: Đường dẫn đến YOLO model (hoặc tên model từ ultralytics)
             conf_threshold: Confidence threshold
+            batch_size: Số ảnh tối đa mỗi lần gọi model trong detect_vehicles_batch
+            backend: Inference backend: 'torch', 'onnx' hoặc 'openvino'
+            slicing: Bật sliced inference cho vùng xa (xem DEFAULT_SLICING), None = tắt
+            **backend_kwargs: Tham số riêng của backend (imgsz, iou_threshold, ...)
         """
-        self.model = YOLO(model_path)
+        self.backend = create_backend(backend, model_path, conf_threshold, **backend_kwargs)
+        self.model = getattr(self.backend, 'model', None)
         self.conf_threshold = conf_threshold
-        logger.info(f"Vehicle detector initialized with model: {model_path}")
+        self.batch_size = max(1, batch_size)
+        # Detector có thể được dùng chung giữa các thread (model_registry);
+        # predictor của backend không thread-safe nên serialize inference
+        self._predict_lock = threading.Lock()
+        
+        self.slicing = normalize_slicing(slicing)
+        self.slice_bounds = None  # Bounding box ROI, None = toàn frame
+        
+        # Detection cache (tùy chọn): key của model gồm mọi setting ảnh hưởng đến detections
+        self.cache = None
+        self.model_key = model_key(model_path, conf_threshold, backend=backend, slicing=self.slicing, **backend_kwargs)
+        logger.info(f"Vehicle detector initialized with model: {model_path} (backend: {backend})")
+    
+    def _class_ids(self, vehicle_classes: Optional[List[str]] = None) -> List[int]:
+        """COCO class IDs cần detect (truyền vào model để lọc trước NMS)"""
+        if vehicle_classes is None:
+            return list(VEHICLE_CLASSES.keys())
+        return [class_id for class_id, name in VEHICLE_CLASSES.items() if name in vehicle_classes]
+    
+    def attach_cache(self, cache):
+        """
+        Gắn DetectionCache: detect_vehicles_batch với cache_keys sẽ đọc cache trước khi chạy model
+        
+        Args:
+            cache: DetectionCache (đã open_segment với self.model_key), None = tắt cache
+        """
+        self.cache = cache
+    
+    def set_slice_region(self, roi_config: Optional[Dict]):
+        """
+        Đặt ROI dùng để chọn vùng chia tile (vùng xa = phần trên của ROI)
+        
+        Args:
+            roi_config: ROI config (polygon/rectangle), None = toàn frame
+        """
+        self.slice_bounds = roi_bounds(roi_config) if roi_config else None
+    
+    def slice_tiles(self, frame_shape: Tuple[int, ...]) -> List[Tuple[int, int, int, int]]:
+        """
+        Các tile (x1, y1, x2, y2) phủ vùng xa camera của frame
+        
+        Args:
+            frame_shape: Shape của frame (height, width, ...)
+        
+        Returns:
+            List[Tuple]: Tiles, rỗng nếu slicing tắt
+        """
+        if self.slicing is None:
+            return []
+        
+        h, w = frame_shape[:2]
+        x1, y1, x2, y2 = self.slice_bounds or (0, 0, w, h)
+        far_y2 = y1 + (y2 - y1) * self.slicing['far_fraction']
+        return compute_tiles((x1, y1, x2, far_y2), (h, w), self.slicing['tile_size'], self.slicing['overlap'])
+    
+    def _predict(self, images: List[np.ndarray], class_ids: List[int]) -> List[Dict[str, np.ndarray]]:
+        """Gọi backend với class filter trong NMS (kèm các tile vùng xa nếu bật slicing)"""
+        tiles = [self.slice_tiles(image.shape) for image in images]
+        crops = [image[ty1:ty2, tx1:tx2] for image, image_tiles in zip(images, tiles) for tx1, ty1, tx2, ty2 in image_tiles]
+        
+        with self._predict_lock:
+            results = self.backend.predict(images, class_ids)
+            # Tất cả tiles của batch chạy trong một lần gọi model
+            tile_results = self.backend.predict(crops, class_ids) if crops else []
+        
+        if not crops:
+            return results
+        
+        merged = []
+        offset = 0
+        for full, image_tiles in zip(results, tiles):
+            parts = [full]
+            for tx1, ty1, _, _ in image_tiles:
+                arrays = tile_results[offset]
+                offset += 1
+                if len(arrays['boxes']) > 0:
+                    boxes = arrays['boxes'] + np.array([tx1, ty1, tx1, ty1], dtype=np.float32)
+                    parts.append({**arrays, 'boxes': boxes})
+            merged.append(merge_detection_arrays(parts, self.slicing['merge_threshold']))
+        return merged
+    
+    def detect_vehicles_arrays(self, image: np.ndarray, vehicle_classes: Optional[List[str]] = None) -> Dict[str, np.ndarray]:
+        """
+        Phát hiện xe trong ảnh, trả về dạng arrays (không tạo dict cho từng box)
+        
+        Args:
+            image: Image array (numpy)
+            vehicle_classes: List các class cần detect (None = tất cả vehicle classes)
+        
+        Returns:
+            Dict[str, np.ndarray]: {
+                'boxes': (N, 4) float32 [x1, y1, x2, y2],
+                'scores': (N,) float32,
+                'class_ids': (N,) int32
+            }
+        """
+        if image is None or image.size == 0:
+            logger.warning("Invalid image input")
+            return empty_detection_arrays()
+        
+        class_ids = self._class_ids(vehicle_classes)
+        if not class_ids:
+            return empty_detection_arrays()
+        
+        results = self._predict([image], class_ids)
+        if len(results) == 0:
+            return empty_detection_arrays()
+        return results[0]
     
     def detect_vehicles(self, image: np.ndarray, vehicle_classes: Optional[List[str]] = None) -> List[Dict]:
         """
@@ -51,70 +191,163 @@ class VehicleDetector:
                     'class_id': int
                 }
         """
-        if image is None or image.size == 0:
-            logger.warning("Invalid image input")
-            return []
-        
         # Run YOLO inference
-        results = self.model(image, conf=self.conf_threshold, verbose=False)
-        
-        detections = []
-        
-        if len(results) > 0:
-            result = results[0]
-            
-            # Lấy boxes, scores, class_ids
-            boxes = result.boxes
-            
-            for i in range(len(boxes)):
-                box = boxes[i]
-                class_id = int(box.cls[0])
-                confidence = float(box.conf[0])
-                
-                # Chỉ lấy vehicle classes
-                if class_id in VEHICLE_CLASSES:
-                    class_name = VEHICLE_CLASSES[class_id]
-                    
-                    # Filter theo vehicle_classes nếu được chỉ định
-                    if vehicle_classes is not None and class_name not in vehicle_classes:
-                        continue
-                    
-                    # Lấy bounding box coordinates
-                    x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
-                    
-                    detection = {
-                        'bbox': [float(x1), float(y1), float(x2), float(y2)],
-                        'confidence': confidence,
-                        'class': class_name,
-                        'class_id': class_id
-                    }
-                    detections.append(detection)
+        detections = arrays_to_detections(self.detect_vehicles_arrays(image, vehicle_classes))
         
         logger.debug(f"Detected {len(detections)} vehicles")
         return detections
     
-    def detect_vehicles_batch(self, images: List[np.ndarray], vehicle_classes: Optional[List[str]] = None) -> List[List[Dict]]:
+    def detect_vehicles_batch(
+        self,
+        images: List[np.ndarray],
+        vehicle_classes: Optional[List[str]] = None,
+        batch_size: Optional[int] = None,
+        as_arrays: bool = False,
+        cache_keys: Optional[List[Tuple[int, int]]] = None
+    ) -> List:
         """
-        Phát hiện xe trong batch images
+        Phát hiện xe trong batch images (một lần gọi model cho mỗi batch)
         
         Args:
             images: List các image arrays
             vehicle_classes: List các class cần detect
+            batch_size: Số ảnh mỗi lần gọi model (None = self.batch_size)
+            as_arrays: True = trả về detection arrays thay vì list dict
+            cache_keys: (frame_index, tag) cho mỗi image để tra DetectionCache (None = không dùng cache)
+        
+        Returns:
+            List: Detections cho mỗi image, cùng thứ tự với images
+                (List[List[Dict]] hoặc List[Dict[str, np.ndarray]] nếu as_arrays)
+        """
+        batch_size = max(1, batch_size or self.batch_size)
+        all_arrays = [empty_detection_arrays() for _ in images]
+        class_ids = self._class_ids(vehicle_classes)
+        
+        # Bỏ qua ảnh không hợp lệ nhưng giữ đúng vị trí trong kết quả
+        valid_indices = [i for i, image in enumerate(images) if image is not None and image.size > 0]
+        if len(valid_indices) < len(images):
+            logger.warning(f"Skipped {len(images) - len(valid_indices)} invalid images in batch")
+        
+        # Frames đã có trong cache không cần chạy model
+        use_cache = self.cache is not None and cache_keys is not None
+        if use_cache and class_ids:
+            tags = [config_tag(tag, class_ids) for _, tag in cache_keys]
+            pending = []
+            for i in valid_indices:
+                cached = self.cache.lookup(cache_keys[i][0], tags[i])
+                if cached is None:
+                    pending.append(i)
+                else:
+                    all_arrays[i] = cached
+            valid_indices = pending
+        
+        if class_ids:
+            for start in range(0, len(valid_indices), batch_size):
+                chunk = valid_indices[start:start + batch_size]
+                results = self._predict([images[i] for i in chunk], class_ids)
+                for idx, arrays in zip(chunk, results):
+                    all_arrays[idx] = arrays
+                    if use_cache:
+                        self.cache.store(cache_keys[idx][0], arrays, tags[idx])
+        
+        logger.debug(f"Detected vehicles in batch of {len(images)} images")
+        if as_arrays:
+            return all_arrays
+        return [arrays_to_detections(arrays) for arrays in all_arrays]
+    
+    def submit_batch(
+        self,
+        images: List[np.ndarray],
+        vehicle_classes: Optional[List[str]] = None,
+        cache_keys: Optional[List[Tuple[int, int]]] = None
+    ) -> Future:
+        """
+        Interface chung với RemoteDetector (inference_worker): detect ngay trong process
         
         Returns:
-            List[List[Dict]]: List detections cho mỗi image
+            Future: Đã hoàn thành, result() là detections (List[List[Dict]]) cho mỗi image
         """
-        all_detections = []
-        for image in images:
-            detections = self.detect_vehicles(image, vehicle_classes)
-            all_detections.append(detections)
-        return all_detections
+        future = Future()
+        try:
+            future.set_result(self.detect_vehicles_batch(images, vehicle_classes, cache_keys=cache_keys))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+    
+    def close(self):
+        """Không có tài nguyên riêng (interface chung với RemoteDetector)"""
+
+
+def compute_tiles(
+    region: Tuple[float, float, float, float],
+    frame_shape: Tuple[int, int],
+    tile_size: int = 640,
+    overlap: float = 0.2
+) -> List[Tuple[int, int, int, int]]:
+    """
+    Chia vùng region thành các tile vuông chồng lấn, nằm trong frame
+    
+    Args:
+        region: Vùng cần phủ (x1, y1, x2, y2)
+        frame_shape: (height, width) của frame
+        tile_size: Cạnh tile (bị giới hạn bởi kích thước frame)
+        overlap: Tỉ lệ chồng lấn giữa 2 tile liền kề
+    
+    Returns:
+        List[Tuple[int, int, int, int]]: Tiles (x1, y1, x2, y2)
+    """
+    h, w = frame_shape[:2]
+    x1, y1 = max(0, int(region[0])), max(0, int(region[1]))
+    x2, y2 = min(w, int(np.ceil(region[2]))), min(h, int(np.ceil(region[3])))
+    if x2 <= x1 or y2 <= y1:
+        return []
+    
+    def starts(lo, hi, size, limit):
+        size = min(size, limit)
+        step = max(1, int(size * (1.0 - overlap)))
+        last = min(max(lo, hi - size), limit - size)
+        first = min(lo, last)
+        positions = list(range(first, last + 1, step))
+        if positions[-1] != last:
+            positions.append(last)
+        return positions, size
+    
+    xs, tile_w = starts(x1, x2, tile_size, w)
+    ys, tile_h = starts(y1, y2, tile_size, h)
+    return [(x, y, x + tile_w, y + tile_h) for y in ys for x in xs]
+
+
+def arrays_to_detections(arrays: Dict[str, np.ndarray]) -> List[Dict]:
+    """
+    Chuyển detection arrays sang list dict (format của detect_vehicles)
+    
+    Args:
+        arrays: Dict với 'boxes', 'scores', 'class_ids'
+    
+    Returns:
+        List[Dict]: List detections
+    """
+    return [
+        {
+            'bbox': bbox,
+            'confidence': confidence,
+            'class': VEHICLE_CLASSES.get(class_id, 'unknown'),
+            'class_id': class_id
+        }
+        for bbox, confidence, class_id in zip(
+            arrays['boxes'].tolist(),
+            arrays['scores'].tolist(),
+            arrays['class_ids'].tolist()
+        )
+    ]
 
 
 def detect_vehicles(image: np.ndarray, model_path: str = 'yolov8n.pt', vehicle_classes: Optional[List[str]] = None) -> List[Dict]:
     """
     Convenience function để detect vehicles
     
+    Model được load một lần cho mỗi process (model_registry), các lần gọi sau dùng lại.
+    
     Args:
         image: Image array
         model_path: Đường dẫn đến YOLO model
@@ -123,6 +356,7 @@ def detect_vehicles(image: np.ndarray, model_path: str = 'yolov8n.pt', vehicle_c
     Returns:
         List[Dict]: List detections
     """
-    detector = VehicleDetector(model_path)
+    from model_registry import get_detector
+    detector = get_detector(model_path)
     return detector.detect_vehicles(image, vehicle_classes)
 
@@ -1,149 +1,663 @@
 """
 Module 7: Vehicle Tracking
-Theo dõi xe qua các frames sử dụng ByteTrack
+Theo dõi xe qua các frames: centroid tracker đơn giản (VehicleTracker) hoặc ByteTrack (ByteTracker)
 """
 import cv2
 import numpy as np
 import logging
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 from collections import defaultdict
 
+try:
+    from scipy.optimize import linear_sum_assignment
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components
+except ImportError:  # scipy được cài cùng ultralytics; thiếu thì dùng greedy matching
+    linear_sum_assignment = None
+
+from detection_backends import box_iou
+from kalman_filter import BatchKalmanFilter, CHI2INV95_2D, mahalanobis_2d, xyxy_to_xyah, xyah_to_xyxy
+from track_store import TrackStore, TrackedObjects
+from spatial_grid import candidate_pairs
+
 logger = logging.getLogger(__name__)
 
+# Tracker hỗ trợ (dùng trong config 'tracker.type')
+AVAILABLE_TRACKERS = ('simple', 'bytetrack')
+
+# Trạng thái track của ByteTracker
+TRACK_NEW = 0
+TRACK_TRACKED = 1
+TRACK_LOST = 2
+
+
+def associate(cost: np.ndarray, max_cost: float, method: str = 'hungarian') -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Ghép rows (detections) với cols (tracks) theo cost matrix, có gating
+    
+    Args:
+        cost: Cost matrix (N, M), ví dụ khoảng cách centroid
+        max_cost: Cặp có cost > max_cost (hoặc cost = inf) không bao giờ được ghép (gating)
+        method: 'hungarian' (tổng cost nhỏ nhất) hoặc 'greedy' (cặp cost nhỏ nhất trước)
+    
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: (row indices, col indices) của các cặp được ghép
+    """
+    if cost.size == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    
+    allowed = np.isfinite(cost) & (cost <= max_cost)
+    if method == 'hungarian' and linear_sum_assignment is not None:
+        # Cặp bị gate có cost lớn hơn tổng mọi cặp hợp lệ: solver chỉ chọn khi không còn cách ghép khác, lọc lại sau
+        penalty = cost[allowed].sum() + 1.0 if allowed.any() else 1.0
+        rows, cols = linear_sum_assignment(np.where(allowed, cost, penalty))
+        valid = allowed[rows, cols]
+        return rows[valid].astype(np.int64), cols[valid].astype(np.int64)
+    
+    rows, cols = np.nonzero(allowed)
+    return _greedy_pairs(rows, cols, cost[rows, cols], cost.shape)
+
+
+def _greedy_pairs(rows: np.ndarray, cols: np.ndarray, costs: np.ndarray, shape: Tuple[int, int]) -> Tuple[np.ndarray, np.ndarray]:
+    """Greedy: duyệt các cặp trong gate theo cost tăng dần, bỏ cặp có row/col đã dùng"""
+    order = np.argsort(costs, kind='stable')
+    used_rows = np.zeros(shape[0], dtype=bool)
+    used_cols = np.zeros(shape[1], dtype=bool)
+    matched_rows, matched_cols = [], []
+    for row, col in zip(rows[order].tolist(), cols[order].tolist()):
+        if not used_rows[row] and not used_cols[col]:
+            used_rows[row] = used_cols[col] = True
+            matched_rows.append(row)
+            matched_cols.append(col)
+    return np.asarray(matched_rows, dtype=np.int64), np.asarray(matched_cols, dtype=np.int64)
+
+
+def associate_sparse(
+    rows: np.ndarray,
+    cols: np.ndarray,
+    costs: np.ndarray,
+    shape: Tuple[int, int],
+    method: str = 'hungarian'
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Như associate() nhưng chỉ có cost của các cặp trong gate (các cặp khác không được ghép)
+    
+    Hungarian được giải riêng cho từng thành phần liên thông của đồ thị các cặp, nên chi phí
+    tăng gần tuyến tính theo số tracks khi mật độ xe không đổi (kết quả giống associate()).
+    
+    Args:
+        rows, cols: Các cặp (row, col) trong gate
+        costs: Cost của từng cặp
+        shape: (số rows, số cols)
+        method: 'hungarian' hoặc 'greedy'
+    
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: (row indices, col indices) của các cặp được ghép
+    """
+    if len(rows) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    if method != 'hungarian' or linear_sum_assignment is None:
+        return _greedy_pairs(rows, cols, costs, shape)
+    
+    # Thành phần liên thông của đồ thị 2 phía (rows, cols)
+    num_rows, num_cols = shape
+    graph = coo_matrix((np.ones(len(rows)), (rows, cols + num_rows)), shape=(num_rows + num_cols,) * 2)
+    _, labels = connected_components(graph, directed=False)
+    component = labels[rows]
+    order = np.argsort(component, kind='stable')
+    rows, cols, costs, component = rows[order], cols[order], costs[order], component[order]
+    starts = np.flatnonzero(np.r_[True, component[1:] != component[:-1]])
+    ends = np.r_[starts[1:], len(rows)]
+    
+    # Thành phần chỉ có một cặp: ghép luôn; còn lại giải Hungarian trên ma trận nhỏ
+    single = starts[ends - starts == 1]
+    matched_rows, matched_cols = [rows[single]], [cols[single]]
+    for start, end in zip(starts[ends - starts > 1].tolist(), ends[ends - starts > 1].tolist()):
+        component_rows, row_index = np.unique(rows[start:end], return_inverse=True)
+        component_cols, col_index = np.unique(cols[start:end], return_inverse=True)
+        cost = np.full((len(component_rows), len(component_cols)), np.inf)
+        cost[row_index, col_index] = costs[start:end]
+        sub_rows, sub_cols = associate(cost, np.inf)
+        matched_rows.append(component_rows[sub_rows])
+        matched_cols.append(component_cols[sub_cols])
+    return np.concatenate(matched_rows).astype(np.int64), np.concatenate(matched_cols).astype(np.int64)
+
 
 class VehicleTracker:
-    """Vehicle tracker sử dụng simple tracking algorithm (có thể tích hợp ByteTrack sau)"""
+    """Vehicle tracker sử dụng simple tracking algorithm (centroid matching), ByteTrack: xem ByteTracker"""
     
-    def __init__(self, max_disappeared: int = 5, max_distance: float = 50.0):
+    def __init__(
+        self,
+        max_disappeared: int = 5,
+        max_distance: float = 50.0,
+        use_optical_flow: bool = False,
+        matching: str = 'hungarian',
+        capacity: int = 64,
+        history_size: int = 64,
+        spatial_grid: bool = False,
+        grid_cell_size: Optional[float] = None
+    ):
         """
         Khởi tạo tracker
         
         Args:
             max_disappeared: Số frame tối đa một object có thể mất trước khi remove
-            max_distance: Khoảng cách tối đa để match object giữa các frames
+            max_distance: Khoảng cách tối thiểu luôn cho phép match (quanh vị trí dự đoán) mỗi frame;
+                track mới chưa có vận tốc được nới theo số frame từ detection gần nhất (detection_stride).
+                Xa hơn thì chỉ match nếu nằm trong vùng tin cậy 95% của Kalman filter
+            use_optical_flow: predict() tinh chỉnh vị trí box bằng optical flow (Lucas-Kanade)
+            matching: 'hungarian' (assignment tối ưu) hoặc 'greedy' (cặp gần nhất trước)
+            capacity: Số tracks cấp phát trước trong track store (tự tăng khi cần)
+            history_size: Số điểm trajectory (frame, bbox) giữ cho mỗi track
+            spatial_grid: Gating bằng uniform grid (chỉ so detection với tracks ở các ô lân cận),
+                nên bật khi có hàng trăm detections / tracks mỗi frame
+            grid_cell_size: Kích thước ô của grid (None = max_distance)
         """
         self.next_id = 0
-        self.objects = {}  # {track_id: {'bbox': [...], 'centroid': (x, y), 'disappeared': 0}}
+        self.frame_number = -1  # Frame gần nhất đã xử lý
+        self.tracks = TrackStore(capacity, history_size)  # Boxes, class, confidence, Kalman state, trajectory
         self.max_disappeared = max_disappeared
         self.max_distance = max_distance
+        self.spatial_grid = spatial_grid
+        self.grid_cell_size = grid_cell_size or max_distance
+        self.use_optical_flow = use_optical_flow
+        self.matching = matching
+        self.kalman_filter = BatchKalmanFilter()
+        self._prev_gray = None  # Frame trước (grayscale) cho optical flow
         logger.info("Vehicle tracker initialized")
     
-    def _calculate_centroid(self, bbox: List[float]) -> tuple:
-        """Tính centroid từ bounding box"""
-        x1, y1, x2, y2 = bbox
-        cx = (x1 + x2) / 2.0
-        cy = (y1 + y2) / 2.0
-        return (cx, cy)
+    def _register(self, detections: List[Dict], boxes: np.ndarray, frame_number: int):
+        """Tạo tracks mới (TRACK_NEW: chưa có vận tốc) từ detections (boxes: (N, 4) của các detections đó)"""
+        if len(detections) == 0:
+            return
+        slots = self.tracks.allocate(np.arange(self.next_id, self.next_id + len(detections)))
+        self.next_id += len(detections)
+        self._write_detections(slots, detections, boxes, frame_number)
+        self.tracks.mean[slots], self.tracks.covariance[slots] = self.kalman_filter.initiate(xyxy_to_xyah(boxes))
+    
+    def _write_detections(self, slots: np.ndarray, detections: List[Dict], boxes: np.ndarray, frame_number: int):
+        """Ghi box, class, confidence của detections vào slots tương ứng"""
+        self.tracks.set_boxes(slots, boxes)
+        self.tracks.disappeared[slots] = 0
+        self.tracks.last_frame[slots] = frame_number
+        self.tracks.class_ids[slots] = [self.tracks.class_id(d.get('class', 'unknown')) for d in detections]
+        self.tracks.confidences[slots] = [d.get('confidence', 0.0) for d in detections]
+    
+    def _predict_tracks(self, slots: np.ndarray):
+        """Kalman predict một frame cho tracks (kể cả tracks đang tạm mất)"""
+        if len(slots):
+            self.tracks.mean[slots], self.tracks.covariance[slots] = self.kalman_filter.predict(
+                self.tracks.mean[slots], self.tracks.covariance[slots]
+            )
     
-    def _calculate_distance(self, centroid1: tuple, centroid2: tuple) -> float:
-        """Tính khoảng cách Euclidean giữa 2 centroids"""
-        return np.sqrt((centroid1[0] - centroid2[0])**2 + (centroid1[1] - centroid2[1])**2)
+    def _to_gray(self, frame: Optional[np.ndarray]) -> Optional[np.ndarray]:
+        """Grayscale cho optical flow (None nếu không dùng optical flow)"""
+        if not self.use_optical_flow or frame is None:
+            return None
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
     
-    def update(self, detections: List[Dict]) -> List[Dict]:
+    def _flow_displacements(self, gray: np.ndarray, slots: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Dịch chuyển của mỗi box từ frame trước bằng Lucas-Kanade (median của lưới 3x3 điểm trong box)
+        
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: (displacements (N, 2), valid (N,)) — valid = đủ điểm theo được
+        """
+        displacements = np.zeros((len(slots), 2))
+        if self._prev_gray is None or self._prev_gray.shape != gray.shape or len(slots) == 0:
+            return displacements, np.zeros(len(slots), dtype=bool)
+        
+        grid = np.array([0.25, 0.5, 0.75])
+        boxes = self.tracks.boxes[slots]
+        xs = boxes[:, 0:1] + (boxes[:, 2:3] - boxes[:, 0:1]) * grid  # (N, 3)
+        ys = boxes[:, 1:2] + (boxes[:, 3:4] - boxes[:, 1:2]) * grid
+        points = np.stack(np.broadcast_arrays(xs[:, None, :], ys[:, :, None]), axis=-1)  # (N, 3, 3, 2)
+        points = points.astype(np.float32).reshape(-1, 1, 2)
+        
+        # Một lần gọi LK cho điểm của tất cả tracks
+        next_points, status, _ = cv2.calcOpticalFlowPyrLK(
+            self._prev_gray, gray, points, None, winSize=(15, 15), maxLevel=2
+        )
+        moves = (next_points - points).reshape(len(slots), 9, 2).astype(np.float64)
+        tracked = status.reshape(len(slots), 9).astype(bool)
+        valid = tracked.sum(axis=1) >= 3
+        moves[~tracked] = np.nan
+        displacements[valid] = np.nanmedian(moves[valid], axis=1)
+        return displacements, valid
+    
+    def _active_objects(self) -> TrackedObjects:
+        """Tracked objects đang active (disappeared == 0), view vào track store"""
+        return TrackedObjects(self.tracks, self.tracks.active_slots())
+    
+    def predict(self, frame: Optional[np.ndarray] = None, frame_number: Optional[int] = None) -> TrackedObjects:
+        """
+        Dịch chuyển các tracks sang frame tiếp theo khi frame đó không chạy detection
+        
+        Dùng vị trí dự đoán của Kalman filter (constant velocity); nếu bật optical flow và có frame
+        thì dùng dịch chuyển đo bằng Lucas-Kanade của từng box (và cập nhật Kalman filter với vị trí đó).
+        
+        Args:
+            frame: Frame hiện tại (BGR hoặc grayscale), chỉ cần khi dùng optical flow
+            frame_number: Số thứ tự frame ghi vào trajectory (None = frame trước + 1)
+        
+        Returns:
+            TrackedObjects: Tracked objects với track_id (vị trí đã dự đoán)
+        """
+        gray = self._to_gray(frame)
+        active = self.tracks.active_slots()
+        if gray is not None:
+            displacements, has_flow = self._flow_displacements(gray, active)
+            flow_boxes = self.tracks.boxes[active[has_flow]] + np.tile(displacements[has_flow], 2)
+        
+        self._predict_tracks(self.tracks.alive_slots())
+        self.tracks.set_boxes(active, xyah_to_xyxy(self.tracks.mean[active, :4]))
+        
+        if gray is not None:
+            flow_slots = active[has_flow]
+            if len(flow_slots):
+                self.tracks.set_boxes(flow_slots, flow_boxes)
+                self.tracks.mean[flow_slots], self.tracks.covariance[flow_slots] = self.kalman_filter.update(
+                    self.tracks.mean[flow_slots], self.tracks.covariance[flow_slots], xyxy_to_xyah(flow_boxes)
+                )
+            self._prev_gray = gray
+        self._record(frame_number)
+        return self._active_objects()
+    
+    def _gates(self, slots: np.ndarray, frame_number: int) -> np.ndarray:
+        """
+        Khoảng cách luôn cho phép match của mỗi track
+        
+        Track mới (TRACK_NEW) chưa có vận tốc nên vị trí dự đoán đứng yên từ detection đầu tiên:
+        nới gate theo số frame từ detection đó (các frame giữa do predict() với detection_stride).
+        """
+        gates = np.full(len(slots), float(self.max_distance))
+        new = self.tracks.state[slots] == TRACK_NEW
+        gates[new] *= np.maximum(frame_number - self.tracks.last_frame[slots[new]], 1)
+        return gates
+    
+    def _associate(self, boxes: np.ndarray, slots: np.ndarray, frame_number: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Ghép detections với tracks theo khoảng cách tới centroid dự đoán
+        
+        Gating: trong gate của track (xem _gates), hoặc trong vùng tin cậy 95% (Mahalanobis) của
+        Kalman filter nên xe nhanh / frames bị bỏ qua vẫn match được khi track đã có velocity.
+        
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: (detection indices, track indices trong slots)
+        """
+        mean, covariance = self.tracks.mean[slots], self.tracks.covariance[slots]
+        gates = self._gates(slots, frame_number)
+        centroids = (boxes[:, :2] + boxes[:, 2:]) / 2.0
+        if self.spatial_grid:
+            return self._associate_grid(centroids, mean, covariance, gates)
+        
+        distance = np.linalg.norm(centroids[:, None, :] - mean[None, :, :2], axis=2)
+        mahalanobis = self.kalman_filter.gating_distance(mean, covariance, xyxy_to_xyah(boxes)).T
+        allowed = (distance <= gates[None, :]) | (mahalanobis <= CHI2INV95_2D)
+        return associate(np.where(allowed, distance, np.inf), np.inf, self.matching)
+    
+    def _associate_grid(
+        self,
+        centroids: np.ndarray,
+        mean: np.ndarray,
+        covariance: np.ndarray,
+        gates: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Như _associate() nhưng chỉ xét các cặp (detection, track) tìm được qua spatial grid
+        
+        Bán kính của mỗi track bao cả gate lẫn vùng Mahalanobis nên kết quả giống bản dense.
+        """
+        position_cov = self.kalman_filter.position_covariance(mean, covariance)
+        radii = np.maximum(gates, self.kalman_filter.gating_radius(mean, covariance))
+        det_idx, track_idx = candidate_pairs(centroids, mean[:, :2], radii, self.grid_cell_size)
+        
+        diff = centroids[det_idx] - mean[track_idx, :2]
+        distance = np.sqrt((diff ** 2).sum(axis=1))
+        allowed = (distance <= gates[track_idx]) | (mahalanobis_2d(diff, position_cov[track_idx]) <= CHI2INV95_2D)
+        return associate_sparse(
+            det_idx[allowed], track_idx[allowed], distance[allowed], (len(centroids), len(mean)), self.matching
+        )
+    
+    def update(
+        self,
+        detections: List[Dict],
+        frame: Optional[np.ndarray] = None,
+        frame_number: Optional[int] = None
+    ) -> TrackedObjects:
         """
         Update tracker với detections mới
         
         Args:
             detections: List detections từ vehicle_detection module
+            frame: Frame hiện tại, chỉ cần khi dùng optical flow (làm frame gốc cho predict())
+            frame_number: Số thứ tự frame ghi vào trajectory (None = frame trước + 1)
         
         Returns:
-            List[Dict]: Tracked objects với track_id
+            TrackedObjects: Tracked objects với track_id
         """
-        if len(detections) == 0:
-            # Tăng disappeared count cho tất cả objects
-            for track_id in list(self.objects.keys()):
-                self.objects[track_id]['disappeared'] += 1
-                if self.objects[track_id]['disappeared'] > self.max_disappeared:
-                    del self.objects[track_id]
-                    logger.debug(f"Removed track {track_id}")
-            return []
-        
-        # Nếu chưa có objects, tạo mới cho tất cả detections
-        if len(self.objects) == 0:
-            for detection in detections:
-                track_id = self.next_id
-                self.next_id += 1
-                centroid = self._calculate_centroid(detection['bbox'])
-                self.objects[track_id] = {
-                    'bbox': detection['bbox'],
-                    'centroid': centroid,
-                    'disappeared': 0,
-                    'class': detection.get('class', 'unknown'),
-                    'confidence': detection.get('confidence', 0.0)
-                }
-        else:
-            # Match detections với existing objects
-            input_centroids = [self._calculate_centroid(d['bbox']) for d in detections]
-            object_centroids = {tid: obj['centroid'] for tid, obj in self.objects.items()}
-            
-            # Tính distance matrix
-            distance_matrix = {}
-            for i, input_centroid in enumerate(input_centroids):
-                for tid, obj_centroid in object_centroids.items():
-                    distance = self._calculate_distance(input_centroid, obj_centroid)
-                    distance_matrix[(i, tid)] = distance
-            
-            # Greedy matching: match closest pairs
-            used_detections = set()
-            used_tracks = set()
-            
-            # Sort by distance
-            sorted_pairs = sorted(distance_matrix.items(), key=lambda x: x[1])
-            
-            for (det_idx, track_id), distance in sorted_pairs:
-                if det_idx in used_detections or track_id in used_tracks:
-                    continue
-                
-                if distance <= self.max_distance:
-                    # Match found
-                    detection = detections[det_idx]
-                    centroid = input_centroids[det_idx]
-                    
-                    self.objects[track_id]['bbox'] = detection['bbox']
-                    self.objects[track_id]['centroid'] = centroid
-                    self.objects[track_id]['disappeared'] = 0
-                    self.objects[track_id]['class'] = detection.get('class', 'unknown')
-                    self.objects[track_id]['confidence'] = detection.get('confidence', 0.0)
-                    
-                    used_detections.add(det_idx)
-                    used_tracks.add(track_id)
-            
-            # Tạo mới cho detections không match
-            for i, detection in enumerate(detections):
-                if i not in used_detections:
-                    track_id = self.next_id
-                    self.next_id += 1
-                    centroid = self._calculate_centroid(detection['bbox'])
-                    self.objects[track_id] = {
-                        'bbox': detection['bbox'],
-                        'centroid': centroid,
-                        'disappeared': 0,
-                        'class': detection.get('class', 'unknown'),
-                        'confidence': detection.get('confidence', 0.0)
-                    }
+        gray = self._to_gray(frame)
+        if gray is not None:
+            self._prev_gray = gray
+        current_frame = self.frame_number + 1 if frame_number is None else frame_number
+        
+        slots = self.tracks.alive_slots()
+        self._predict_tracks(slots)
+        boxes = np.asarray([d['bbox'] for d in detections], dtype=np.float64).reshape(-1, 4)
+        
+        det_indices = track_indices = np.zeros(0, dtype=np.int64)
+        if len(slots) and len(detections):
+            det_indices, track_indices = self._associate(boxes, slots, current_frame)
+        
+        if len(track_indices):
+            # Match found: Kalman update một lần cho tất cả tracks được match
+            matched = slots[track_indices]
+            measurements = xyxy_to_xyah(boxes[det_indices])
+            second = self.tracks.state[matched] == TRACK_NEW
+            first_positions = self.tracks.mean[matched[second], :4]  # Vận tốc 0: vẫn ở detection đầu tiên
+            self.tracks.mean[matched], self.tracks.covariance[matched] = self.kalman_filter.update(
+                self.tracks.mean[matched], self.tracks.covariance[matched], measurements
+            )
             
-            # Tăng disappeared count cho objects không match
-            for track_id in list(self.objects.keys()):
-                if track_id not in used_tracks:
-                    self.objects[track_id]['disappeared'] += 1
-                    if self.objects[track_id]['disappeared'] > self.max_disappeared:
-                        del self.objects[track_id]
-                        logger.debug(f"Removed track {track_id}")
+            # Track mới được ghép lần thứ hai: vận tốc từ 2 detections (xe nhanh / detection_stride > 1).
+            # Với optical flow, Kalman filter đã được update theo flow ở các frame giữa nên giữ nguyên
+            if np.any(second):
+                slots_2 = matched[second]
+                if not self.use_optical_flow:
+                    self.tracks.mean[slots_2], self.tracks.covariance[slots_2] = self.kalman_filter.initiate_moving(
+                        first_positions, measurements[second], current_frame - self.tracks.last_frame[slots_2]
+                    )
+                self.tracks.state[slots_2] = TRACK_TRACKED
+            self._write_detections(
+                matched, [detections[i] for i in det_indices.tolist()], boxes[det_indices], current_frame
+            )
+        
+        # Tăng disappeared count cho objects không match, remove nếu mất quá lâu
+        unmatched = np.ones(len(slots), dtype=bool)
+        unmatched[track_indices] = False
+        self.tracks.disappeared[slots[unmatched]] += 1
+        expired = slots[self.tracks.disappeared[slots] > self.max_disappeared]
+        if len(expired):
+            logger.debug(f"Removed tracks {self.tracks.track_ids[expired].tolist()}")
+            self.tracks.release(expired)
+        
+        # Tạo mới cho detections không match
+        new = np.ones(len(detections), dtype=bool)
+        new[det_indices] = False
+        new_indices = np.flatnonzero(new)
+        self._register([detections[i] for i in new_indices.tolist()], boxes[new_indices], current_frame)
         
         # Trả về tracked objects
-        tracked_objects = []
-        for track_id, obj in self.objects.items():
-            if obj['disappeared'] == 0:  # Chỉ trả về objects đang active
-                tracked_obj = {
-                    'track_id': track_id,
-                    'bbox': obj['bbox'],
-                    'centroid': obj['centroid'],
-                    'class': obj['class'],
-                    'confidence': obj['confidence']
-                }
-                tracked_objects.append(tracked_obj)
-        
-        return tracked_objects
+        self._record(frame_number)
+        return self._active_objects()
+    
+    def _record(self, frame_number: Optional[int]):
+        """Ghi vị trí của các tracks active vào trajectory"""
+        self.frame_number = self.frame_number + 1 if frame_number is None else frame_number
+        self.tracks.record(np.flatnonzero(self.tracks.alive & (self.tracks.disappeared == 0)), self.frame_number)
+    
+    def pop_finished_trajectories(self) -> List[Dict]:
+        """
+        Lấy trajectories của các tracks đã kết thúc (để lưu DB)
+        
+        Returns:
+            List[Dict]: {'track_id', 'class', 'frames', 'boxes', 'centroids'}
+        """
+        return self.tracks.pop_finished()
+    
+    def finish_all(self):
+        """Kết thúc tất cả tracks (ví dụ: hết video); trajectories lấy bằng pop_finished_trajectories()"""
+        self.tracks.release(self.tracks.alive_slots())
+
+
+class ByteTracker:
+    """
+    ByteTrack: association 2 tầng (detections confidence cao rồi thấp) bằng IoU với box
+    dự đoán từ Kalman filter; cùng API update()/predict() với VehicleTracker
+    
+    Tracks lưu trong TrackStore (state: TRACK_NEW chưa xác nhận, TRACK_TRACKED, TRACK_LOST) nên
+    predict/update/IoU được tính một lần cho tất cả tracks. Track chưa xác nhận được giữ qua các
+    frame predict() và ghép ở lần update() kế tiếp theo khoảng cách (nới theo số frame đã qua),
+    vì chưa có vận tốc nên box dự đoán của xe nhanh không còn chồng lên detection.
+    """
+    
+    def __init__(
+        self,
+        track_high_thresh: float = 0.5,
+        track_low_thresh: float = 0.1,
+        new_track_thresh: float = 0.6,
+        match_thresh: float = 0.8,
+        track_buffer: int = 30,
+        fuse_score: bool = True,
+        new_match_distance: float = 1.0,
+        capacity: int = 64,
+        history_size: int = 64
+    ):
+        """
+        Khởi tạo tracker
+        
+        Args:
+            track_high_thresh: Detections có confidence >= ngưỡng này vào tầng association thứ nhất
+            track_low_thresh: Detections trong [low, high) chỉ dùng để giữ tracks đang theo (xe bị che)
+            new_track_thresh: Confidence tối thiểu để tạo track mới
+            match_thresh: Cost (1 - IoU) tối đa khi ghép ở tầng thứ nhất
+            track_buffer: Số frame giữ track bị mất trước khi remove
+            fuse_score: Nhân IoU với confidence của detection khi ghép detections confidence cao
+            new_match_distance: Khoảng cách centroid tối đa mỗi frame (theo chiều cao box) khi ghép
+                track chưa xác nhận với detection
+            capacity: Số tracks cấp phát trước trong track store (tự tăng khi cần)
+            history_size: Số điểm trajectory (frame, bbox) giữ cho mỗi track
+        """
+        self.track_high_thresh = track_high_thresh
+        self.track_low_thresh = track_low_thresh
+        self.new_track_thresh = new_track_thresh
+        self.match_thresh = match_thresh
+        self.track_buffer = track_buffer
+        self.fuse_score = fuse_score
+        self.new_match_distance = new_match_distance
+        self.use_optical_flow = False  # Frames không detect dùng Kalman prediction
+        self.kalman_filter = BatchKalmanFilter()
+        self.tracks = TrackStore(capacity, history_size)
+        self.frame_id = 0
+        self.frame_number = -1  # Frame gần nhất đã xử lý (ghi vào trajectory)
+        self.next_id = 0
+        self._first_update = True  # Tracks tạo ở lần update() đầu tiên được xác nhận ngay
+        logger.info("ByteTrack tracker initialized")
+    
+    def _predict_tracks(self, frame_number: Optional[int]) -> np.ndarray:
+        """Kalman predict cho tất cả tracks; track bị mất không giữ vận tốc thay đổi chiều cao"""
+        self.frame_id += 1
+        self.frame_number = self.frame_number + 1 if frame_number is None else frame_number
+        slots = self.tracks.alive_slots()
+        if len(slots):
+            self.tracks.mean[slots[self.tracks.state[slots] == TRACK_LOST], 7] = 0.0
+            self.tracks.mean[slots], self.tracks.covariance[slots] = self.kalman_filter.predict(
+                self.tracks.mean[slots], self.tracks.covariance[slots]
+            )
+        return slots
+    
+    def _match(self, track_idx: np.ndarray, det_idx: np.ndarray, track_boxes: np.ndarray,
+               det_boxes: np.ndarray, det_scores: np.ndarray, thresh: float, fuse: bool) -> Tuple[np.ndarray, np.ndarray]:
+        """Ghép tracks với detections theo IoU, trả về (track indices, det indices) đã ghép"""
+        if len(track_idx) == 0 or len(det_idx) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        iou = box_iou(track_boxes[track_idx], det_boxes[det_idx])
+        if fuse:
+            iou = iou * det_scores[det_idx][None, :]
+        rows, cols = associate(1.0 - iou, thresh)
+        return track_idx[rows], det_idx[cols]
+    
+    def _match_unconfirmed(self, track_idx: np.ndarray, det_idx: np.ndarray, slots: np.ndarray,
+                           det_boxes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Ghép tracks chưa xác nhận với detections theo khoảng cách centroid
+        
+        Gate = new_match_distance * chiều cao box * số frame từ detection của track.
+        """
+        if len(track_idx) == 0 or len(det_idx) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        mean = self.tracks.mean[slots[track_idx]]
+        elapsed = np.maximum(self.frame_id - self.tracks.last_frame[slots[track_idx]], 1)
+        gates = self.new_match_distance * mean[:, 3] * elapsed
+        
+        centroids = (det_boxes[det_idx, :2] + det_boxes[det_idx, 2:]) / 2.0
+        distance = np.linalg.norm(mean[:, None, :2] - centroids[None, :, :], axis=2)
+        rows, cols = associate(distance / gates[:, None], 1.0)
+        return track_idx[rows], det_idx[cols]
+    
+    def _output(self, slots: np.ndarray) -> TrackedObjects:
+        """Box từ Kalman state; ghi trajectory và trả về tracks đang theo (đã xác nhận)"""
+        self.tracks.set_boxes(slots, xyah_to_xyxy(self.tracks.mean[slots, :4]))
+        active = slots[self.tracks.state[slots] == TRACK_TRACKED]
+        self.tracks.record(active, self.frame_number)
+        return TrackedObjects(self.tracks, self.tracks.by_track_id(active))
+    
+    def predict(self, frame: Optional[np.ndarray] = None, frame_number: Optional[int] = None) -> TrackedObjects:
+        """
+        Dịch chuyển các tracks sang frame tiếp theo khi frame đó không chạy detection
+        
+        Args:
+            frame: Không dùng (giữ cùng API với VehicleTracker)
+            frame_number: Số thứ tự frame ghi vào trajectory (None = frame trước + 1)
+        
+        Returns:
+            TrackedObjects: Tracked objects với track_id (box dự đoán từ Kalman filter)
+        """
+        return self._output(self._predict_tracks(frame_number))
+    
+    def update(
+        self,
+        detections: List[Dict],
+        frame: Optional[np.ndarray] = None,
+        frame_number: Optional[int] = None
+    ) -> TrackedObjects:
+        """
+        Update tracker với detections mới
+        
+        Args:
+            detections: List detections từ vehicle_detection module (gồm cả confidence thấp)
+            frame: Không dùng (giữ cùng API với VehicleTracker)
+            frame_number: Số thứ tự frame ghi vào trajectory (None = frame trước + 1)
+        
+        Returns:
+            TrackedObjects: Tracked objects với track_id
+        """
+        boxes = np.asarray([d['bbox'] for d in detections], dtype=np.float64).reshape(-1, 4)
+        scores = np.asarray([d.get('confidence', 1.0) for d in detections], dtype=np.float64)
+        class_ids = np.asarray([self.tracks.class_id(d.get('class', 'unknown')) for d in detections], dtype=np.int32)
+        
+        slots = self._predict_tracks(frame_number)
+        state = self.tracks.state[slots]
+        activated = state != TRACK_NEW
+        track_boxes = xyah_to_xyxy(self.tracks.mean[slots, :4])
+        high = np.flatnonzero(scores >= self.track_high_thresh)
+        low = np.flatnonzero((scores >= self.track_low_thresh) & (scores < self.track_high_thresh))
+        
+        track_matched = np.zeros(len(slots), dtype=bool)
+        det_matched = np.zeros(len(boxes), dtype=bool)
+        
+        # Tầng 1: tracks đã xác nhận (đang theo + bị mất) với detections confidence cao
+        tracks_1, dets_1 = self._match(
+            np.flatnonzero(activated), high, track_boxes, boxes, scores, self.match_thresh, self.fuse_score
+        )
+        track_matched[tracks_1] = True
+        det_matched[dets_1] = True
+        
+        # Tầng 2: tracks đang theo chưa ghép với detections confidence thấp (xe bị che một phần)
+        tracks_2, dets_2 = self._match(
+            np.flatnonzero(~track_matched & (state == TRACK_TRACKED)), low, track_boxes, boxes, scores, 0.5, False
+        )
+        
+        # Tracks chưa xác nhận (mới từ lần update trước) với detections confidence cao còn lại
+        tracks_3, dets_3 = self._match_unconfirmed(np.flatnonzero(~activated), high[~det_matched[high]], slots, boxes)
+        det_matched[dets_3] = True
+        first_positions = self.tracks.mean[slots[tracks_3], :4]
+        
+        # Kalman update một lần cho tất cả tracks được ghép
+        matched_tracks = np.concatenate([tracks_1, tracks_2, tracks_3])
+        matched_dets = np.concatenate([dets_1, dets_2, dets_3])
+        if len(matched_tracks):
+            matched = slots[matched_tracks]
+            self.tracks.mean[matched], self.tracks.covariance[matched] = self.kalman_filter.update(
+                self.tracks.mean[matched], self.tracks.covariance[matched], xyxy_to_xyah(boxes[matched_dets])
+            )
+            if len(tracks_3):
+                # Xác nhận track mới: vận tốc từ 2 detections (vận tốc 0 nên mean vẫn ở detection đầu tiên)
+                confirmed = slots[tracks_3]
+                self.tracks.mean[confirmed], self.tracks.covariance[confirmed] = self.kalman_filter.initiate_moving(
+                    first_positions, xyxy_to_xyah(boxes[dets_3]), self.frame_id - self.tracks.last_frame[confirmed]
+                )
+            self.tracks.state[matched] = TRACK_TRACKED
+            self.tracks.confidences[matched] = scores[matched_dets]
+            self.tracks.class_ids[matched] = class_ids[matched_dets]
+            self.tracks.last_frame[matched] = self.frame_id
+        
+        # Tracks không ghép được: đang theo → mất; chưa xác nhận (đã qua các frame predict) → bỏ; mất quá lâu → bỏ
+        track_matched[matched_tracks] = True
+        self.tracks.state[slots[~track_matched & activated]] = TRACK_LOST
+        expired = slots[
+            (self.tracks.state[slots] == TRACK_LOST) & (self.frame_id - self.tracks.last_frame[slots] > self.track_buffer)
+        ]
+        unconfirmed = slots[~track_matched & ~activated]
+        if len(expired) or len(unconfirmed):
+            logger.debug(f"Removed {len(expired) + len(unconfirmed)} tracks")
+            self.tracks.release(expired)
+            self.tracks.release(unconfirmed, keep_trajectory=False)
+        
+        # Tạo track mới cho detections confidence cao còn lại (chỉ xác nhận ngay ở lần update đầu tiên)
+        new = high[~det_matched[high]]
+        new = new[scores[new] >= self.new_track_thresh]
+        if len(new):
+            new_slots = self.tracks.allocate(np.arange(self.next_id, self.next_id + len(new)))
+            self.next_id += len(new)
+            self.tracks.mean[new_slots], self.tracks.covariance[new_slots] = self.kalman_filter.initiate(
+                xyxy_to_xyah(boxes[new])
+            )
+            self.tracks.state[new_slots] = TRACK_TRACKED if self._first_update else TRACK_NEW
+            self.tracks.confidences[new_slots] = scores[new]
+            self.tracks.class_ids[new_slots] = class_ids[new]
+            self.tracks.last_frame[new_slots] = self.frame_id
+        self._first_update = False
+        
+        return self._output(self.tracks.alive_slots())
+    
+    def pop_finished_trajectories(self) -> List[Dict]:
+        """
+        Lấy trajectories của các tracks đã kết thúc (để lưu DB)
+        
+        Returns:
+            List[Dict]: {'track_id', 'class', 'frames', 'boxes', 'centroids'}
+        """
+        return self.tracks.pop_finished()
+    
+    def finish_all(self):
+        """Kết thúc tất cả tracks (ví dụ: hết video); trajectories lấy bằng pop_finished_trajectories()"""
+        slots = self.tracks.alive_slots()
+        self.tracks.release(slots[self.tracks.state[slots] != TRACK_NEW])
+        self.tracks.release(slots[self.tracks.state[slots] == TRACK_NEW], keep_trajectory=False)
+
+
+def create_tracker(tracker_config: Optional[Dict] = None, optical_flow: bool = False):
+    """
+    Tạo tracker theo config 'tracker' ({'type': 'simple' | 'bytetrack', ...tham số tracker})
+    
+    Args:
+        tracker_config: Config của tracker (None = VehicleTracker mặc định)
+        optical_flow: Dùng optical flow ở các frame không detect (chỉ VehicleTracker)
+    
+    Returns:
+        VehicleTracker hoặc ByteTracker
+    """
+    tracker_config = dict(tracker_config or {})
+    tracker_type = tracker_config.pop('type', 'simple')
+    if tracker_type not in AVAILABLE_TRACKERS:
+        raise ValueError(f"Unknown tracker: {tracker_type} (available: {', '.join(AVAILABLE_TRACKERS)})")
+    
+    if tracker_type == 'bytetrack':
+        if optical_flow:
+            logger.warning("ByteTrack predicts skipped frames with its Kalman filter, optical flow is ignored")
+        return ByteTracker(**tracker_config)
+    return VehicleTracker(use_optical_flow=optical_flow, **tracker_config)
 
 
 def track_vehicles(detections: List[Dict], previous_tracks: Optional[Dict] = None) -> List[Dict]:
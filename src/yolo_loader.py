@@ -3,6 +3,7 @@ YOLO Loader với timeout và error handling
 """
 import sys
 import signal
+import threading
 import logging
 from pathlib import Path
 
@@ -60,38 +61,49 @@ def load_yolo_with_timeout(timeout_seconds=30):
         signal.alarm(0)  # Đảm bảo cancel timeout
 
 
-def create_detector_safe(model_path='yolov8n.pt', conf_threshold=0.25, timeout=30):
+def create_detector_safe(model_path='yolov8n.pt', conf_threshold=0.25, timeout=30, backend='torch', **backend_kwargs):
     """
     Tạo VehicleDetector an toàn với timeout
     
+    Detector lấy từ model_registry: model chỉ load + warm-up ở job đầu tiên,
+    các job sau trong cùng process dùng lại ngay.
+    
+    Args:
+        model_path: Đường dẫn đến YOLO model
+        conf_threshold: Confidence threshold
+        timeout: Timeout (giây), chỉ áp dụng khi gọi từ main thread (SIGALRM)
+        backend: Inference backend ('torch', 'onnx', 'openvino')
+        **backend_kwargs: Tham số riêng của backend
+    
     Returns:
         VehicleDetector hoặc None
     """
     def timeout_handler(signum, frame):
         raise TimeoutError("YOLO initialization timeout")
     
-    signal.signal(signal.SIGALRM, timeout_handler)
-    signal.alarm(timeout)
+    # signal chỉ dùng được trong main thread (web app gọi từ background thread)
+    use_alarm = threading.current_thread() is threading.main_thread()
+    if use_alarm:
+        signal.signal(signal.SIGALRM, timeout_handler)
+        signal.alarm(timeout)
     
     try:
         logger.info("Creating VehicleDetector...")
-        from vehicle_detection import VehicleDetector
-        detector = VehicleDetector(model_path=model_path, conf_threshold=conf_threshold)
+        from model_registry import get_detector
+        detector = get_detector(
+            model_path=model_path, conf_threshold=conf_threshold, backend=backend, **backend_kwargs
+        )
         logger.info("✓ VehicleDetector created")
-        signal.alarm(0)
         return detector
     except TimeoutError:
-        signal.alarm(0)
         logger.error("VehicleDetector creation timeout")
         return None
     except (SystemError, OSError, RuntimeError, MemoryError) as e:
-        signal.alarm(0)
         logger.error(f"System error creating detector: {type(e).__name__} - {str(e)}")
         return None
     except Exception as e:
-        signal.alarm(0)
         logger.error(f"Error creating detector: {type(e).__name__} - {str(e)}", exc_info=True)
         return None
     finally:
-        signal.alarm(0)
-
+        if use_alarm:
+            signal.alarm(0)  # Đảm bảo cancel timeout
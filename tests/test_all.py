@@ -30,7 +30,7 @@ def test_imports():
         from vehicle_detection import VehicleDetector
         from vehicle_tracking import VehicleTracker
         from counting import VehicleCounter
-        from storage import initialize_database, save_counting_result
+        from storage import initialize_database, save_count_bins
         logger.info("✓ All imports successful")
         return True
     except Exception as e:
@@ -77,14 +77,72 @@ def test_database():
         logger.info("✓ Database initialized successfully")
         
         # Cleanup
-        if db_path.exists():
-            os.remove(str(db_path))
+        from db_connection import close_all_connections
+        close_all_connections()
+        for suffix in ('', '-wal', '-shm'):
+            path = Path(str(db_path) + suffix)
+            if path.exists():
+                os.remove(str(path))
         
         return True
     except Exception as e:
         logger.error(f"✗ Database test failed: {e}")
         return False
 
+def test_db_connection():
+    """Test shared SQLite connection manager"""
+    logger.info("Testing database connection manager...")
+    try:
+        import threading
+        from db_connection import get_connection, close_all_connections
+        
+        db_path = project_root / 'data' / 'database' / 'test_conn.db'
+        create_directories(str(db_path.parent))
+        
+        conn = get_connection(str(db_path))
+        assert get_connection(str(db_path)) is conn  # Persistent trong cùng thread
+        assert conn.execute('PRAGMA journal_mode').fetchone()[0].lower() == 'wal'
+        assert conn.execute('PRAGMA synchronous').fetchone()[0] == 1  # NORMAL
+        
+        other = []
+        thread = threading.Thread(target=lambda: other.append(get_connection(str(db_path))))
+        thread.start()
+        thread.join()
+        assert other[0] is not conn  # Mỗi thread một connection
+        
+        # close_all_connections không đóng connection của thread khác đang chạy,
+        # thread đó tự đổi sang connection mới ở lần get_connection tiếp theo
+        opened, closed_all, results = threading.Event(), threading.Event(), []
+        
+        def worker():
+            own = get_connection(str(db_path))
+            opened.set()
+            closed_all.wait()
+            results.append(own.execute('SELECT 1').fetchone()[0])
+            results.append(get_connection(str(db_path)) is not own)
+        
+        thread = threading.Thread(target=worker)
+        thread.start()
+        opened.wait()
+        close_all_connections()
+        closed_all.set()
+        thread.join()
+        assert results == [1, True]
+        
+        assert get_connection(str(db_path)) is not conn
+        close_all_connections()
+        
+        for suffix in ('', '-wal', '-shm'):
+            path = Path(str(db_path) + suffix)
+            if path.exists():
+                os.remove(str(path))
+        
+        logger.info("✓ Connection manager successful")
+        return True
+    except Exception as e:
+        logger.error(f"✗ Connection manager test failed: {e}")
+        return False
+
 def test_vehicle_detector():
     """Test vehicle detector initialization"""
     logger.info("Testing vehicle detector...")
@@ -98,6 +156,249 @@ def test_vehicle_detector():
         logger.warning("This might fail if YOLO model is not downloaded yet")
         return False
 
+def test_model_registry():
+    """Test model registry dùng lại detector đã load"""
+    logger.info("Testing model registry...")
+    try:
+        from model_registry import get_detector, registered_models, clear_registry
+        
+        clear_registry()
+        first = get_detector('yolov8n.pt', conf_threshold=0.25)
+        assert get_detector('yolov8n.pt', conf_threshold=0.25) is first
+        assert get_detector('yolov8n.pt', conf_threshold=0.5, warmup=False) is not first
+        assert len(registered_models()) == 2
+        clear_registry()
+        
+        logger.info("✓ Model registry successful")
+        return True
+    except Exception as e:
+        logger.error(f"✗ Model registry test failed: {e}")
+        logger.warning("This might fail if YOLO model is not downloaded yet")
+        return False
+
+def test_detection_arrays():
+    """Test chuyển detection arrays sang list dict"""
+    logger.info("Testing detection arrays...")
+    try:
+        import numpy as np
+        from vehicle_detection import arrays_to_detections, empty_detection_arrays
+        
+        arrays = {
+            'boxes': np.array([[10, 20, 30, 40], [50, 60, 70, 80]], dtype=np.float32),
+            'scores': np.array([0.9, 0.5], dtype=np.float32),
+            'class_ids': np.array([2, 7], dtype=np.int32)
+        }
+        detections = arrays_to_detections(arrays)
+        assert len(detections) == 2
+        assert detections[0]['bbox'] == [10.0, 20.0, 30.0, 40.0]
+        assert detections[1]['class'] == 'truck'
+        assert isinstance(detections[1]['class_id'], int)
+        assert arrays_to_detections(empty_detection_arrays()) == []
+        
+        logger.info("✓ Detection arrays successful")
+        return True
+    except Exception as e:
+        logger.error(f"✗ Detection arrays test failed: {e}")
+        return False
+
+def test_detection_cache():
+    """Test lưu/đọc detection cache theo segment"""
+    logger.info("Testing detection cache...")
+    try:
+        import shutil
+        import numpy as np
+        from detection_cache import DetectionCache, config_tag
+        
+        cache_dir = project_root / 'data' / 'test_detection_cache'
+        arrays = {
+            'boxes': np.array([[10, 20, 30, 40]], dtype=np.float32),
+            'scores': np.array([0.9], dtype=np.float32),
+            'class_ids': np.array([2], dtype=np.int32)
+        }
+        tag = config_tag({'type': 'polygon'}, [2, 7])
+        
+        cache = DetectionCache(str(cache_dir))
+        cache.open_segment('video', '300s_0000', 'model')
+        cache.store(0, arrays, tag)
+        cache.store(1, {k: v[:0] for k, v in arrays.items()}, tag)
+        cache.close()
+        
+        cache = DetectionCache(str(cache_dir))
+        cache.open_segment('video', '300s_0000', 'model')
+        cached = cache.lookup(0, tag)
+        assert cached is not None and np.allclose(cached['boxes'], arrays['boxes'])
+        assert len(cache.lookup(1, tag)['boxes']) == 0
+        assert cache.lookup(0, tag + 1) is None  # ROI/classes khác → miss
+        assert cache.lookup(2, tag) is None
+        
+        shutil.rmtree(str(cache_dir))
+        
+        logger.info("✓ Detection cache successful")
+        return True
+    except Exception as e:
+        logger.error(f"✗ Detection cache test failed: {e}")
+        return False
+
+def test_sliced_inference():
+    """Test chia tile vùng xa và gộp detections giữa các tile"""
+    logger.info("Testing sliced inference helpers...")
+    try:
+        import numpy as np
+        from vehicle_detection import compute_tiles
+        from detection_backends import merge_detection_arrays
+        
+        tiles = compute_tiles((0, 100, 3840, 500), (2160, 3840), tile_size=640, overlap=0.2)
+        assert all(x2 - x1 == 640 and y2 - y1 == 640 for x1, y1, x2, y2 in tiles)
+        assert tiles[0][:2] == (0, 100) and tiles[-1][2] == 3840
+        assert compute_tiles((0, 0, 300, 200), (200, 300), tile_size=640) == [(0, 0, 300, 200)]
+        
+        # Mảnh xe bị cắt ở mép tile nằm trong box full frame → bị gộp
+        full = {'boxes': np.array([[100, 100, 200, 160]], dtype=np.float32),
+                'scores': np.array([0.8], dtype=np.float32), 'class_ids': np.array([2], dtype=np.int32)}
+        tile = {'boxes': np.array([[150, 100, 200, 160], [400, 50, 420, 60]], dtype=np.float32),
+                'scores': np.array([0.6, 0.4], dtype=np.float32), 'class_ids': np.array([2, 2], dtype=np.int32)}
+        merged = merge_detection_arrays([full, tile])
+        assert len(merged['boxes']) == 2
+        assert merged['scores'][0] == np.float32(0.8)
+        
+        logger.info("✓ Sliced inference helpers successful")
+        return True
+    except Exception as e:
+        logger.error(f"✗ Sliced inference test failed: {e}")
+        return False
+
+def test_backend_parity():
+    """Test ONNX backend cho kết quả giống torch backend trên frames mẫu"""
+    logger.info("Testing detector backend parity...")
+    try:
+        from detection_backends import DetectionBackend, _ExportedModelBackend, create_backend
+        
+        # Interface: không tạo được backend thiếu method, tham số lạ bị từ chối thay vì bỏ qua
+        for abstract in (DetectionBackend, _ExportedModelBackend):
+            try:
+                abstract()
+                raise AssertionError(f"{abstract.__name__} should be abstract")
+            except TypeError:
+                pass
+        try:
+            create_backend('torch', model_path='yolov8n.pt', unknown_option=1)
+            raise AssertionError("Unknown backend option should raise TypeError")
+        except TypeError:
+            pass
+        
+        import importlib.util
+        if importlib.util.find_spec('onnxruntime') is None:
+            logger.warning("onnxruntime not installed, skipping backend parity test")
+            return None
+        
+        from vehicle_detection import VehicleDetector
+        from detection_backends import detection_recall
+        
+        sample_paths = sorted((project_root / 'static' / 'frames').glob('*.jpg'))[:5]
+        frames = [cv2.imread(str(p)) for p in sample_paths]
+        frames = [f for f in frames if f is not None]
+        if not frames:
+            logger.warning("No sample frames found, skipping backend parity test")
+            return None
+        
+        torch_detector = VehicleDetector(model_path='yolov8n.pt', backend='torch')
+        onnx_detector = VehicleDetector(model_path='yolov8n.pt', backend='onnx')
+        
+        torch_results = torch_detector.detect_vehicles_batch(frames, as_arrays=True)
+        onnx_results = onnx_detector.detect_vehicles_batch(frames, as_arrays=True)
+        
+        matched = total = 0
+        for reference, candidate in zip(torch_results, onnx_results):
+            m, t = detection_recall(reference, candidate, iou_threshold=0.7)
+            matched += m
+            total += t
+        
+        assert total == 0 or matched / total >= 0.9, f"ONNX matched {matched}/{total} torch detections"
+        logger.info(f"✓ Backend parity successful ({matched}/{total} detections matched)")
+        return True
+    except Exception as e:
+        logger.error(f"✗ Backend parity test failed: {e}")
+        logger.warning("This might fail if YOLO model is not downloaded yet")
+        return False
+
+class _EchoDetector:
+    """Detector giả cho inference worker: box = giá trị pixel đầu; crash một lần với frame 255"""
+    
+    def __init__(self, crash_marker=None, **kwargs):
+        self.crash_marker = crash_marker
+    
+    def set_slice_region(self, roi_config):
+        pass
+    
+    def detect_vehicles_batch(self, images, vehicle_classes=None, as_arrays=True):
+        import numpy as np
+        results = []
+        for image in images:
+            value = float(image.flat[0])
+            if value == 255 and self.crash_marker and not os.path.exists(self.crash_marker):
+                open(self.crash_marker, 'w').close()
+                os._exit(1)
+            results.append({
+                'boxes': np.array([[value, value, value + 1, value + 1]], dtype=np.float32),
+                'scores': np.array([float(image.shape[0])], dtype=np.float32),
+                'class_ids': np.array([2], dtype=np.int32)
+            })
+        return results
+
+def test_inference_worker():
+    """Test inference worker: ring buffer round-trip, thứ tự kết quả, restart sau crash"""
+    logger.info("Testing inference worker...")
+    detector = None
+    try:
+        import tempfile
+        import numpy as np
+        from inference_worker import RemoteDetector
+        
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            detector = RemoteDetector(
+                batch_size=2, detector_factory=_EchoDetector, startup_timeout=120.0,
+                crash_marker=os.path.join(tmp_dir, 'crashed')
+            )
+            assert detector.slot_bytes == 0  # Ring buffer chỉ cấp phát khi có frame đầu tiên
+            
+            frames = [np.full((32, 48, 3), value, dtype=np.uint8) for value in range(1, 6)]
+            detections = detector.detect_vehicles_batch(frames)
+            assert detector.slot_bytes == 32 * 48 * 3
+            assert [d[0]['bbox'][0] for d in detections] == [1, 2, 3, 4, 5]
+            assert detections[0][0]['class'] == 'car'
+            
+            # Nhiều batch gửi trước khi chờ: mỗi future nhận đúng kết quả của batch đó
+            futures = [detector.submit_batch([frames[i], frames[i + 1]]) for i in range(4)]
+            for i, future in enumerate(futures):
+                assert [d[0]['bbox'][0] for d in future.result(timeout=60)] == [i + 1, i + 2]
+            
+            # Frame lớn hơn → cấp phát lại ring buffer
+            large = np.full((64, 96, 3), 7, dtype=np.uint8)
+            result = detector.detect_vehicles(large)
+            assert result[0]['bbox'][0] == 7 and result[0]['confidence'] == 64
+            assert detector.slot_bytes == 64 * 96 * 3
+            
+            # Worker crash → restart, batch được gửi lại; lần crash trước đã lâu nên số lần restart được đếm lại
+            import time
+            detector.restarts = detector.max_restarts
+            detector._last_restart = time.monotonic() - detector.restart_reset_after - 1
+            crash = np.full((64, 96, 3), 255, dtype=np.uint8)
+            detections = detector.detect_vehicles_batch([frames[0], crash])
+            assert [d[0]['bbox'][0] for d in detections] == [1, 255]
+            assert detector.restarts == 1
+            assert detector.detect_vehicles(frames[2])[0]['bbox'][0] == 3
+            
+            detector.close()
+        
+        logger.info("✓ Inference worker successful")
+        return True
+    except Exception as e:
+        logger.error(f"✗ Inference worker test failed: {e}")
+        return False
+    finally:
+        if detector is not None:
+            detector.close()
+
 def test_roi_processing():
     """Test ROI processing với image mẫu"""
     logger.info("Testing ROI processing...")
@@ -123,6 +424,194 @@ def test_roi_processing():
         logger.error(f"✗ ROI processing test failed: {e}")
         return False
 
+def test_roi_warp():
+    """Test warp ROI/counting line theo homography"""
+    logger.info("Testing ROI warp...")
+    try:
+        import numpy as np
+        from roi_processing import warp_roi_config, warp_points
+        
+        translation = np.array([[1, 0, 20], [0, 1, -10], [0, 0, 1]], dtype=np.float64)
+        roi = {'type': 'rectangle', 'x': 0, 'y': 100, 'width': 50, 'height': 40}
+        
+        warped = warp_roi_config(roi, translation)
+        assert warped['type'] == 'polygon'
+        assert np.allclose(warped['points'][0], [20, 90])
+        assert np.allclose(warped['points'][2], [70, 130])
+        assert roi['type'] == 'rectangle'  # Config gốc không đổi
+        
+        start, end = warp_points([[0, 0], [100, 0]], translation)
+        assert np.allclose(start, [20, -10]) and np.allclose(end, [120, -10])
+        
+        logger.info("✓ ROI warp successful")
+        return True
+    except Exception as e:
+        logger.error(f"✗ ROI warp test failed: {e}")
+        return False
+
+def test_camera_shift():
+    """Test camera shift detector với reference features cache"""
+    logger.info("Testing camera shift detection...")
+    try:
+        import numpy as np
+        from camera_shift_detection import ShiftDetector
+        
+        # Tạo reference frame có texture để ORB tìm được features
+        rng = np.random.default_rng(0)
+        reference = cv2.GaussianBlur(rng.integers(0, 255, (480, 640), dtype=np.uint8), (5, 5), 0)
+        reference = cv2.cvtColor(reference, cv2.COLOR_GRAY2BGR)
+        
+        detector = ShiftDetector(reference, threshold=0.1)
+        cached_descriptors = detector._ref_descriptors
+        
+        result = detector.detect(reference.copy())
+        assert not result['is_shifted']
+        assert result['match_count'] == 0  # Dừng ở tầng phase correlation
+        
+        # Dịch frame 120px theo trục x
+        matrix = np.float32([[1, 0, 120], [0, 1, 0]])
+        shifted = cv2.warpAffine(reference, matrix, (640, 480))
+        result = detector.detect(shifted, reference)
+        assert result['is_shifted']
+        assert result['match_count'] > 0  # Đã chuyển sang ORB + homography
+        assert detector._ref_descriptors is cached_descriptors  # Không tính lại reference
+        
+        # Đổi reference → cache bị invalidate
+        detector.detect(shifted, shifted)
+        assert detector._ref_descriptors is not cached_descriptors
+        
+        # detect_camera_shift: detector riêng theo thread và threshold, không ghi đè threshold của nhau
+        import threading
+        from camera_shift_detection import _get_default_detector
+        loose = _get_default_detector(0.5)
+        assert _get_default_detector(0.1) is not loose and loose.threshold == 0.5
+        other = []
+        thread = threading.Thread(target=lambda: other.append(_get_default_detector(0.5)))
+        thread.start()
+        thread.join()
+        assert other[0] is not loose
+        
+        logger.info("✓ Camera shift detection successful")
+        return True
+    except Exception as e:
+        logger.error(f"✗ Camera shift test failed: {e}")
+        return False
+
+def test_reference_bank():
+    """Test reference bank chọn reference theo luminance histogram"""
+    logger.info("Testing reference bank...")
+    try:
+        import numpy as np
+        from camera_shift_detection import ReferenceBank
+        
+        rng = np.random.default_rng(1)
+        day = cv2.GaussianBlur(rng.integers(0, 255, (480, 640), dtype=np.uint8), (5, 5), 0)
+        day = cv2.cvtColor(day, cv2.COLOR_GRAY2BGR)
+        night = (day * 0.3).astype(np.uint8)
+        
+        bank = ReferenceBank(bank_dir=None, threshold=0.1)
+        bank.detect(day, reference_frame=day)  # Khởi tạo bank từ reference frame
+        assert len(bank) == 1
+        
+        bank.add_reference(night)
+        assert bank.select(night)[0] == 1
+        assert bank.select(day)[0] == 0
+        
+        result = bank.detect(night)
+        assert result['reference_index'] == 1
+        assert not result['is_shifted']
+        
+        # View trôi nhưng vẫn khớp reference (chạng vạng): thêm reference sau refresh_checks lần check
+        from camera_shift_detection import ShiftMonitor
+        dusk = (day * 0.4).astype(np.uint8)
+        bank = ReferenceBank(bank_dir=None, threshold=0.1, refresh_checks=3)
+        monitor = ShiftMonitor(bank, check_interval=1.0)
+        for second in range(5):
+            monitor.update(dusk, float(second), reference_frame=day)
+        assert len(bank) == 2
+        
+        # Không căn chỉnh được (method 'none'): không bao giờ thêm reference,
+        # kể cả view tối đã bị lệch mà monitor không phát hiện được
+        dark = np.full_like(day, 5)
+        shifted_dark = (np.roll(day, (150, 300), axis=(0, 1)) * 0.04).astype(np.uint8)
+        for frame in (dark, shifted_dark):
+            bank = ReferenceBank(bank_dir=None, threshold=0.1, refresh_checks=3)
+            monitor = ShiftMonitor(bank, check_interval=1.0)
+            for second in range(5):
+                monitor.update(frame, float(second), reference_frame=day)
+            assert bank.detect(frame)['method'] == 'none'
+            assert len(bank) == 1
+        
+        # Mỗi camera (reference của người dùng / video nguồn) có thư mục bank riêng
+        from camera_shift_detection import reference_bank_dir
+        cam_a = reference_bank_dir('data/reference_frames', 'data/input/cam_a.mp4')
+        cam_b = reference_bank_dir('data/reference_frames', 'data/other/cam_a.mp4')
+        assert cam_a != cam_b and os.path.dirname(cam_a) == 'data/reference_frames'
+        assert cam_a == reference_bank_dir('data/reference_frames', 'data/input/cam_a.mp4')
+        assert reference_bank_dir(None, 'data/input/cam_a.mp4') is None
+        
+        # Loại reference chỉ xóa file do bank ghi; reference của người dùng luôn được giữ
+        import tempfile
+        with tempfile.TemporaryDirectory() as bank_dir:
+            user_file = os.path.join(bank_dir, 'my_reference.jpg')
+            cv2.imwrite(user_file, night)
+            bank = ReferenceBank(bank_dir=bank_dir, threshold=0.1, max_references=2)
+            bank.detect(day, reference_frame=day)
+            assert len(bank) == 2  # File đã có + reference của người dùng
+            
+            bank.add_reference(dark)
+            assert os.path.exists(user_file)
+            owned = [entry['path'] for entry in bank.entries if entry['owned']]
+            bank.add_reference(night)
+            assert not os.path.exists(owned[0])
+            assert any(entry['pinned'] for entry in bank.entries)
+        
+        logger.info("✓ Reference bank successful")
+        return True
+    except Exception as e:
+        logger.error(f"✗ Reference bank test failed: {e}")
+        return False
+
+def test_shift_monitor():
+    """Test shift monitor: subsampling + hysteresis"""
+    logger.info("Testing shift monitor...")
+    try:
+        from camera_shift_detection import ShiftMonitor
+        
+        class FakeDetector:
+            """Detector giả: lệch trong khoảng 100s - 200s"""
+            def __init__(self):
+                self.calls = 0
+                self.time = 0.0
+            
+            def detect(self, frame, reference_frame=None):
+                self.calls += 1
+                shifted = 100.0 <= self.time < 200.0
+                return {'shift_x': 50.0 if shifted else 0.0, 'shift_y': 0.0,
+                        'rotation': 0.0, 'is_shifted': shifted, 'match_count': 10}
+        
+        detector = FakeDetector()
+        monitor = ShiftMonitor(detector, check_interval=5.0, confirm_checks=3, clear_checks=3)
+        
+        events = []
+        fps = 30.0
+        for i in range(int(300 * fps)):
+            detector.time = i / fps
+            event = monitor.update(None, detector.time)
+            if event is not None:
+                events.append(event)
+        
+        assert [e['event'] for e in events] == ['start', 'end']
+        assert 100.0 <= events[0]['time'] <= 105.0
+        assert 200.0 <= events[1]['time'] <= 205.0
+        assert detector.calls < 300 * fps / 20  # Subsampled
+        
+        logger.info("✓ Shift monitor successful")
+        return True
+    except Exception as e:
+        logger.error(f"✗ Shift monitor test failed: {e}")
+        return False
+
 def test_tracking():
     """Test vehicle tracking"""
     logger.info("Testing vehicle tracking...")
@@ -145,6 +634,316 @@ def test_tracking():
         logger.error(f"✗ Vehicle tracking test failed: {e}")
         return False
 
+def test_tracker_association():
+    """Test assignment tối ưu có gating"""
+    logger.info("Testing tracker association...")
+    try:
+        import numpy as np
+        from vehicle_tracking import associate
+        
+        # Greedy ghép cặp gần nhất (0, 0) trước và bỏ lỡ cặp (1, 0); tối ưu là (0, 1), (1, 0)
+        cost = np.array([[1.0, 2.0], [2.5, 100.0]])
+        rows, cols = associate(cost, max_cost=50.0, method='hungarian')
+        assert sorted(zip(rows.tolist(), cols.tolist())) == [(0, 1), (1, 0)]
+        rows, cols = associate(cost, max_cost=50.0, method='greedy')
+        assert list(zip(rows.tolist(), cols.tolist())) == [(0, 0)]
+        
+        # Gating: cặp vượt max_cost không được ghép
+        rows, cols = associate(np.array([[60.0]]), max_cost=50.0)
+        assert len(rows) == 0
+        assert len(associate(np.zeros((0, 3)), max_cost=50.0)[0]) == 0
+        
+        logger.info("✓ Tracker association successful")
+        return True
+    except Exception as e:
+        logger.error(f"✗ Tracker association test failed: {e}")
+        return False
+
+def test_tracker_prediction():
+    """Test tracker dự đoán vị trí ở các frame không detect (velocity + optical flow)"""
+    logger.info("Testing tracker prediction...")
+    try:
+        import numpy as np
+        from vehicle_tracking import VehicleTracker
+        
+        # Detect mỗi 3 frames, xe đi 3 pixels/frame
+        tracker = VehicleTracker()
+        tracker.update([{'bbox': [0, 0, 20, 20], 'class': 'car', 'confidence': 0.9}])
+        tracker.predict()
+        tracker.predict()
+        tracker.update([{'bbox': [9, 0, 29, 20], 'class': 'car', 'confidence': 0.9}])
+        predicted = tracker.predict()
+        assert len(predicted) == 1
+        assert 19.0 < predicted[0]['centroid'][0] < 23.0  # Kalman filter: tiếp tục đi sang phải
+        
+        # Optical flow: texture dịch 4 pixels sang phải
+        rng = np.random.default_rng(0)
+        texture = cv2.GaussianBlur(rng.integers(0, 255, (60, 60), dtype=np.uint8), (5, 5), 0)
+        frame1 = np.zeros((200, 200), dtype=np.uint8)
+        frame2 = np.zeros((200, 200), dtype=np.uint8)
+        frame1[70:130, 70:130] = texture
+        frame2[70:130, 74:134] = texture
+        
+        tracker = VehicleTracker(use_optical_flow=True)
+        tracker.update([{'bbox': [70, 70, 130, 130]}], frame1)
+        predicted = tracker.predict(frame2)
+        assert abs(predicted[0]['centroid'][0] - 104.0) < 1.0
+        assert abs(predicted[0]['centroid'][1] - 100.0) < 1.0
+        
+        logger.info("✓ Tracker prediction successful")
+        return True
+    except Exception as e:
+        logger.error(f"✗ Tracker prediction test failed: {e}")
+        return False
+
+def _fast_vehicle_counts(tracker, stride, frames=80):
+    """
+    Đếm xe qua line y = 300 với tracker detect mỗi stride frames (các frame giữa dùng predict())
+    
+    1 xe đi lên, 3 xe đi xuống; xe ở x = 500 chạy 25 pixels/frame (dài hơn box mỗi frame).
+    """
+    from counting import VehicleCounter
+    
+    vehicles = [(100, 520, -8, 0), (300, 80, 8, 0), (500, 60, 25, 5), (700, 80, 12, 10)]  # x, y0, v, frame bắt đầu
+    counter = VehicleCounter({'start': [0, 300], 'end': [1000, 300], 'direction': 'horizontal'})
+    result = None
+    for frame in range(frames):
+        if frame % stride:
+            tracked = tracker.predict()
+        else:
+            detections = []
+            for x, y0, velocity, start in vehicles:
+                y = y0 + velocity * (frame - start)
+                if frame >= start and -40 < y < 640:
+                    detections.append({'bbox': [x, y, x + 40, y + 30], 'confidence': 0.9, 'class': 'car'})
+            tracked = tracker.update(detections)
+        result = counter.count_vehicles(tracked)
+    return result['count_up'], result['count_down']
+
+def test_tracker_stride():
+    """Test simple tracker đếm đúng xe nhanh khi detect mỗi N frames (detection_stride)"""
+    logger.info("Testing tracker with detection stride...")
+    try:
+        from vehicle_tracking import VehicleTracker
+        
+        for stride in (1, 3, 5):
+            counts = _fast_vehicle_counts(VehicleTracker(), stride)
+            assert counts == (1, 3), f"stride {stride}: {counts}"
+            counts = _fast_vehicle_counts(VehicleTracker(spatial_grid=True), stride)
+            assert counts == (1, 3), f"stride {stride} (spatial grid): {counts}"
+        
+        logger.info("✓ Tracker with detection stride successful")
+        return True
+    except Exception as e:
+        logger.error(f"✗ Tracker stride test failed: {e}")
+        return False
+
+def test_kalman_filter():
+    """Test Kalman filter batch và tracker dùng vị trí dự đoán khi bỏ qua frames"""
+    logger.info("Testing Kalman filter...")
+    try:
+        import numpy as np
+        from kalman_filter import BatchKalmanFilter, xyxy_to_xyah, xyah_to_xyxy
+        from vehicle_tracking import VehicleTracker
+        
+        boxes = np.array([[0, 0, 40, 30], [100, 50, 180, 110], [300, 20, 310, 40]], dtype=np.float64)
+        assert np.allclose(xyah_to_xyxy(xyxy_to_xyah(boxes)), boxes)
+        
+        # Batch cho kết quả giống từng track riêng lẻ
+        kf = BatchKalmanFilter()
+        mean, covariance = kf.initiate(xyxy_to_xyah(boxes))
+        mean, covariance = kf.predict(mean, covariance)
+        measurements = xyxy_to_xyah(boxes + 5.0)
+        batch_mean, batch_cov = kf.update(mean, covariance, measurements)
+        for i in range(len(boxes)):
+            single_mean, single_cov = kf.update(mean[i:i + 1], covariance[i:i + 1], measurements[i:i + 1])
+            assert np.allclose(single_mean[0], batch_mean[i]) and np.allclose(single_cov[0], batch_cov[i])
+        
+        # Xe đi 45 pixels/frame, mất 2 frames (nhảy 135 pixels > max_distance) vẫn giữ ID
+        tracker = VehicleTracker(max_distance=50.0)
+        for frame_idx in range(8):
+            tracker.update([{'bbox': [45 * frame_idx, 0, 45 * frame_idx + 40, 30]}])
+        tracker.update([])
+        tracker.update([])
+        tracked = tracker.update([{'bbox': [450, 0, 490, 30]}])
+        assert [obj['track_id'] for obj in tracked] == [0]
+        
+        logger.info("✓ Kalman filter successful")
+        return True
+    except Exception as e:
+        logger.error(f"✗ Kalman filter test failed: {e}")
+        return False
+
+def test_track_store():
+    """Test track store: slots dùng lại qua free-list, ID không dùng lại, view đọc như dict"""
+    logger.info("Testing track store...")
+    try:
+        from vehicle_tracking import VehicleTracker
+        
+        tracker = VehicleTracker(max_disappeared=0, capacity=4)
+        
+        # Mỗi frame 3 xe mới thay 3 xe cũ: capacity giữ nguyên, track ID vẫn tăng
+        for frame_idx in range(50):
+            x = 1000 * (frame_idx % 2)
+            tracked = tracker.update([
+                {'bbox': [x, 100 * i, x + 40, 100 * i + 30], 'class': 'car', 'confidence': 0.8} for i in range(3)
+            ])
+        assert tracker.tracks.capacity == 4
+        assert len(tracker.tracks) == 3
+        assert tracked.track_ids.tolist() == [147, 148, 149]
+        
+        obj = tracked[0]
+        assert obj['centroid'] == (1020.0, 15.0) and obj['bbox'] == [1000.0, 0.0, 1040.0, 30.0]
+        assert dict(obj)['class'] == 'car' and obj.get('confidence') == 0.8
+        assert tracked.centroids.shape == (3, 2)
+        
+        # Vượt capacity thì store tăng kích thước, giữ tracks cũ
+        tracked = tracker.update([{'bbox': [1000 * i, 0, 1000 * i + 40, 30]} for i in range(6)])
+        assert tracker.tracks.capacity >= 6 and len(tracked) == 6
+        
+        logger.info("✓ Track store successful")
+        return True
+    except Exception as e:
+        logger.error(f"✗ Track store test failed: {e}")
+        return False
+
+def test_spatial_grid():
+    """Test spatial grid: không bỏ sót cặp nào trong bán kính, tracker cho kết quả như bản dense"""
+    logger.info("Testing spatial grid...")
+    try:
+        import numpy as np
+        from spatial_grid import candidate_pairs
+        from vehicle_tracking import VehicleTracker, associate, associate_sparse
+        
+        rng = np.random.default_rng(0)
+        points = rng.uniform(-200, 800, size=(300, 2))
+        centers = rng.uniform(-200, 800, size=(200, 2))
+        radii = rng.uniform(5, 120, size=200)
+        point_idx, center_idx = candidate_pairs(points, centers, radii, cell_size=50.0)
+        distance = np.linalg.norm(points[:, None] - centers[None], axis=2)
+        expected = set(zip(*np.nonzero(distance <= radii[None])))
+        found = set(zip(point_idx.tolist(), center_idx.tolist()))
+        assert expected <= found and len(found) == len(point_idx)  # Đủ cặp, không trùng
+        
+        # Vùng quá rộng cho bảng bucket → sort theo key của ô, cùng tập cặp
+        import spatial_grid
+        max_cells = spatial_grid.MAX_DENSE_CELLS
+        spatial_grid.MAX_DENSE_CELLS = 0
+        try:
+            fallback = candidate_pairs(points, centers, radii, cell_size=50.0)
+        finally:
+            spatial_grid.MAX_DENSE_CELLS = max_cells
+        assert set(zip(fallback[0].tolist(), fallback[1].tolist())) == found
+        
+        # Hungarian theo thành phần liên thông = Hungarian trên cả ma trận
+        cost = np.where(distance <= radii[None], distance, np.inf)
+        rows, cols = np.nonzero(np.isfinite(cost))
+        dense = associate(cost, np.inf)
+        sparse = associate_sparse(rows, cols, cost[rows, cols], cost.shape)
+        assert np.isclose(cost[dense].sum(), cost[sparse].sum()) and len(dense[0]) == len(sparse[0])
+        
+        detections = [
+            [{'bbox': [x + 5 * t, y, x + 5 * t + 30, y + 20]} for x, y in points[:150]] for t in range(5)
+        ]
+        results = []
+        for spatial_grid in (False, True):
+            tracker = VehicleTracker(spatial_grid=spatial_grid)
+            results.append([tracker.update(frame).track_ids.tolist() for frame in detections])
+        assert results[0] == results[1]
+        
+        logger.info("✓ Spatial grid successful")
+        return True
+    except Exception as e:
+        logger.error(f"✗ Spatial grid test failed: {e}")
+        return False
+
+def test_trajectories():
+    """Test ring buffer trajectory của track và lưu/đọc trajectory dạng binary trong DB"""
+    logger.info("Testing trajectories...")
+    try:
+        import tempfile
+        import numpy as np
+        from vehicle_tracking import VehicleTracker
+        from storage import initialize_database, save_trajectories, load_trajectories
+        
+        # Ring buffer chỉ giữ 4 điểm gần nhất
+        tracker = VehicleTracker(max_disappeared=1, history_size=4)
+        for frame_idx in range(10):
+            x = 10 * frame_idx
+            tracker.update([{'bbox': [x, 0, x + 40, 30], 'class': 'truck'}], frame_number=100 + frame_idx)
+        assert tracker.pop_finished_trajectories() == []
+        
+        tracker.update([], frame_number=110)
+        tracker.update([], frame_number=111)  # Mất quá max_disappeared frames → kết thúc track
+        trajectories = tracker.pop_finished_trajectories()
+        assert len(trajectories) == 1
+        trajectory = trajectories[0]
+        assert trajectory['frames'].tolist() == [106, 107, 108, 109]
+        assert trajectory['centroids'][:, 0].tolist() == [80.0, 90.0, 100.0, 110.0]
+        
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db_path = str(Path(tmp_dir) / 'test.db')
+            initialize_database(db_path)
+            save_trajectories(db_path, trajectories, video_path='video.mp4')
+            loaded = load_trajectories(db_path, 'video.mp4')
+            assert len(loaded) == 1 and loaded[0]['class'] == 'truck'
+            assert loaded[0]['frames'].tolist() == [106, 107, 108, 109]
+            assert np.allclose(loaded[0]['boxes'], trajectory['boxes'])
+        
+        logger.info("✓ Trajectories successful")
+        return True
+    except Exception as e:
+        logger.error(f"✗ Trajectories test failed: {e}")
+        return False
+
+def test_bytetrack():
+    """Test ByteTrack: giữ track bằng detections confidence thấp và tìm lại track bị mất"""
+    logger.info("Testing ByteTrack...")
+    try:
+        from vehicle_tracking import ByteTracker, create_tracker
+        
+        def car(x, confidence=0.9):
+            return {'bbox': [x, 100, x + 40, 130], 'confidence': confidence, 'class': 'car'}
+        
+        tracker = ByteTracker()
+        tracked = tracker.update([car(0), car(300)])
+        assert [obj['track_id'] for obj in tracked] == [0, 1]
+        
+        # Xe bị che: confidence thấp vẫn giữ track, không tạo track mới
+        tracked = tracker.update([car(5, 0.3), car(305)])
+        assert sorted(obj['track_id'] for obj in tracked) == [0, 1]
+        
+        # Mất 2 frames (Kalman dự đoán tiếp) rồi tìm lại với cùng ID
+        tracker.update([car(310)])
+        tracker.update([car(315)])
+        tracked = tracker.update([car(20), car(320)])
+        assert sorted(obj['track_id'] for obj in tracked) == [0, 1]
+        assert tracker.next_id == 2
+        
+        # Detection confidence thấp không tạo track mới
+        assert all(obj['track_id'] < 2 for obj in tracker.update([car(25), car(325), car(600, 0.3)]))
+        assert tracker.next_id == 2
+        
+        predicted = tracker.predict()
+        assert len(predicted) == 2 and predicted[0]['centroid'][0] > 45.0
+        assert isinstance(create_tracker({'type': 'bytetrack'}), ByteTracker)
+        
+        # Lần update đầu tiên xác nhận track ngay, kể cả khi trước đó đã gọi predict()
+        tracker = ByteTracker()
+        tracker.predict()
+        assert [obj['track_id'] for obj in tracker.update([car(0)])] == [0]
+        
+        # Xe nhanh (box dịch hơn chiều dài box mỗi frame) vẫn được đếm khi detect mỗi N frames
+        for stride in (1, 3, 5):
+            counts = _fast_vehicle_counts(ByteTracker(), stride)
+            assert counts == (1, 3), f"stride {stride}: {counts}"
+        
+        logger.info("✓ ByteTrack successful")
+        return True
+    except Exception as e:
+        logger.error(f"✗ ByteTrack test failed: {e}")
+        return False
+
 def test_counting():
     """Test counting logic"""
     logger.info("Testing counting logic...")
@@ -165,6 +964,283 @@ def test_counting():
         logger.error(f"✗ Counting test failed: {e}")
         return False
 
+def test_line_crossing():
+    """Test segment_crossings bằng các tính chất trên dữ liệu ngẫu nhiên và đếm xe chạy nhanh"""
+    logger.info("Testing line crossing...")
+    try:
+        import numpy as np
+        from fractions import Fraction
+        from counting import VehicleCounter, segment_crossings
+        
+        def orient(a, b, c):
+            # Orientation chính xác (Fraction) làm chuẩn so sánh
+            a, b, c = [(Fraction(x), Fraction(y)) for x, y in (a, b, c)]
+            value = (b[0] - a[0]) * (c[1] - a[1]) - (b[1] - a[1]) * (c[0] - a[0])
+            return (value > 0) - (value < 0)
+        
+        rng = np.random.default_rng(42)
+        for _ in range(20):
+            start, end = rng.uniform(0, 100, size=(2, 2)).tolist()
+            prev, curr = rng.uniform(0, 100, size=(2, 500, 2))
+            signs = segment_crossings(prev, curr, start, end)
+            
+            # Giống kiểm tra giao nhau chính xác của từng cặp đoạn
+            for p, c, sign in zip(prev.tolist(), curr.tolist(), signs.tolist()):
+                side_p, side_c = orient(start, end, p), orient(start, end, c)
+                crossing = side_p * side_c < 0 and orient(p, c, start) * orient(p, c, end) < 0
+                assert sign == (side_c if crossing else 0)
+            
+            # Đảo chiều chuyển động → đảo dấu, đảo thứ tự line → đảo dấu
+            assert np.array_equal(segment_crossings(curr, prev, start, end), -signs)
+            assert np.array_equal(segment_crossings(prev, curr, end, start), -signs)
+        
+        # Trên lưới nguyên (điểm nằm đúng trên line): tổng dấu dọc một đường đi = thay đổi phía đầu → cuối,
+        # nên không có lần vượt nào bị đếm hai lần hoặc bị bỏ sót
+        for _ in range(50):
+            path = rng.integers(-3, 4, size=(30, 2)).astype(float)
+            signs = segment_crossings(path[:-1], path[1:], (-100.0, 0.0), (100.0, 0.0))
+            first, last = path[0, 1] > 0, path[-1, 1] > 0
+            assert signs.sum() == int(last) - int(first)
+        
+        # Xe nhảy qua line trong một frame vẫn được đếm, mỗi track một lần, chiều theo config
+        counter = VehicleCounter({'start': [400, 600], 'end': [400, 100], 'direction': 'vertical'})
+        counter.count_vehicles([{'track_id': 1, 'centroid': (300.0, 300.0)}, {'track_id': 2, 'centroid': (500.0, 300.0)}])
+        result = counter.count_vehicles([{'track_id': 1, 'centroid': (500.0, 300.0)}, {'track_id': 2, 'centroid': (300.0, 300.0)}])
+        assert (result['count_up'], result['count_down']) == (1, 1)
+        result = counter.count_vehicles([{'track_id': 1, 'centroid': (300.0, 300.0)}])
+        assert result['total'] == 2 and result['new_counts'] == []
+        
+        logger.info("✓ Line crossing successful")
+        return True
+    except Exception as e:
+        logger.error(f"✗ Line crossing test failed: {e}")
+        return False
+
+def test_counting_engine():
+    """Test CountingEngine: nhiều lines/zones, counters theo class/chiều và OD matrix"""
+    logger.info("Testing counting engine...")
+    try:
+        from counting import CountingEngine
+        
+        lines = [
+            {'name': 'middle', 'start': [150, 0], 'end': [150, 300], 'direction': 'vertical'},
+            {'name': 'south', 'start': [0, 250], 'end': [300, 250], 'direction': 'horizontal'}
+        ]
+        zones = [
+            {'name': 'west', 'points': [[0, 0], [100, 0], [100, 300], [0, 300]]},
+            {'name': 'east', 'points': [[200, 0], [300, 0], [300, 300], [200, 300]]}
+        ]
+        engine = CountingEngine(lines, zones, classes=['car', 'truck'])
+        
+        # Truck đi west → east, bus (class mới) đi east → west, car chỉ đi trong west rồi mất track
+        for x in range(10, 300, 30):
+            objects = [
+                {'track_id': 1, 'centroid': (float(x), 100.0), 'class': 'truck'},
+                {'track_id': 2, 'centroid': (290.0 - x, 200.0), 'class': 'bus'}
+            ]
+            if x < 100:
+                objects.append({'track_id': 3, 'centroid': (50.0, 200.0 + x), 'class': 'car'})
+            engine.update(objects)
+        
+        assert engine.classes == ['car', 'truck', 'bus']
+        middle = engine.line_counts[0]
+        assert middle[1].tolist() == [0, 1] and middle[2].tolist() == [1, 0]  # truck down (x tăng), bus up
+        assert engine.line_counts[1, 0].tolist() == [0, 1]  # car vượt line south, đi xuống
+        assert engine.od_counts[0, 1].tolist() == [0, 1, 0] and engine.od_counts[1, 0].tolist() == [0, 0, 1]
+        assert engine.zone_counts[1, 1].tolist() == [1, 0]  # truck vào east
+        
+        summary = engine.summary()
+        assert summary['od_matrix']['counts'] == [[0, 1], [1, 0]]
+        assert summary['lines']['middle']['bus'] == {'up': 1, 'down': 0}
+        
+        engine.reset()
+        assert engine.line_counts.sum() == 0 and engine.od_counts.sum() == 0
+        
+        logger.info("✓ Counting engine successful")
+        return True
+    except Exception as e:
+        logger.error(f"✗ Counting engine test failed: {e}")
+        return False
+
+def test_count_bins():
+    """Test CountBins: gom số xe theo bin thời gian, ghi mỗi bin một lần và summary từ DB"""
+    logger.info("Testing count bins...")
+    try:
+        import tempfile
+        from counting import CountBins
+        from storage import initialize_database, save_count_bins, get_counting_summary, delete_video_results
+        
+        bins = CountBins(60.0, lines=['main'], classes=['car', 'truck'])
+        rows = []
+        # 3 phút video ở 10 FPS, mỗi 10 giây có một xe vượt line
+        for frame in range(1800):
+            time = frame / 10.0
+            rows += bins.advance(time)
+            if frame % 100 == 0:
+                bins.add([{'direction': 'up' if frame % 200 == 0 else 'down', 'class': 'car'}], line='main')
+        assert len(rows) == 4  # 2 bins đã đóng × 2 classes
+        rows += bins.flush()
+        
+        assert [row['bin_start'] for row in rows] == [0.0, 0.0, 60.0, 60.0, 120.0, 120.0]
+        cars = [(row['count_up'], row['count_down']) for row in rows if row['class'] == 'car']
+        assert cars == [(3, 3), (3, 3), (3, 3)]
+        
+        # Bins bị bỏ qua (không có frame) vẫn được đóng với count = 0
+        assert bins.advance(30.0) == [] and len(bins.advance(200.0)) == 3 * 2
+        
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db_path = str(Path(tmp_dir) / 'test.db')
+            initialize_database(db_path)
+            save_count_bins(db_path, rows, video_path='video.mp4')
+            summary = get_counting_summary(db_path, 'video.mp4')
+            assert (summary['count_up'], summary['count_down'], summary['total']) == (9, 9, 18)
+            assert get_counting_summary(db_path, 'other.mp4')['total'] == 0
+            
+            # Xử lý lại video: kết quả cũ bị thay thế, không cộng dồn
+            save_count_bins(db_path, rows, video_path='other.mp4')
+            delete_video_results(db_path, 'video.mp4')
+            save_count_bins(db_path, rows, video_path='video.mp4')
+            assert get_counting_summary(db_path, 'video.mp4')['total'] == 18
+            assert get_counting_summary(db_path, 'other.mp4')['total'] == 18
+        
+        logger.info("✓ Count bins successful")
+        return True
+    except Exception as e:
+        logger.error(f"✗ Count bins test failed: {e}")
+        return False
+
+def test_speed_estimation():
+    """Test SpeedEstimator: tốc độ từ trajectory qua homography mặt đường, robust với điểm sai"""
+    logger.info("Testing speed estimation...")
+    try:
+        import numpy as np
+        from speed_estimation import SpeedEstimator, SpeedBins, transform_points
+        
+        calibration = {
+            'image_points': [[500, 400], [700, 400], [900, 700], [300, 700]],
+            'world_points': [[0, 0], [3.5, 0], [3.5, 20], [0, 20]],
+            'lanes': [
+                {'name': 'left', 'points': [[0, 0], [640, 0], [640, 720], [0, 720]]},
+                {'name': 'right', 'points': [[640, 0], [1280, 0], [1280, 720], [640, 720]]}
+            ]
+        }
+        estimator = SpeedEstimator.from_config(calibration)
+        ground_to_image = np.linalg.inv(estimator.homography)
+        
+        # Xe chạy thẳng đều 54 km/h (15 m/s) ở 30 FPS dọc theo mặt đường, có nhiễu và vài điểm sai lớn
+        rng = np.random.default_rng(0)
+        trajectories = []
+        for track_id, lane_x in ((1, 0.5), (2, 3.0)):
+            times = np.arange(40) / 30.0
+            ground = np.column_stack((np.full(40, lane_x), 15.0 * times))
+            points = transform_points(ground, ground_to_image) + rng.normal(0, 0.5, (40, 2))
+            points[[5, 20, 33]] += 40.0
+            boxes = np.column_stack((points[:, 0] - 20, points[:, 1] - 30, points[:, 0] + 20, points[:, 1]))
+            trajectories.append({'track_id': track_id, 'class': 'car', 'frames': np.arange(40) + 300, 'boxes': boxes})
+        trajectories.append({'track_id': 3, 'class': 'car', 'frames': np.arange(3), 'boxes': np.zeros((3, 4))})
+        
+        speeds = estimator.estimate(trajectories, fps=30.0)
+        assert [result['track_id'] for result in speeds] == [1, 2]  # Trajectory quá ngắn bị bỏ qua
+        assert [result['lane'] for result in speeds] == ['left', 'right']
+        assert all(abs(result['speed'] - 54.0) < 1.0 for result in speeds)
+        
+        bins = SpeedBins(300.0, lanes=estimator.lane_names, classes=['car'])
+        bins.advance(12.0)
+        bins.add(speeds)
+        rows = bins.flush()
+        assert [(row['lane'], row['num_tracks']) for row in rows] == [('left', 1), ('right', 1)]
+        assert abs(rows[0]['avg_speed'] - speeds[0]['speed']) < 1e-9
+        
+        logger.info("✓ Speed estimation successful")
+        return True
+    except Exception as e:
+        logger.error(f"✗ Speed estimation test failed: {e}")
+        return False
+
+def test_pipeline_rerun():
+    """Test chạy lại process_video trên cùng video: đọc detections từ cache và ra cùng count bins"""
+    logger.info("Testing pipeline re-run...")
+    cwd = os.getcwd()
+    try:
+        import json
+        import shutil
+        import sqlite3
+        import tempfile
+        import importlib.util
+        import numpy as np
+        
+        if shutil.which('ffmpeg') is None or importlib.util.find_spec('ultralytics') is None:
+            logger.warning("ffmpeg or ultralytics not installed, skipping pipeline re-run test")
+            return None
+        
+        from main import SystemKPipeline
+        from db_connection import close_all_connections
+        
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            # Pipeline ghi data/, results/ theo đường dẫn tương đối
+            os.chdir(tmp_dir)
+            
+            # Clip 310 giây ở 2 FPS (segment_video bỏ qua 5 phút đầu), một xe đi ngang qua line
+            video_path = str(Path(tmp_dir) / 'clip.mp4')
+            writer = cv2.VideoWriter(video_path, cv2.VideoWriter_fourcc(*'mp4v'), 2.0, (320, 240))
+            rng = np.random.default_rng(0)
+            background = rng.integers(60, 120, (240, 320, 3), dtype=np.uint8)
+            for frame_idx in range(620):
+                frame = background.copy()
+                y = 200 - (frame_idx % 20) * 8
+                cv2.rectangle(frame, (140, y), (180, y + 30), (40, 40, 200), -1)
+                writer.write(frame)
+            writer.release()
+            
+            config = {
+                'roi': {'type': 'polygon', 'points': [[0, 0], [319, 0], [319, 239], [0, 239]]},
+                'counting_line': {'type': 'line', 'start': [0, 120], 'end': [319, 120]},
+                'vehicle_classes': ['car', 'truck', 'bus', 'motorcycle'],
+                'detector': {'model_path': str(project_root / 'yolov8n.pt')},
+                'camera_shift': {'reference_bank_dir': None}
+            }
+            config_path = str(Path(tmp_dir) / 'config.json')
+            with open(config_path, 'w') as f:
+                json.dump(config, f)
+            
+            db_path = str(Path(tmp_dir) / 'test.db')
+            pipeline = SystemKPipeline(config_path, db_path, detection_cache_dir=str(Path(tmp_dir) / 'cache'))
+            
+            def run_bins():
+                # Count bins ghi bởi lần chạy vừa xong
+                conn = sqlite3.connect(db_path)
+                last_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM count_bins').fetchone()[0]
+                conn.close()
+                pipeline.process_video(video_path, segment_duration=60)
+                conn = sqlite3.connect(db_path)
+                rows = conn.execute(
+                    'SELECT bin_start, line, class, count_up, count_down FROM count_bins '
+                    'WHERE id > ? ORDER BY bin_start, line, class', (last_id,)
+                ).fetchall()
+                conn.close()
+                return rows
+            
+            first = run_bins()
+            assert pipeline.detection_cache.misses > 0
+            second = run_bins()
+            assert pipeline.detection_cache.hits > 0 and pipeline.detection_cache.misses == 0
+            assert first and second == first
+            conn = sqlite3.connect(db_path)
+            assert conn.execute('SELECT COUNT(*) FROM count_bins').fetchone()[0] == len(second)
+            conn.close()
+            
+            pipeline.detector.close()
+            close_all_connections()
+            os.chdir(cwd)
+        
+        logger.info("✓ Pipeline re-run successful")
+        return True
+    except Exception as e:
+        logger.error(f"✗ Pipeline re-run test failed: {e}")
+        return False
+    finally:
+        os.chdir(cwd)
+
 def main():
     """Run all tests"""
     logger.info("=" * 50)
@@ -175,10 +1251,34 @@ def main():
         ("Imports", test_imports),
         ("Config", test_config),
         ("Database", test_database),
+        ("DB Connection", test_db_connection),
         ("Vehicle Detector", test_vehicle_detector),
+        ("Model Registry", test_model_registry),
+        ("Detection Arrays", test_detection_arrays),
+        ("Detection Cache", test_detection_cache),
+        ("Sliced Inference", test_sliced_inference),
+        ("Backend Parity", test_backend_parity),
+        ("Inference Worker", test_inference_worker),
         ("ROI Processing", test_roi_processing),
+        ("ROI Warp", test_roi_warp),
+        ("Camera Shift", test_camera_shift),
+        ("Reference Bank", test_reference_bank),
+        ("Shift Monitor", test_shift_monitor),
         ("Tracking", test_tracking),
+        ("Tracker Association", test_tracker_association),
+        ("Tracker Prediction", test_tracker_prediction),
+        ("Tracker Stride", test_tracker_stride),
+        ("Kalman Filter", test_kalman_filter),
+        ("Track Store", test_track_store),
+        ("Spatial Grid", test_spatial_grid),
+        ("Trajectories", test_trajectories),
+        ("ByteTrack", test_bytetrack),
         ("Counting", test_counting),
+        ("Line Crossing", test_line_crossing),
+        ("Counting Engine", test_counting_engine),
+        ("Count Bins", test_count_bins),
+        ("Speed Estimation", test_speed_estimation),
+        ("Pipeline Re-run", test_pipeline_rerun),
     ]
     
     results = []
@@ -193,15 +1293,17 @@ def main():
     logger.info("Test Summary")
     logger.info("=" * 50)
     
+    # Test trả về None = bị skip (thiếu dependency/dữ liệu), không tính là pass hay fail
+    skipped = sum(1 for _, result in results if result is None)
     passed = sum(1 for _, result in results if result)
-    total = len(results)
+    total = len(results) - skipped
     
     for test_name, result in results:
-        status = "✓ PASS" if result else "✗ FAIL"
+        status = "- SKIP" if result is None else "✓ PASS" if result else "✗ FAIL"
         logger.info(f"{status}: {test_name}")
     
     logger.info("")
-    logger.info(f"Total: {passed}/{total} tests passed")
+    logger.info(f"Total: {passed}/{total} tests passed" + (f", {skipped} skipped" if skipped else ""))
     
     if passed == total:
         logger.info("All tests passed! ✓")
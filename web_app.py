@@ -23,7 +23,9 @@ from utils import setup_logging, load_config, create_directories, get_timestamp
 from video_segmentation import segment_video, get_video_duration
 from image_extraction import extract_frames, extract_frames_by_time_interval
 from duplicate_detection import check_duplicate, save_image_hash, initialize_database as init_hash_db
-from camera_shift_detection import detect_camera_shift, save_reference_frame, load_reference_frame
+from camera_shift_detection import (
+    ReferenceBank, ShiftMonitor, reference_bank_dir, save_reference_frame, load_reference_frame
+)
 from memo_system import (
     initialize_memo_database, save_duplicate_memo, save_camera_shift_memo,
     get_duplicate_segments, get_camera_shift_points
@@ -203,7 +205,13 @@ def process_video_thread(video_path, segment_duration, save_frames_interval=None
             
             processing_status['current_step'] = 'Creating YOLO detector...'
             
-            detector = create_detector_safe(model_path='yolov8n.pt', conf_threshold=0.25, timeout=30)
+            detector_config = dict(config.get('detector', {}))
+            detector = create_detector_safe(
+                model_path=detector_config.pop('model_path', 'yolov8n.pt'),
+                conf_threshold=detector_config.pop('conf_threshold', 0.25),
+                timeout=30,
+                **detector_config
+            )
             
             if detector is None:
                 raise RuntimeError("VehicleDetector không thể tạo (timeout hoặc system error)")
@@ -241,6 +249,11 @@ def process_video_thread(video_path, segment_duration, save_frames_interval=None
         memo_db_path = 'data/database/memo.db'
         initialize_memo_database(memo_db_path)
         
+        # Camera shift detection: bank reference frames (ngày/đêm) với features cache, riêng cho video nguồn
+        # Monitor check mỗi 5s video, chỉ lưu event khi shift bắt đầu/kết thúc
+        reference_bank = ReferenceBank(reference_bank_dir('data/reference_frames', video_path), threshold=0.1)
+        shift_monitor = ShiftMonitor(reference_bank, check_interval=5.0)
+        
         # Step 1: Kiểm tra độ dài video và segment (nếu video dài hơn 5 phút)
         video_duration = get_video_duration(video_path)
         logger.info(f"Video duration: {video_duration:.2f} seconds ({video_duration/60:.2f} minutes)")
@@ -374,27 +387,35 @@ def process_video_thread(video_path, segment_duration, save_frames_interval=None
                     logger.info(f"Duplicate detected at {frame_time:.2f}s, but will still save processed image")
                     # KHÔNG continue - vẫn tiếp tục để lưu ảnh (mục đích chính)
                 
-                # Check camera shift và lưu memo
+                # Check camera shift và lưu memo (chỉ khi shift bắt đầu/kết thúc)
                 if reference_frame is not None:
-                    shift_result = detect_camera_shift(frame, reference_frame, threshold=0.1)
-                    if shift_result['is_shifted']:
-                        warning = f"Camera shift: shift_x={shift_result['shift_x']:.2f}, shift_y={shift_result['shift_y']:.2f}"
+                    shift_event = shift_monitor.update(frame, frame_time, reference_frame)
+                    if shift_event is not None:
+                        shift_result = shift_event['result']
+                        is_start = shift_event['event'] == 'start'
+                        warning = (
+                            f"Camera shift {'started' if is_start else 'ended'}: "
+                            f"shift_x={shift_result['shift_x']:.2f}, shift_y={shift_result['shift_y']:.2f}"
+                        )
                         save_camera_shift(
                             db_path, frame_path,
                             shift_result['shift_x'], shift_result['shift_y'],
-                            shift_result['rotation'], True, warning
-                        )
-                        # Lưu memo về camera shift
-                        save_camera_shift_memo(
-                            memo_db_path,
-                            video_path,
-                            shift_time=frame_time,
-                            shift_x=shift_result['shift_x'],
-                            shift_y=shift_result['shift_y'],
-                            rotation=shift_result['rotation'],
-                            description=warning
+                            shift_result['rotation'], is_start, warning
                         )
-                        logger.warning(f"Camera shift detected at {frame_time:.2f}s, saved to memo")
+                        if is_start:
+                            # Memo ghi điểm camera bắt đầu lệch (một memo cho mỗi lần lệch)
+                            save_camera_shift_memo(
+                                memo_db_path,
+                                video_path,
+                                shift_time=shift_event['time'],
+                                shift_x=shift_result['shift_x'],
+                                shift_y=shift_result['shift_y'],
+                                rotation=shift_result['rotation'],
+                                description=warning
+                            )
+                            logger.warning(f"{warning} at {shift_event['time']:.2f}s, saved to memo")
+                        else:
+                            logger.warning(f"{warning} at {shift_event['time']:.2f}s")
                 
                 # LƯU ẢNH ĐÃ XỬ LÝ (mục đích chính của tool)
                 processed_dir = "data/processed_images"